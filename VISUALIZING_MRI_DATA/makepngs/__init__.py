@@ -0,0 +1,6 @@
+'''
+Shared code for the MakePngs_* scripts in VISUALIZING_MRI_DATA
+
+The scripts import the modules in here directly, eg:
+    from makepngs import compositor
+'''
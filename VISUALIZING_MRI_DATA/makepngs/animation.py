@@ -0,0 +1,327 @@
+'''
+Animated sweeps through the slices of each axis (APNG or GIF)
+
+Rather than flicking through hundreds of pngs in an image viewer, each
+axis can be saved as one animation that plays every slice in turn.
+
+The frames are added one at a time, as soon as each slice has been
+drawn, so the slices never have to be kept in memory or read back from
+disk:
+  * every frame is matched to one global palette (eg: from
+    encoder.palette_from_luts) through a lookup table, so there's one
+    color table for the whole animation
+  * only the rectangle of pixels that changed since the last frame is
+    saved, and the pixels inside it that didn't change are made
+    transparent so that the last frame shows through (and compresses
+    to almost nothing)
+
+APNG frames are zlib compressed like any png. The number of frames
+isn't known until the end so it is filled in when the file is closed.
+GIFs have no partial transparency, so transparent pixels are drawn
+over black.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+
+from makepngs import compositor
+from makepngs import container
+from makepngs import encoder
+
+#==============================================================================
+# The file extension for each animation format
+EXTENSIONS = { 'apng': '.apng', 'gif': '.gif' }
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def animation_name(output_dir, axis_name, animation_format):
+    '''
+    The animation file for one axis. It doesn't start with the axis
+    name so that it isn't mistaken for a slice (eg: by CombiningPngs.py)
+    '''
+    return os.path.join(output_dir, 'sweep_{}{}'.format(axis_name, EXTENSIONS[animation_format]))
+
+def changed_box(indices, last):
+    '''
+    The (row, column, rows, columns) box around every pixel that is
+    different from the last frame, the whole frame if there isn't one
+    and a single pixel if nothing changed
+    '''
+    if last is None:
+        return (0, 0) + indices.shape
+
+    changed = indices != last
+    rows = np.nonzero(changed.any(axis=1))[0]
+    if len(rows) == 0:
+        return (0, 0, 1, 1)
+    columns = np.nonzero(changed.any(axis=0))[0]
+
+    return (int(rows[0]), int(columns[0]),
+                int(rows[-1] - rows[0] + 1), int(columns[-1] - columns[0] + 1))
+
+def lzw_compress(indices, min_code_size=8):
+    '''
+    GIF flavoured LZW compression of a sequence of 8 bit indices
+    '''
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+
+    out = bytearray()
+    bits = [ 0, 0 ]           # the bit buffer and the number of bits in it
+
+    def emit(code, code_size):
+        bits[0] |= code << bits[1]
+        bits[1] += code_size
+        while bits[1] >= 8:
+            out.append(bits[0] & 0xff)
+            bits[0] >>= 8
+            bits[1] -= 8
+
+    data = bytearray(indices)
+
+    table = {}
+    next_code = end_code + 1
+    code_size = min_code_size + 1
+    emit(clear_code, code_size)
+
+    prefix = data[0]
+    for index in data[1:]:
+        key = (prefix << 8) | index
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        emit(prefix, code_size)
+
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            # The decoder adds each code one step later, so the code
+            # size goes up once the code after the limit is in use
+            if next_code > (1 << code_size) and code_size < 12:
+                code_size += 1
+        else:
+            emit(clear_code, code_size)
+            table = {}
+            next_code = end_code + 1
+            code_size = min_code_size + 1
+
+        prefix = index
+
+    emit(prefix, code_size)
+    if next_code == (1 << code_size) and code_size < 12:
+        code_size += 1
+    emit(end_code, code_size)
+    if bits[1]:
+        out.append(bits[0] & 0xff)
+
+    return bytes(out)
+
+class SweepWriter(object):
+    '''
+    Write an animation one frame at a time
+
+    fname           the animation file
+    palette         (n, 4) uint8 RGBA palette for every frame (n <= 256)
+                    it must have a transparent color
+    animation_format
+                    'apng' or 'gif'
+    fps             frames per second
+    compress_level  zlib compression level (apng only)
+    table           encoder.color_table of the palette (it's made here
+                    if it isn't given)
+    '''
+    def __init__(self, fname, palette, animation_format='apng', fps=10, compress_level=6,
+                    table=None):
+        self.fname = fname
+        self.animation_format = animation_format
+        self.fps = fps
+        self.compress_level = compress_level
+        self.n_frames = 0
+
+        self.palette = np.zeros((256, 4), dtype=np.uint8)
+        self.palette[:len(palette)] = palette
+        self.transparent = int(np.argmin(self.palette[:len(palette), 3]))
+
+        self._table = table
+        if table is None:
+            self._table = encoder.color_table(self.palette)
+
+        self._last = None
+        self._file = open(fname, 'wb')
+
+    def add(self, rgba):
+        '''
+        Add an (h, w, 4) uint8 RGBA frame. Every frame must be the same
+        size as the first one.
+        '''
+        if self.animation_format == 'gif':
+            # Draw transparent pixels over black (so none of them are
+            # matched to the transparent color)
+            alpha = rgba[..., 3:].astype(np.uint16)
+            rgba = rgba.copy()
+            rgba[..., :3] = rgba[..., :3] * alpha // 255
+            rgba[..., 3] = 255
+
+        indices = encoder.lookup(rgba, self._table, self.palette)
+
+        if self._last is not None and indices.shape != self._last.shape:
+            raise ValueError('Frame shape {} does not match the first frame {}'.format(
+                                indices.shape, self._last.shape))
+
+        row, column, rows, columns = changed_box(indices, self._last)
+        frame = indices[row : row + rows, column : column + columns].copy()
+
+        # Let the last frame show through wherever nothing changed, as
+        # long as none of the new pixels are transparent themselves
+        blend = False
+        if self._last is not None:
+            unchanged = frame == self._last[row : row + rows, column : column + columns]
+            if self.animation_format == 'gif' or np.all(self.palette[frame[~unchanged], 3] == 255):
+                frame[unchanged] = self.transparent
+                blend = True
+
+        if self.n_frames == 0:
+            self._write_header(indices.shape)
+
+        if self.animation_format == 'gif':
+            self._write_gif_frame(frame, row, column, blend)
+        else:
+            self._write_apng_frame(frame, row, column, blend)
+
+        self._last = indices
+        self.n_frames += 1
+
+    def _write_header(self, shape):
+        h, w = shape
+
+        if self.animation_format == 'gif':
+            # Screen size, a 256 color global color table, then loop forever
+            self._file.write(b'GIF89a' + struct.pack('<HHBBB', w, h, 0xf7, 0, 0))
+            self._file.write(self.palette[:, :3].tobytes())
+            self._file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+            return
+
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._file.write(compositor._png_chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 3, 0, 0, 0)))
+
+        # The number of frames is filled in by close()
+        self._actl_position = self._file.tell()
+        self._file.write(compositor._png_chunk(b'acTL', struct.pack('>II', 0, 0)))
+
+        self._file.write(compositor._png_chunk(b'PLTE', self.palette[:, :3].tobytes()))
+        last = np.nonzero(self.palette[:, 3] != 255)[0][-1]
+        self._file.write(compositor._png_chunk(b'tRNS', self.palette[:last + 1, 3].tobytes()))
+        self._sequence = 0
+
+    def _write_apng_frame(self, frame, row, column, blend):
+        rows, columns = frame.shape
+
+        # Every row starts with a 0 byte (no filter)
+        raw = np.zeros((rows, columns + 1), dtype=np.uint8)
+        raw[:, 1:] = frame
+        data = zlib.compress(raw.tobytes(), self.compress_level)
+
+        # Frame control: size, offset, delay, dispose none, blend over or source
+        self._file.write(compositor._png_chunk(b'fcTL',
+                                struct.pack('>IIIIIHHBB', self._sequence, columns, rows,
+                                            column, row, 1, self.fps, 0, int(blend))))
+        self._sequence += 1
+
+        if self.n_frames == 0:
+            self._file.write(compositor._png_chunk(b'IDAT', data))
+        else:
+            self._file.write(compositor._png_chunk(b'fdAT', struct.pack('>I', self._sequence) + data))
+            self._sequence += 1
+
+    def _write_gif_frame(self, frame, row, column, blend):
+        rows, columns = frame.shape
+
+        # Graphic control: leave the frame in place, the delay (in
+        # hundredths of a second) and the transparent index
+        self._file.write(struct.pack('<BBBBHBB', 0x21, 0xf9, 4, (1 << 2) | int(blend),
+                                        int(round(100. / self.fps)), self.transparent, 0))
+
+        # Image descriptor (no local color table) and the LZW data in
+        # blocks of up to 255 bytes
+        self._file.write(struct.pack('<BHHHHB', 0x2c, column, row, columns, rows, 0))
+        self._file.write(b'\x08')
+        data = lzw_compress(frame.tobytes())
+        for start in range(0, len(data), 255):
+            block = data[start : start + 255]
+            self._file.write(struct.pack('<B', len(block)) + block)
+        self._file.write(b'\x00')
+
+    def close(self):
+        '''
+        Finish the file (and fill in the number of frames)
+        '''
+        if self._file is None:
+            return
+
+        if self.n_frames > 0:
+            if self.animation_format == 'gif':
+                self._file.write(b'\x3b')
+            else:
+                self._file.write(compositor._png_chunk(b'IEND', b''))
+                self._file.seek(self._actl_position)
+                self._file.write(compositor._png_chunk(b'acTL', struct.pack('>II', self.n_frames, 0)))
+
+        self._file.close()
+        self._file = None
+
+        if self.n_frames == 0:
+            os.remove(self.fname)
+
+class SweepSet(object):
+    '''
+    One SweepWriter for each axis in each output directory
+
+    Slices are sent to the right animation by their png name
+    (eg: output_dir/axial_slice_0012_+020.png), anything else (eg:
+    montage strips) is left out.
+    '''
+    def __init__(self, palette, animation_format='apng', fps=10, compress_level=6):
+        self.palette = palette
+        self.animation_format = animation_format
+        self.fps = fps
+        self.compress_level = compress_level
+        self.sweeps = {}
+        self._table = None
+        self._lock = threading.Lock()
+
+    def add(self, fname, rgba):
+        '''
+        Add a slice to the animation for its axis and output directory
+        '''
+        axis_name = container.slice_info(fname)['axis']
+        if axis_name is None:
+            return
+
+        output_dir = os.path.dirname(fname)
+        with self._lock:
+            # Every animation shares one lookup table
+            if self._table is None:
+                self._table = encoder.color_table(self.palette)
+
+            if not (output_dir, axis_name) in self.sweeps:
+                self.sweeps[(output_dir, axis_name)] = SweepWriter(
+                                            animation_name(output_dir, axis_name, self.animation_format),
+                                            self.palette,
+                                            animation_format=self.animation_format,
+                                            fps=self.fps,
+                                            compress_level=self.compress_level,
+                                            table=self._table)
+            self.sweeps[(output_dir, axis_name)].add(rgba)
+
+    def close(self):
+        with self._lock:
+            for sweep in self.sweeps.values():
+                sweep.close()
+            self.sweeps = {}
@@ -0,0 +1,125 @@
+'''
+Compare the time and memory used by the old crop_data function from the
+MakePngs_* scripts with makepngs.cropping.crop_data
+
+Run it from the VISUALIZING_MRI_DATA directory:
+    python -m makepngs.bench_crop
+
+Every measurement is made in a forked child process so that the peak
+memory (ru_maxrss) of one function can't hide the peak of another.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import os
+import pickle
+import resource
+import time
+import numpy as np
+
+from makepngs import cropping
+
+#==============================================================================
+# Standard space volume sizes (MNI152 at 2mm, 1mm and 0.5mm)
+SHAPES = { '2mm': (91, 109, 91),
+           '1mm': (182, 218, 182),
+           '0.5mm': (364, 436, 364) }
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def old_crop_data(bg, stats):
+    '''
+    The crop_data function as it was in MakePngs_StatsBg_StandardSpace.py
+    '''
+    slices_list_x = list(np.argwhere(np.sum(bg, (1,2)) != 0)[:,0])
+    slices_list_y = list(np.argwhere(np.sum(bg, (0,2)) != 0)[:,0])
+    slices_list_z = list(np.argwhere(np.sum(bg, (0,1)) != 0)[:,0])
+
+    slices_list = [slices_list_x, slices_list_y, slices_list_z]
+
+    bg_cropped = np.copy(bg)
+    stats_cropped = np.copy(stats)
+
+    bg_cropped = bg_cropped[ slices_list_x, :, : ]
+    stats_cropped = stats_cropped[ slices_list_x, :, : ]
+
+    bg_cropped = bg_cropped[ :, slices_list_y, : ]
+    stats_cropped = stats_cropped[ :, slices_list_y, : ]
+
+    bg_cropped = bg_cropped[ :, :, slices_list_z ]
+    stats_cropped = stats_cropped[ :, :, slices_list_z ]
+
+    bg_cropped = np.pad(bg_cropped, 5, mode='constant')
+    stats_cropped = np.pad(stats_cropped, 5, mode='constant')
+
+    for i, sl in enumerate(slices_list):
+        sl = sl + [ n - 5 for n in sl ]
+        sl = sl + [ n + 5 for n in sl ]
+        slices_list[i] = sorted(list(set(sl)))
+
+    return bg_cropped, stats_cropped, slices_list
+
+def new_crop_data(bg, stats):
+    return cropping.crop_data(bg, stats, pad=5)
+
+def make_volumes(shape):
+    '''
+    A random float64 background with an empty border (about 10% of each
+    dimension) and a mostly empty stats volume. Everything is filled in
+    place so that no temporary copies inflate the peak memory.
+    '''
+    bg = np.random.random(shape)
+    for axis, n in enumerate(shape):
+        border = [ slice(None) ] * 3
+        border[axis] = slice(0, n // 10)
+        bg[tuple(border)] = 0
+        border[axis] = slice(n - n // 10, n)
+        bg[tuple(border)] = 0
+
+    stats = np.zeros(shape)
+    centre = tuple( slice(n // 2 - 5, n // 2 + 5) for n in shape )
+    stats[centre] = 1
+
+    return bg, stats
+
+def measure(func, shape, repeats=3):
+    '''
+    Run func on a fresh pair of volumes in a child process and return
+    the best time (seconds) and the increase in peak memory (MB)
+    '''
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_end)
+        bg, stats = make_volumes(shape)
+
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        times = []
+        for i in range(repeats):
+            start = time.time()
+            result = func(bg, stats)
+            times.append(time.time() - start)
+            del result
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        with os.fdopen(write_end, 'wb') as f:
+            pickle.dump((min(times), (after - before) / 1024.), f)
+        os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end, 'rb') as f:
+        result = pickle.load(f)
+    os.waitpid(pid, 0)
+
+    return result
+
+def main(sizes=('2mm', '1mm')):
+    print('{:<8}{:<10}{:>12}{:>16}'.format('size', 'function', 'time (ms)', 'peak mem (MB)'))
+    for size in sizes:
+        for name, func in [ ('old', old_crop_data), ('new', new_crop_data) ]:
+            seconds, memory = measure(func, SHAPES[size])
+            print('{:<8}{:<10}{:>12.1f}{:>16.1f}'.format(size, name, seconds * 1000, memory))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+'''
+Time each stage of the three MakePngs_* scripts on synthetic data
+
+Run it from the VISUALIZING_MRI_DATA directory:
+    python -m makepngs.bench_render
+    python -m makepngs.bench_render --sizes 2mm 1mm 0.5mm --output bench.json
+
+The background and stats volumes come from create_test_data in
+MakePngs_StatsBg_StandardSpace.py at the standard space sizes (2mm,
+1mm and 0.5mm) and are saved as nifti files. For every script, size
+and renderer the time spent in each stage is recorded separately:
+  load        the script's own load function(s)
+  crop        cropping the data to the background
+  rotate      rotate_data for all three axes
+  make_png    the whole png maker call for a sample of slices
+  savefig     the part of make_png spent writing the png file
+Times are the mean for one call (per axis for rotate, per slice for
+make_png and savefig).
+
+The functions of each script are imported from its module in the
+package (main isn't run). Every measurement is made in a forked child
+process and its peak memory (ru_maxrss) is recorded too. The results are written as json so that they can be
+compared between versions.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import argparse
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+from makepngs import cropping
+from makepngs import loading
+from makepngs import orientation
+from makepngs import pairs
+from makepngs import profiling
+from makepngs.writer import PngWriter
+from makepngs.bench_crop import SHAPES
+
+#==============================================================================
+# The scripts that can be timed, the voxel sizes of the test data and
+# the ways the pngs can be drawn
+SCRIPTS = { 'StatsBg': 'MakePngs_StatsBg_StandardSpace.py',
+            'DTI': 'MakePngs_DTI.py',
+            'HighRes': 'MakePngs_HighRes.py' }
+
+MODULES = { 'StatsBg': 'makepngs.statsbg',
+            'DTI': 'makepngs.dti',
+            'HighRes': 'makepngs.highres' }
+
+ZOOMS = { '2mm': 2., '1mm': 1., '0.5mm': 0.5 }
+
+RENDERERS = ('matplotlib', 'persistent', 'numpy')
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def load_script(script):
+    '''
+    Import the functions of one of the MakePngs_* scripts and return
+    its namespace (the globals that main would set can be added to it)
+    '''
+    import importlib
+
+    return vars(importlib.import_module(MODULES[script]))
+
+def parse_script_arguments(namespace, argv):
+    '''
+    Get the arguments (with all the script's defaults) that the
+    script would have for this command line
+    '''
+    old_argv = sys.argv
+    sys.argv = [ 'bench' ] + argv
+    try:
+        return namespace['setup_argparser']()
+    finally:
+        sys.argv = old_argv
+
+def write_test_data(size, data_dir):
+    '''
+    Save the create_test_data volumes for one size as nifti files
+    '''
+    import nibabel as nib
+
+    namespace = load_script('StatsBg')
+
+    np.random.seed(0)
+    bg, stats = namespace['create_test_data'](SHAPES[size])
+
+    fnames = []
+    for name, data in [ ('bg', bg), ('stats', stats) ]:
+        img = nib.Nifti1Image(data.astype(np.float32), np.diag([ZOOMS[size]] * 3 + [1]))
+        img.header.set_zooms((ZOOMS[size],) * 3)
+        fname = os.path.join(data_dir, '{}_{}.nii'.format(name, size))
+        nib.save(img, fname)
+        fnames.append(fname)
+
+    return fnames
+
+class Timers(object):
+    '''
+    Wrap the functions that write png files so that the time spent
+    in them can be measured on its own
+    '''
+    def __init__(self):
+        self.savefig = 0.
+        self._patched = []
+
+    def wrap(self, owner, name):
+        original = getattr(owner, name)
+        timers = self
+
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timers.savefig += time.time() - start
+
+        setattr(owner, name, timed)
+        self._patched.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+
+def sample(n, n_slices):
+    '''
+    n evenly spaced slice ids out of n_slices
+    '''
+    return sorted(set(np.linspace(0, n_slices - 1, min(n, n_slices)).astype(int)))
+
+def run_stage_timings(script, renderer, bg_file, stats_file, n_slices):
+    '''
+    Time the stages of one script with one renderer
+    '''
+    from makepngs import cli
+    from makepngs import compositor
+    from makepngs.slice_figure import SliceFigure
+
+    output_dir = tempfile.mkdtemp(prefix='bench_pngs_')
+    namespace = load_script(script)
+    arguments, parser = parse_script_arguments(namespace,
+                                [ bg_file, stats_file, output_dir, '-re', renderer ])
+    namespace['arguments'] = arguments
+    namespace['parser'] = parser
+    namespace['slice_figures'] = {}
+    namespace['profiler'] = profiling.Profiler(enabled=False)
+    namespace['png_writer'] = PngWriter(0)
+
+    timings = {}
+
+    # Load
+    start = time.time()
+    if script == 'StatsBg':
+        bg_img, bg, zooms = namespace['load_background'](arguments, parser)
+        stats = namespace['load_stats'](stats_file, bg_img, bg, parser)
+    elif script == 'DTI':
+        bg, stats, zooms = namespace['load_stack'](arguments, parser, arguments.overlay_files)
+        stats = stats[0]
+    else:
+        bg, stats, zooms = namespace['load_data'](arguments, parser)
+    timings['load'] = time.time() - start
+
+    # Crop
+    pad = { 'StatsBg': 5, 'DTI': 0, 'HighRes': 5 }[script]
+    start = time.time()
+    bg_cropped, stats_cropped, slices_list = cropping.crop_data(bg, stats, pad=pad)
+    timings['crop'] = time.time() - start
+
+    xyz_dict, shape = namespace['hardcoded_variables'](), bg.shape
+    if script == 'StatsBg':
+        xyz_dict, mni_func_list = xyz_dict
+    xyz_dict['shape'] = shape
+    xyz_dict['zooms'] = zooms
+    xyz_dict['orientation'] = orientation.standard_orientations()
+
+    outlines = {}
+    if script == 'StatsBg':
+        outlines = namespace['make_outlines'](bg_cropped, xyz_dict)
+    namespace['bg_outlines'] = outlines
+
+    # Rotate
+    rotate_data = namespace.get('rotate_data', pairs.rotate_data)
+    rotated = {}
+    start = time.time()
+    for axis_id, axis_name in enumerate(xyz_dict['name']):
+        rotated[axis_name] = rotate_data(bg_cropped,
+                                                        stats_cropped,
+                                                        list(slices_list),
+                                                        axis_name,
+                                                        shape[axis_id],
+                                                        xyz_dict['orientation'])
+    timings['rotate'] = (time.time() - start) / 3
+
+    # Make the pngs, and measure the time spent saving them
+    png_maker = { 'matplotlib': namespace['make_png'],
+                    'persistent': namespace['make_png_persistent'],
+                    'numpy': namespace['make_png_numpy'] }[renderer]
+
+    timers = Timers()
+    timers.wrap(cli.pyplot(), 'savefig')
+    timers.wrap(compositor, 'write_png')
+    timers.wrap(SliceFigure, 'save')
+
+    n_pngs = 0
+    start = time.time()
+    try:
+        for axis_id, axis_name in enumerate(xyz_dict['name']):
+            bg_rot, stats_rot, rot_slices_list = rotated[axis_name]
+
+            for slice_id in sample(n_slices, len(rot_slices_list[axis_id])):
+                bg_slice = cropping.padded_slice(bg_rot, slice_id, pad)
+                stats_slice = cropping.padded_slice(stats_rot, slice_id, pad)
+                png_name = '{}_slice_{:04.0f}.png'.format(axis_name, slice_id)
+
+                if script == 'StatsBg':
+                    png_maker(bg_slice, stats_slice, axis_name, 'X = 0', png_name, arguments,
+                                outline_slice=cropping.padded_slice(outlines[axis_name], slice_id, pad))
+                elif script == 'DTI':
+                    png_maker(bg_slice, [ stats_slice ], axis_name, png_name, arguments)
+                else:
+                    png_maker(bg_slice, stats_slice, axis_name, png_name, arguments)
+                n_pngs += 1
+    finally:
+        timers.restore()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    timings['make_png'] = (time.time() - start) / max(n_pngs, 1)
+    timings['savefig'] = timers.savefig / max(n_pngs, 1)
+    timings['n_pngs'] = n_pngs
+
+    return timings
+
+def measure(func, *args):
+    '''
+    Run func(*args) in a child process and return its result together
+    with the peak memory (MB) of the child
+    '''
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_end)
+        try:
+            result = (func(*args), loading.peak_memory_mb(), None)
+        except Exception as err:
+            result = (None, loading.peak_memory_mb(), repr(err))
+        with os.fdopen(write_end, 'wb') as f:
+            pickle.dump(result, f)
+        os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end, 'rb') as f:
+        result = pickle.load(f)
+    os.waitpid(pid, 0)
+
+    return result
+
+def setup_argparser():
+    parser = argparse.ArgumentParser(description='Time the stages of the MakePngs scripts')
+
+    parser.add_argument('--sizes',
+                            nargs='+',
+                            default=['2mm', '1mm'],
+                            choices=sorted(SHAPES.keys()),
+                            help='Standard space sizes to test. Default is 2mm 1mm')
+    parser.add_argument('--scripts',
+                            nargs='+',
+                            default=sorted(SCRIPTS.keys()),
+                            choices=sorted(SCRIPTS.keys()),
+                            help='Scripts to test. Default is all of them')
+    parser.add_argument('--renderers',
+                            nargs='+',
+                            default=list(RENDERERS),
+                            choices=RENDERERS,
+                            help='Renderers to test. Default is all of them')
+    parser.add_argument('--slices',
+                            type=int,
+                            default=5,
+                            help='Number of slices drawn for each axis. Default is 5')
+    parser.add_argument('--output',
+                            default='bench_render.json',
+                            help='Json file for the results. Default is bench_render.json')
+
+    return parser.parse_args()
+
+def main():
+    arguments = setup_argparser()
+
+    data_dir = tempfile.mkdtemp(prefix='bench_data_')
+    results = []
+
+    columns = ('load', 'crop', 'rotate', 'make_png', 'savefig')
+    print(('{:<9}{:<7}{:<12}' + '{:>11}' * len(columns) + '{:>12}').format(
+            'script', 'size', 'renderer', *(columns + ('peak (MB)',))))
+
+    try:
+        for size in arguments.sizes:
+            bg_file, stats_file = write_test_data(size, data_dir)
+
+            for script in arguments.scripts:
+                for renderer in arguments.renderers:
+                    timings, peak, error = measure(run_stage_timings, script, renderer,
+                                                    bg_file, stats_file, arguments.slices)
+
+                    results.append({ 'script': SCRIPTS[script],
+                                        'size': size,
+                                        'shape': SHAPES[size],
+                                        'renderer': renderer,
+                                        'seconds': timings,
+                                        'peak_memory_mb': peak,
+                                        'error': error })
+
+                    if error:
+                        print('{:<9}{:<7}{:<12}  ERROR: {}'.format(script, size, renderer, error))
+                        continue
+
+                    print(('{:<9}{:<7}{:<12}' + '{:>9.1f}ms' * len(columns) + '{:>12.0f}').format(
+                            script, size, renderer,
+                            *([ timings[c] * 1000 for c in columns ] + [ peak ])))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(arguments.output, 'w') as f:
+        json.dump({ 'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'slices_per_axis': arguments.slices,
+                    'results': results },
+                    f, indent=1, sort_keys=True)
+
+    print('Results written to ' + arguments.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+'''
+The command line options and the set up that the MakePngs_* scripts share
+
+The scripts themselves only hold their help text. Their code lives in
+makepngs.statsbg, makepngs.dti and makepngs.highres, which all use the
+functions here for the options they have in common, to report errors
+and to save the pngs. Only numpy is imported when the scripts start:
+matplotlib is imported (with the Agg backend, so no display is needed)
+the first time a png is drawn with it and nibabel the first time a file
+is loaded, so --help and mistakes on the command line come straight
+back.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import os
+import sys
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def use_agg():
+    '''
+    Make matplotlib draw with the Agg backend. It has to be called
+    before pyplot is imported, which pyplot() below takes care of.
+    '''
+    import matplotlib
+    if 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
+
+def pyplot():
+    '''
+    Import matplotlib.pyplot (with the Agg backend) the first time it
+    is needed
+    '''
+    use_agg()
+    import matplotlib.pyplot as plt
+    return plt
+
+def error(parser, message):
+    '''
+    Print the error message and the help text and stop
+    '''
+    print('\n************************')
+    print('ERROR: {}\n'.format(message))
+    parser.print_help()
+    sys.exit()
+
+def add_renderer_arguments(parser):
+    '''
+    Add the --renderer and --lazy options
+    '''
+    # Optional argument: renderer
+    #       default: matplotlib
+    parser.add_argument('-re', '--renderer',
+                            dest='renderer',
+                            type=str,
+                            default='matplotlib',
+                            choices=['matplotlib', 'persistent', 'numpy'],
+                            metavar='renderer',
+                            help=('Draw each png as a new matplotlib figure (matplotlib), '
+                                    + 'reuse one matplotlib figure for each axis (persistent), '
+                                    + 'or composite it directly with numpy (numpy, much faster). '
+                                    + 'Default is matplotlib') )
+
+    # Optional argument: lazy
+    #       default: False
+    parser.add_argument('-lz', '--lazy',
+                            dest='lazy',
+                            action='store_true',
+                            help=('Memory map the files (if they are uncompressed .nii) and only '
+                                    + 'read the part of the volume that will be drawn, as float32. '
+                                    + 'Default is to read in all the data') )
+
+def add_preview_arguments(parser):
+    '''
+    Add the --preview and --preview_step options
+    '''
+    # Optional argument: preview
+    #       default: None
+    parser.add_argument('-pv', '--preview',
+                            dest='preview',
+                            type=int,
+                            default=None,
+                            metavar='factor',
+                            help=('Make one small contact sheet for each axis instead of the pngs '
+                                    + 'of every slice. The volumes are block averaged by this factor '
+                                    + '(eg: 2 or 4) first') )
+
+    # Optional argument: preview_step
+    #       default: 5
+    parser.add_argument('-ps', '--preview_step',
+                            dest='preview_step',
+                            type=int,
+                            default=5,
+                            metavar='step',
+                            help=('Only put every step-th slice in the preview contact sheets. '
+                                    + 'Default is 5') )
+
+def add_output_arguments(parser, needs='the numpy or persistent renderer'):
+    '''
+    Add the options for profiling the run and for how the pngs are
+    saved. needs is what --container and --animate need (to go in
+    their help text)
+    '''
+    # Optional argument: profile
+    #       default: False
+    parser.add_argument('-pf', '--profile',
+                            dest='profile',
+                            action='store_true',
+                            help=('Record the wall time, CPU time and memory used by each stage '
+                                    + '(and each png) and print a summary table at the end') )
+
+    # Optional argument: profile_stats
+    #       default: None
+    parser.add_argument('-pfs', '--profile_stats',
+                            dest='profile_stats',
+                            type=str,
+                            default=None,
+                            metavar='stats_file',
+                            help='Also save cProfile stats for the whole run to this file')
+
+    # Optional argument: writer_threads
+    #       default: 0
+    parser.add_argument('-wt', '--writer_threads',
+                            dest='writer_threads',
+                            type=int,
+                            default=0,
+                            metavar='n_threads',
+                            help=('Number of threads that compress and save the pngs while the '
+                                    + 'next ones are drawn (numpy and persistent renderers). '
+                                    + 'Default is 0, save each png straight away') )
+
+    # Optional argument: compress_level
+    #       default: None
+    parser.add_argument('-zl', '--compress_level',
+                            dest='compress_level',
+                            type=int,
+                            default=None,
+                            choices=range(10),
+                            metavar='level',
+                            help=('zlib compression level (0 to 9) for the pngs. Default is 6 '
+                                    + 'for the numpy and persistent renderers, the matplotlib '
+                                    + 'renderer\'s pngs are saved again at this level if it is given') )
+
+    # Optional argument: palette
+    #       default: False
+    parser.add_argument('-pl', '--palette',
+                            dest='palette',
+                            action='store_true',
+                            help=('Save 8 bit palette pngs rather than 32 bit RGBA. Pictures with '
+                                    + 'more than 256 colors are matched to a palette made from the '
+                                    + 'background and overlay colormaps') )
+
+    # Optional argument: strip_metadata
+    #       default: False
+    parser.add_argument('-sm', '--strip_metadata',
+                            dest='strip_metadata',
+                            action='store_true',
+                            help='Remove the text and other metadata that matplotlib adds to the pngs')
+
+    # Optional argument: container
+    #       default: None
+    parser.add_argument('-ct', '--container',
+                            dest='container',
+                            type=str,
+                            default=None,
+                            choices=['zip', 'npz'],
+                            metavar='format',
+                            help=('Save all the pngs in one file in the output directory rather '
+                                    + 'than one file each: "zip" (png files) or "npz" (RGBA arrays), '
+                                    + 'with an index of the axis, slice number and MNI coordinate of '
+                                    + 'every slice. Read them with makepngs.container.SliceReader. '
+                                    + 'Needs ' + needs) )
+
+    # Optional argument: animate
+    #       default: None
+    parser.add_argument('-an', '--animate',
+                            dest='animate',
+                            type=str,
+                            default=None,
+                            choices=['apng', 'gif'],
+                            metavar='format',
+                            help=('Also save an animation that sweeps through all the slices of '
+                                    + 'each axis: "apng" or "gif". Needs ' + needs) )
+
+    # Optional argument: frame_rate
+    #       default: 10
+    parser.add_argument('-fr', '--frame_rate',
+                            dest='frame_rate',
+                            type=float,
+                            default=10,
+                            metavar='fps',
+                            help='Frames per second of the animations. Default is 10')
+
+def start_profiler(profiler, arguments):
+    '''
+    Switch the profiler on if --profile or --profile_stats was given
+    and start it
+    '''
+    profiler.enabled = arguments.profile or arguments.profile_stats is not None
+    profiler.cprofile_file = arguments.profile_stats
+    profiler.start()
+
+def make_png_writer(arguments, palette):
+    '''
+    The PngWriter that saves the pngs in the background while the next
+    ones are drawn (or adds them to a container file and the
+    animations). palette (eg: from encoder.palette_from_luts, made from
+    the same colormaps that the pictures are drawn with) is used for
+    the animations, and for 8 bit pngs if --palette was given
+    '''
+    from makepngs import animation
+    from makepngs.writer import PngWriter
+
+    compress_level = arguments.compress_level
+    if compress_level is None:
+        compress_level = 6
+
+    # Sweep through the slices of each axis in an animation
+    animations = None
+    if arguments.animate:
+        animations = animation.SweepSet(palette,
+                                        animation_format=arguments.animate,
+                                        fps=arguments.frame_rate,
+                                        compress_level=compress_level)
+
+    return PngWriter(arguments.writer_threads,
+                        compress_level=compress_level,
+                        palette=palette if arguments.palette else None,
+                        container_format=arguments.container,
+                        animations=animations)
+
+def save_figure(fname, arguments, png_writer):
+    '''
+    Save the current matplotlib figure (from make_png) as a png and,
+    if you've asked for it, save it again with the png_writer's
+    compression and palette or remove its metadata
+    '''
+    from makepngs import encoder
+
+    pyplot().savefig(fname,
+                        transparent=True,
+                        bbox_inches='tight',
+                        edgecolor='none')
+
+    if arguments.palette or arguments.compress_level is not None:
+        encoder.reencode(fname,
+                            compress_level=png_writer.compress_level,
+                            palette=png_writer.palette)
+    elif arguments.strip_metadata:
+        encoder.strip_metadata(fname)
+
+def save_slice_figure(fig, fname, arguments, png_writer):
+    '''
+    Save a SliceFigure (from make_png_persistent). It's handed to the
+    png_writer as an RGBA picture if the png_writer does anything
+    that matplotlib can't, otherwise matplotlib saves it
+    '''
+    from makepngs import encoder
+
+    if (png_writer.n_threads > 0 or arguments.palette
+            or arguments.compress_level is not None
+            or arguments.container or arguments.animate):
+        png_writer.write(fname, fig.render())
+    else:
+        fig.save(fname)
+        if arguments.strip_metadata:
+            encoder.strip_metadata(fname)
+
+def make_output_dir(output_dir):
+    '''
+    Make the output directory if it doesn't already exist
+    '''
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+def finish(profiler, png_writer, arguments):
+    '''
+    Wait for the last pngs to be saved, then print the time and memory
+    used by each stage (if you're profiling) and the peak memory (if
+    you're verbose)
+    '''
+    from makepngs import loading
+
+    with profiler.stage('png_writer'):
+        png_writer.close()
+
+    profiler.stop()
+    if profiler.enabled:
+        print(profiler.summary())
+
+    if arguments.verbose:
+        print('Peak memory use: {:.0f} MB'.format(loading.peak_memory_mb()))
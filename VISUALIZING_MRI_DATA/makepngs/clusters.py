@@ -0,0 +1,77 @@
+'''
+Clusters of a thresholded stats map
+
+A cluster is a group of voxels above the threshold that touch each
+other (on a face, an edge or a corner, like FSL's cluster tool). The
+whole volume is labelled in one connected components pass
+(scipy.ndimage.label) and then the size and the peak of every cluster
+are found at once, by sorting the labelled voxels by cluster and
+value, rather than by looping over the clusters.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+#==============================================================================
+# The columns of the cluster table
+COLUMNS = ( 'cluster', 'voxels', 'peak_value',
+            'peak_x', 'peak_y', 'peak_z',
+            'peak_mni_x', 'peak_mni_y', 'peak_mni_z' )
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def label_clusters(stats, threshold=0):
+    '''
+    Label the clusters of voxels in stats that are above threshold.
+    Returns an array of the same shape that is 0 outside the clusters
+    and 1, 2, 3... inside them, and the number of clusters
+    '''
+    from scipy import ndimage
+
+    return ndimage.label(stats > threshold, structure=np.ones((3, 3, 3), dtype=bool))
+
+def cluster_peaks(stats, labels):
+    '''
+    The size (number of voxels), the peak value and the voxel
+    coordinates of the peak of every cluster in labels (from
+    label_clusters). Returns the sizes, the peak values and an (n, 3)
+    array of the peaks, biggest cluster first.
+    '''
+    in_cluster = np.flatnonzero(labels)
+    if len(in_cluster) == 0:
+        return (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=stats.dtype),
+                    np.zeros((0, 3), dtype=np.intp))
+
+    cluster = labels.ravel()[in_cluster]
+    values = stats.ravel()[in_cluster]
+
+    # Sort the voxels by cluster and then from the highest value down
+    # so that the first voxel of each cluster is its peak
+    order = np.lexsort((-values, cluster))
+    cluster = cluster[order]
+    starts = np.flatnonzero(np.r_[True, cluster[1:] != cluster[:-1]])
+
+    sizes = np.diff(np.r_[starts, len(cluster)])
+    peak_values = values[order[starts]]
+    peaks = np.column_stack(np.unravel_index(in_cluster[order[starts]], labels.shape))
+
+    # Put the biggest cluster (then the highest peak) first
+    by_size = np.lexsort((-peak_values, -sizes))
+
+    return sizes[by_size], peak_values[by_size], peaks[by_size]
+
+def write_table(fname, sizes, peak_values, peaks, peaks_mni):
+    '''
+    Save one row for each cluster (see COLUMNS) as a csv file. The
+    clusters are numbered from 1, the biggest, in the order they're
+    given.
+    '''
+    with open(fname, 'w') as f:
+        f.write(','.join(COLUMNS) + '\n')
+
+        for i in range(len(sizes)):
+            row = ( [ i + 1, sizes[i], '{:g}'.format(peak_values[i]) ]
+                    + list(peaks[i])
+                    + [ '{:g}'.format(mni) for mni in peaks_mni[i] ] )
+            f.write(','.join( str(value) for value in row ) + '\n')
@@ -0,0 +1,460 @@
+'''
+A numpy replacement for the matplotlib figure that make_png builds for
+every slice.
+
+Everything is done directly on arrays:
+  * colormaps are looked up through a precomputed 256 entry table (LUT)
+  * the background and the masked overlay are alpha blended onto a
+    black (or transparent) canvas
+  * any number of overlays, each with its own colormap, opacity and
+    threshold, are blended on top of the background in one go
+  * or an overlay that already has its own colors (eg: the direction
+    colors from makepngs.direction) is blended on top instead
+  * the brain outline is drawn as a raster band around a threshold mask
+  * text is stamped on with a small bitmap font
+  * the png file is written with zlib, no figure or canvas is involved
+
+Matplotlib is only used to read the colors out of a colormap, once
+per colormap.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import struct
+import zlib
+import numpy as np
+
+#==============================================================================
+# A 5 x 7 BITMAP FONT
+# Only the characters that appear in the slice labels are included,
+# anything else is drawn as a space
+_FONT_ROWS = {
+    '0': ('01110', '10001', '10011', '10101', '11001', '10001', '01110'),
+    '1': ('00100', '01100', '00100', '00100', '00100', '00100', '01110'),
+    '2': ('01110', '10001', '00001', '00010', '00100', '01000', '11111'),
+    '3': ('11111', '00010', '00100', '00010', '00001', '10001', '01110'),
+    '4': ('00010', '00110', '01010', '10010', '11111', '00010', '00010'),
+    '5': ('11111', '10000', '11110', '00001', '00001', '10001', '01110'),
+    '6': ('00110', '01000', '10000', '11110', '10001', '10001', '01110'),
+    '7': ('11111', '00001', '00010', '00100', '01000', '01000', '01000'),
+    '8': ('01110', '10001', '10001', '01110', '10001', '10001', '01110'),
+    '9': ('01110', '10001', '10001', '01111', '00001', '00010', '01100'),
+    'X': ('10001', '10001', '01010', '00100', '01010', '10001', '10001'),
+    'Y': ('10001', '10001', '01010', '00100', '00100', '00100', '00100'),
+    'Z': ('11111', '00001', '00010', '00100', '01000', '10000', '11111'),
+    'R': ('11110', '10001', '10001', '11110', '10100', '10010', '10001'),
+    'L': ('10000', '10000', '10000', '10000', '10000', '10000', '11111'),
+    '=': ('00000', '00000', '11111', '00000', '11111', '00000', '00000'),
+    '-': ('00000', '00000', '00000', '11111', '00000', '00000', '00000'),
+    '+': ('00000', '00100', '00100', '11111', '00100', '00100', '00000'),
+    '.': ('00000', '00000', '00000', '00000', '00000', '01100', '01100'),
+    ' ': ('00000', '00000', '00000', '00000', '00000', '00000', '00000'),
+    }
+
+_GLYPHS = dict( (char, np.array([ [ p == '1' for p in row ] for row in rows ]))
+                    for char, rows in _FONT_ROWS.items() )
+
+# Colormap lookup tables are only built once per colormap
+_LUT_CACHE = {}
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def get_lut(cmap, n=256):
+    '''
+    Return an (n, 4) float array of the RGBA values in a colormap.
+    cmap can either be the name of a matplotlib colormap or a
+    matplotlib Colormap object (eg: from create_colormap)
+    '''
+    key = (cmap if isinstance(cmap, str) else id(cmap), n)
+
+    if not key in _LUT_CACHE:
+        _LUT_CACHE[key] = get_cmap(cmap)(np.linspace(0, 1, n))
+
+    return _LUT_CACHE[key]
+
+def get_cmap(cmap):
+    '''
+    The matplotlib Colormap for a colormap name (or the Colormap itself).
+    matplotlib.cm.get_cmap was removed in matplotlib 3.9, the colormaps
+    registry that replaced it isn't in the older versions.
+    '''
+    if not isinstance(cmap, str):
+        return cmap
+
+    import matplotlib
+    if hasattr(matplotlib, 'colormaps'):
+        return matplotlib.colormaps[cmap]
+
+    import matplotlib.cm as cm
+    return cm.get_cmap(cmap)
+
+def to_rgba(color):
+    '''
+    Convert a matplotlib color specification (eg: 'k', 'white', '#ff0000')
+    to an RGBA tuple. "none" gives a completely transparent color.
+    '''
+    import matplotlib.colors as mcolors
+    return mcolors.to_rgba(color)
+
+def apply_lut(lut, data, vmin=0, vmax=1):
+    '''
+    Map the values in data on to the colors in lut in the same way
+    that imshow(data, vmin=vmin, vmax=vmax) does: values below vmin
+    get the first color and values above vmax get the last one
+    '''
+    n = lut.shape[0]
+
+    index = (np.asarray(data, dtype=np.float32) - vmin) * (n / float(vmax - vmin))
+    index = np.clip(np.nan_to_num(index), 0, n - 1).astype(np.intp)
+
+    return lut[index]
+
+def blend_over(canvas, rgba, alpha):
+    '''
+    Alpha blend an (h, w, 4) float layer on top of the (h, w, 4)
+    float canvas, in place. alpha is the (h, w) opacity of the layer
+    and is zero wherever the layer is masked.
+    '''
+    alpha = alpha * rgba[..., 3]
+    dst_alpha = canvas[..., 3] * (1 - alpha)
+    out_alpha = alpha + dst_alpha
+
+    # Don't divide by zero where nothing has been drawn yet
+    weight = np.where(out_alpha > 0, out_alpha, 1)
+
+    for c in range(3):
+        canvas[..., c] = (rgba[..., c] * alpha + canvas[..., c] * dst_alpha) / weight
+    canvas[..., 3] = out_alpha
+
+    return canvas
+
+def dilate(mask, radius):
+    '''
+    Grow a 2D boolean mask by radius pixels in every direction
+    (a square structuring element)
+    '''
+    if radius < 1:
+        return mask
+
+    for axis in range(2):
+        n = mask.shape[axis]
+        pad_width = [ (0, 0), (0, 0) ]
+        pad_width[axis] = (radius, radius)
+        padded = np.pad(mask, pad_width, mode='constant')
+
+        grown = np.zeros_like(mask)
+        for shift in range(2 * radius + 1):
+            index = [ slice(None), slice(None) ]
+            index[axis] = slice(shift, shift + n)
+            grown |= padded[tuple(index)]
+        mask = grown
+
+    return mask
+
+def erode(mask, radius):
+    '''
+    Shrink a 2D boolean mask by radius pixels in every direction
+    '''
+    return ~dilate(~mask, radius)
+
+def outline_band(mask, width):
+    '''
+    Return a band that is width pixels wide and centred on the edge
+    of a boolean mask. This is the raster equivalent of
+    plt.contour(mask, linewidths=width)
+    '''
+    inner = width - width // 2
+    outer = width // 2
+
+    return dilate(mask, outer) & ~erode(mask, inner)
+
+def upscale(data, scale):
+    '''
+    Nearest neighbour upsampling of the first two dimensions of data
+    '''
+    if scale == 1:
+        return data
+
+    return np.repeat(np.repeat(data, scale, axis=0), scale, axis=1)
+
+def blend_layers(canvas, rgba, alpha):
+    '''
+    Alpha blend a stack of n (n, h, w, 4) float layers on top of the
+    (h, w, 4) float canvas, in place, all in one go. alpha is the
+    (n, h, w) opacity of each layer. The result is the same as calling
+    blend_over for each layer in turn: each layer is weighted by how
+    much of it shows through all the layers above it.
+    '''
+    alpha = alpha * rgba[..., 3]
+
+    # How much of each layer (and of the canvas) is still visible
+    # through all the layers on top of it
+    through = np.ones_like(alpha)
+    np.cumprod((1 - alpha[:0:-1]), axis=0, out=through[-2::-1])
+    weights = alpha * through
+    dst_alpha = canvas[..., 3] * (through[0] * (1 - alpha[0]))
+
+    out_alpha = weights.sum(axis=0) + dst_alpha
+
+    # Don't divide by zero where nothing has been drawn yet
+    weight = np.where(out_alpha > 0, out_alpha, 1)
+
+    for c in range(3):
+        canvas[..., c] = ((rgba[..., c] * weights).sum(axis=0) + canvas[..., c] * dst_alpha) / weight
+    canvas[..., 3] = out_alpha
+
+    return canvas
+
+class OverlayLayer(object):
+    '''
+    How one overlay is drawn by composite_layers
+
+    cmap            colormap (a name or a matplotlib Colormap object)
+    alpha           opacity of the overlay
+    threshold       only draw values that are at least this (None to
+                    draw every value that isn't 0)
+    '''
+    def __init__(self, cmap='autumn', alpha=1.0, threshold=None):
+        self.cmap = cmap
+        self.alpha = alpha
+        self.threshold = threshold
+
+    def visible(self, overlay_slice):
+        '''
+        The boolean (h, w) mask of the voxels of overlay_slice that are
+        drawn
+        '''
+        if self.threshold is None:
+            return overlay_slice != 0
+
+        return overlay_slice >= self.threshold
+
+def composite_slice(bg_slice, overlay_slice,
+                        bg_cmap='gray', overlay_cmap='autumn',
+                        overlay_alpha=1.0, bg_threshold=None,
+                        outline=None, outline_width=3, edge=None,
+                        transparency=False, scale=4):
+    '''
+    Composite a background and an overlay slice into an
+    (h * scale, w * scale, 4) uint8 RGBA image.
+
+    The layers are the same as the ones make_png draws:
+      * black (unless transparency is True)
+      * the background slice, masked below bg_threshold (if given)
+      * the overlay slice, masked where it is 0, at overlay_alpha
+      * a black line outline_width pixels wide around the outline mask
+        (if given)
+      * or, instead, black wherever a precomputed (h, w) boolean edge
+        mask is True (if given, see makepngs.outline)
+    Both slices are plotted with vmin = 0 and vmax = 1.
+    '''
+    return composite_layers(bg_slice, [ overlay_slice ],
+                                [ OverlayLayer(overlay_cmap, overlay_alpha) ],
+                                bg_cmap=bg_cmap, bg_threshold=bg_threshold,
+                                outline=outline, outline_width=outline_width, edge=edge,
+                                transparency=transparency, scale=scale)
+
+def composite_layers(bg_slice, overlay_slices, layers,
+                        bg_cmap='gray', bg_threshold=None,
+                        outline=None, outline_width=3, edge=None,
+                        transparency=False, scale=4):
+    '''
+    Composite a background slice and a stack of overlay slices into an
+    (h * scale, w * scale, 4) uint8 RGBA image.
+
+    Like composite_slice, but with one OverlayLayer in layers (its
+    colormap, opacity and threshold) for each of the overlay_slices.
+    The overlays are drawn in order, so the last one is on top. They
+    are looked up in their colormaps and blended onto the background
+    together, with one pass over the stack rather than one for each
+    overlay.
+    '''
+    # First the background slice
+    canvas = background_canvas(bg_slice, bg_cmap, bg_threshold, transparency)
+
+    # Then all the overlays, each one wherever it passes its threshold.
+    # Every overlay is plotted with vmin = 0 and vmax = 1 so the colors
+    # of the whole stack come from one lookup in the stacked colormaps
+    if len(layers):
+        luts = np.stack([ get_lut(layer.cmap) for layer in layers ])
+        n = luts.shape[1]
+
+        index = np.asarray(overlay_slices, dtype=np.float32) * np.float32(n)
+        index = np.clip(np.nan_to_num(index), 0, n - 1).astype(np.intp)
+        rgba = luts[np.arange(len(layers))[:, None, None], index]
+
+        visible = np.stack([ layer.visible(overlay_slice) * np.float32(layer.alpha)
+                                for layer, overlay_slice in zip(layers, overlay_slices) ])
+        blend_layers(canvas, rgba, visible)
+
+    return finish_canvas(canvas, outline, outline_width, edge, scale)
+
+def composite_rgba(bg_slice, overlay_rgba,
+                        bg_cmap='gray', bg_threshold=None,
+                        outline=None, outline_width=3, edge=None,
+                        transparency=False, scale=4):
+    '''
+    Composite a background slice and an (h, w, 4) float RGBA overlay
+    that already has its own colors and opacity (eg: from
+    direction.slice_rgba) into an (h * scale, w * scale, 4) uint8
+    RGBA image, with the same background, outline and edge as
+    composite_layers
+    '''
+    canvas = background_canvas(bg_slice, bg_cmap, bg_threshold, transparency)
+
+    blend_over(canvas, overlay_rgba, np.ones(bg_slice.shape, dtype=np.float32))
+
+    return finish_canvas(canvas, outline, outline_width, edge, scale)
+
+def background_canvas(bg_slice, bg_cmap='gray', bg_threshold=None, transparency=False):
+    '''
+    The (h, w, 4) float canvas with the background slice, masked
+    below bg_threshold (if given), drawn on black (or on a
+    transparent canvas if transparency is True)
+    '''
+    h, w = bg_slice.shape
+
+    # Start with black or a transparent canvas
+    canvas = np.zeros((h, w, 4), dtype=np.float32)
+    if not transparency:
+        canvas[..., 3] = 1
+
+    bg_visible = np.ones((h, w), dtype=np.float32)
+    if bg_threshold is not None:
+        bg_visible[bg_slice < bg_threshold] = 0
+
+    return blend_over(canvas, apply_lut(get_lut(bg_cmap), bg_slice), bg_visible)
+
+def finish_canvas(canvas, outline=None, outline_width=3, edge=None, scale=4):
+    '''
+    Turn a float canvas into the (h * scale, w * scale, 4) uint8 RGBA
+    image and draw the outline band or the edge mask on it in black
+    '''
+    rgba = upscale(np.round(canvas * 255).astype(np.uint8), scale)
+
+    # Add a black line around the edge of the outline mask
+    # it makes the brain look nicer :)
+    if outline is not None:
+        band = outline_band(upscale(outline, scale), outline_width)
+        rgba[band] = (0, 0, 0, 255)
+
+    if edge is not None:
+        rgba[upscale(edge, scale)] = (0, 0, 0, 255)
+
+    return rgba
+
+def text_mask(text, size=2):
+    '''
+    Return a boolean image of text written in the bitmap font, with
+    every font pixel drawn as a size x size block
+    '''
+    gap = np.zeros((7, 1), dtype=bool)
+
+    columns = []
+    for char in text.upper():
+        columns.append(_GLYPHS.get(char, _GLYPHS[' ']))
+        columns.append(gap)
+
+    mask = np.hstack(columns[:-1])
+
+    return upscale(mask, size)
+
+def draw_text(rgba, text, color, x, y, ha='center', va='bottom', size=2):
+    '''
+    Write text on to an RGBA image in place. x and y are fractions of
+    the image width and height measured from the bottom left corner
+    (like ax.text with transform=ax.transAxes) and ha/va give the
+    horizontal and vertical alignment of the text at that point.
+    Nothing is drawn if the color is "none".
+    '''
+    if not text or color == 'none':
+        return rgba
+
+    color = np.round(np.array(to_rgba(color)) * 255).astype(np.uint8)
+    if color[3] == 0:
+        return rgba
+
+    mask = text_mask(text, size)
+    th, tw = mask.shape
+    h, w = rgba.shape[:2]
+
+    # Find the top left corner of the text
+    x0 = int(round(x * w - { 'left': 0, 'center': tw / 2., 'right': tw }[ha]))
+    y0 = int(round((1 - y) * h - { 'top': 0, 'center': th / 2., 'bottom': th }[va]))
+
+    # Clip the text to the image
+    r0, c0 = max(y0, 0), max(x0, 0)
+    r1, c1 = min(y0 + th, h), min(x0 + tw, w)
+    if r1 <= r0 or c1 <= c0:
+        return rgba
+
+    mask = mask[ r0 - y0 : r1 - y0, c0 - x0 : c1 - x0 ]
+    rgba[r0:r1, c0:c1][mask] = color
+
+    return rgba
+
+def _png_chunk(chunk_type, data):
+    chunk = chunk_type + data
+    return (struct.pack('>I', len(data)) + chunk
+                + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff))
+
+def png_bytes(rgba, compress_level=6):
+    '''
+    Encode an (h, w, 4) uint8 RGBA array as the bytes of a png file
+    '''
+    rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+    h, w = rgba.shape[:2]
+
+    # Every row starts with a 0 byte (no filter)
+    raw = np.zeros((h, w * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(h, w * 4)
+
+    header = struct.pack('>IIBBBBB', w, h, 8, 6, 0, 0, 0)
+
+    return b''.join([ b'\x89PNG\r\n\x1a\n',
+                        _png_chunk(b'IHDR', header),
+                        _png_chunk(b'IDAT', zlib.compress(raw.tobytes(), compress_level)),
+                        _png_chunk(b'IEND', b'') ])
+
+def write_png(fname, rgba, compress_level=6):
+    '''
+    Write an (h, w, 4) uint8 RGBA array to fname as a png file
+    '''
+    with open(fname, 'wb') as f:
+        f.write(png_bytes(rgba, compress_level=compress_level))
+
+def indexed_png_bytes(indices, palette, compress_level=6):
+    '''
+    Encode an (h, w) uint8 array of indices in to an (n, 4) uint8 RGBA
+    palette (n <= 256) as the bytes of an 8 bit palette png file. The
+    alpha values of the palette are saved in a tRNS chunk if any of
+    them aren't 255.
+    '''
+    indices = np.ascontiguousarray(indices, dtype=np.uint8)
+    palette = np.asarray(palette, dtype=np.uint8)
+    h, w = indices.shape
+
+    raw = np.zeros((h, w + 1), dtype=np.uint8)
+    raw[:, 1:] = indices
+
+    header = struct.pack('>IIBBBBB', w, h, 8, 3, 0, 0, 0)
+
+    chunks = [ b'\x89PNG\r\n\x1a\n',
+                _png_chunk(b'IHDR', header),
+                _png_chunk(b'PLTE', palette[:, :3].tobytes()) ]
+    if np.any(palette[:, 3] != 255):
+        # Only the alpha values up to the last transparent color are needed
+        last = np.nonzero(palette[:, 3] != 255)[0][-1]
+        chunks.append(_png_chunk(b'tRNS', palette[:last + 1, 3].tobytes()))
+    chunks.append(_png_chunk(b'IDAT', zlib.compress(raw.tobytes(), compress_level)))
+    chunks.append(_png_chunk(b'IEND', b''))
+
+    return b''.join(chunks)
+
+def write_indexed_png(fname, indices, palette, compress_level=6):
+    '''
+    Write an (h, w) uint8 array of indices in to an (n, 4) uint8 RGBA
+    palette to fname as an 8 bit palette png file
+    '''
+    with open(fname, 'wb') as f:
+        f.write(indexed_png_bytes(indices, palette, compress_level=compress_level))
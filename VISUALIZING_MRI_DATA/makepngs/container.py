@@ -0,0 +1,210 @@
+'''
+Save all the slices of a run in one file rather than hundreds of pngs
+
+Every slice goes in to a single zip file in the output directory:
+  * slices.zip   each slice is a png file, stored without any more
+                 compression (pngs are already compressed)
+  * slices.npz   each slice is an (h, w, 4) uint8 RGBA array saved as
+                 a .npy file, so numpy.load can read it as well
+
+The zip file also contains index.json, which lists the name, axis,
+slice number, MNI coordinate and shape of every slice. The axis,
+slice number and MNI coordinate come from the png names
+(eg: axial_slice_0012_+020.png).
+
+SliceArchive writes a container, one slice at a time, and can be
+shared by the PngWriter threads. SliceReader reads any single slice
+back without unpacking the others:
+
+    with SliceReader('subject01/slices.zip') as reader:
+        rgba = reader.get('axial', 12)
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import io
+import json
+import os
+import re
+import threading
+import zipfile
+import numpy as np
+
+from makepngs import encoder
+
+#==============================================================================
+# The container formats and the names of the files in the zip
+FORMATS = { 'zip': ('slices.zip', '.png', zipfile.ZIP_STORED),
+            'npz': ('slices.npz', '.npy', zipfile.ZIP_DEFLATED) }
+
+INDEX_NAME = 'index.json'
+
+_SLICE_NAME = re.compile(r'^(?P<axis>[a-z]+)_slice_(?P<slice>\d+)(_(?P<mni>[+-]\d+))?$')
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def container_name(output_dir, container_format):
+    '''
+    The container file for all the slices in output_dir
+    '''
+    return os.path.join(output_dir, FORMATS[container_format][0])
+
+def slice_info(name):
+    '''
+    The axis, slice number and MNI coordinate (None if it isn't in the
+    name) of a slice from its png name. Other names (eg: montage strips)
+    only get their name.
+    '''
+    name = os.path.splitext(os.path.basename(name))[0]
+    info = { 'name': name, 'axis': None, 'slice': None, 'mni': None }
+
+    match = _SLICE_NAME.match(name)
+    if match:
+        info['axis'] = match.group('axis')
+        info['slice'] = int(match.group('slice'))
+        if match.group('mni') is not None:
+            info['mni'] = int(match.group('mni'))
+
+    return info
+
+def _slice_order(info):
+    return (info['axis'] or '', -1 if info['slice'] is None else info['slice'], info['name'])
+
+class SliceArchive(object):
+    '''
+    A container file that slices are added to one at a time
+
+    fname           the zip (or npz) file, it is replaced if it exists
+    container_format
+                    'zip' for png files, 'npz' for RGBA arrays
+    metadata        a dictionary that is saved in the index too
+                    (eg: the stats file)
+
+    Slices can be added from several threads at once, they are encoded
+    in parallel and only written to the file one at a time.
+    '''
+    def __init__(self, fname, container_format='zip', metadata=None):
+        self.fname = fname
+        self.container_format = container_format
+        self.metadata = metadata or {}
+        self.slices = []
+
+        self._extension, self._compression = FORMATS[container_format][1:]
+        self._lock = threading.Lock()
+        self._zip = zipfile.ZipFile(fname, 'w', self._compression, allowZip64=True)
+
+    def add(self, name, rgba, compress_level=6, palette=None):
+        '''
+        Add an (h, w, 4) uint8 RGBA slice. name is the name it would
+        have had as a png file.
+        '''
+        info = slice_info(name)
+        info['shape'] = list(rgba.shape)
+
+        if self.container_format == 'zip':
+            data = encoder.png_bytes(rgba, compress_level=compress_level, palette=palette)
+        else:
+            buf = io.BytesIO()
+            np.lib.format.write_array(buf, np.ascontiguousarray(rgba, dtype=np.uint8))
+            data = buf.getvalue()
+
+        with self._lock:
+            self._zip.writestr(info['name'] + self._extension, data)
+            self.slices.append(info)
+
+    def close(self):
+        '''
+        Write the index and close the file
+        '''
+        with self._lock:
+            if self._zip is None:
+                return
+
+            index = { 'format': self.container_format,
+                        'metadata': self.metadata,
+                        'slices': sorted(self.slices, key=_slice_order) }
+            self._zip.writestr(INDEX_NAME, json.dumps(index, indent=1, sort_keys=True))
+            self._zip.close()
+            self._zip = None
+
+class SliceReader(object):
+    '''
+    Read single slices from a container made by SliceArchive
+
+    reader.slices           the index: a list of dictionaries with the
+                            name, axis, slice, mni and shape of each slice
+    reader.metadata         the metadata saved with the container
+    reader.read(name)       a slice by name as an (h, w, 4) uint8 array
+    reader.get(axis, slice) a slice by axis name and slice number
+    reader.png(name)        the png file of a slice (zip containers only)
+    '''
+    def __init__(self, fname):
+        self.fname = fname
+        self._zip = zipfile.ZipFile(fname, 'r')
+
+        names = self._zip.namelist()
+        if any(name.endswith('.npy') for name in names):
+            self.container_format = 'npz'
+        else:
+            self.container_format = 'zip'
+        self._extension = FORMATS[self.container_format][1]
+
+        if INDEX_NAME in names:
+            index = json.loads(self._zip.read(INDEX_NAME).decode('utf-8'))
+            self.slices = index['slices']
+            self.metadata = index['metadata']
+        else:
+            # The run didn't finish, so work out what you can from the names
+            self.slices = [ slice_info(name) for name in names
+                                if name.endswith(self._extension) ]
+            self.metadata = {}
+
+        self._by_slice = dict( ((info['axis'], info['slice']), info['name'])
+                                    for info in self.slices )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.slices)
+
+    def names(self, axis=None):
+        '''
+        The names of the slices (of one axis if given)
+        '''
+        return [ info['name'] for info in self.slices
+                    if axis is None or info['axis'] == axis ]
+
+    def png(self, name):
+        '''
+        The bytes of the png file of a slice in a zip container
+        '''
+        if self.container_format != 'zip':
+            raise ValueError('{} contains arrays, not pngs'.format(self.fname))
+        return self._zip.read(name + self._extension)
+
+    def read(self, name):
+        '''
+        A slice as an (h, w, 4) uint8 RGBA array
+        '''
+        data = io.BytesIO(self._zip.read(name + self._extension))
+
+        if self.container_format == 'npz':
+            return np.lib.format.read_array(data)
+
+        import matplotlib.image as mpimg
+        return encoder.to_rgba_uint8(mpimg.imread(data, format='png'))
+
+    def get(self, axis, slice_id):
+        '''
+        A slice by axis name and slice number (as in the png names)
+        '''
+        if not (axis, slice_id) in self._by_slice:
+            raise KeyError('There is no {} slice {} in {}'.format(axis, slice_id, self.fname))
+        return self.read(self._by_slice[(axis, slice_id)])
+
+    def close(self):
+        self._zip.close()
@@ -0,0 +1,130 @@
+'''
+Cropping the data down to the part of the volume that will be drawn
+
+The crop_data functions that used to live in each of the MakePngs_*
+scripts summed the volume three times, copied it, fancy indexed it
+three times (a full copy each time) and then np.pad'ed the result.
+Here the bounding box is found from a single boolean mask, the cropped
+data is a view of the original array (no copies) and the padding
+around the brain is only added to each 2D slice as it is drawn.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def occupancy(mask):
+    '''
+    Return a list of three boolean arrays, one for each axis of a 3D
+    mask, that are True for every slice that contains at least one True
+    voxel. The whole mask is only reduced twice: the x and y occupancy
+    both come from the (much smaller) 2D projection over the last axis.
+    '''
+    xy = mask.any(axis=2)
+    occupied_z = mask.any(axis=0).any(axis=0)
+
+    return [ xy.any(axis=1), xy.any(axis=0), occupied_z ]
+
+def occupied_box(occupied):
+    '''
+    Turn the three boolean arrays from occupancy into a tuple of three
+    slices that runs from the first to the last occupied slice along
+    each axis. Returns None if nothing is occupied.
+    '''
+    box = []
+    for axis_occupied in occupied:
+        ids = np.flatnonzero(axis_occupied)
+        if len(ids) == 0:
+            return None
+        box.append(slice(ids[0], ids[-1] + 1))
+
+    return tuple(box)
+
+def bounding_box(data, threshold=None):
+    '''
+    Return a tuple of three slices that covers every non-zero voxel in
+    data (or every voxel that is at least threshold). Returns None if
+    there aren't any.
+    '''
+    if threshold is None:
+        mask = data != 0
+    else:
+        mask = data >= threshold
+
+    return occupied_box(occupancy(mask))
+
+def crop_box(data, pad=0):
+    '''
+    Find the bounding box of the non-zero voxels in data.
+
+    Returns the box and a list of the original slice ids along each
+    axis. The slice ids include pad extra slices on either side of the
+    box; those slices, and the pad voxels around each slice, are added
+    by padded_slice when the slice is drawn.
+    '''
+    box = bounding_box(data)
+
+    # If there's nothing there keep the whole volume
+    if box is None:
+        box = tuple( slice(0, n) for n in data.shape )
+
+    slices_list = [ list(range(sl.start - pad, sl.stop + pad)) for sl in box ]
+
+    return box, slices_list
+
+def crop_stack(volumes, crop_volumes, pad=0):
+    '''
+    Crop every volume in the list volumes to the bounding box of the
+    voxels that are non-zero in any of crop_volumes (eg: a stack of
+    overlays). Returns a list of views of the volumes (no data is
+    copied) and the slice ids, like crop_data.
+    '''
+    occupied = None
+    for data in crop_volumes:
+        data_occupied = occupancy(data != 0)
+        if occupied is None:
+            occupied = data_occupied
+        else:
+            occupied = [ a | b for a, b in zip(occupied, data_occupied) ]
+
+    box = occupied_box(occupied)
+
+    # If there's nothing there keep the whole volume
+    if box is None:
+        box = tuple( slice(0, n) for n in volumes[0].shape )
+
+    slices_list = [ list(range(sl.start - pad, sl.stop + pad)) for sl in box ]
+
+    return [ data[box] for data in volumes ], slices_list
+
+def crop_data(data, other_data, pad=0):
+    '''
+    Crop both volumes to the bounding box of the non-zero voxels in
+    data. Returns views of the two volumes (no data is copied) and the
+    slice ids from crop_box.
+    '''
+    box, slices_list = crop_box(data, pad)
+
+    return data[box], other_data[box], slices_list
+
+def padded_slice(data, slice_id, pad=0):
+    '''
+    Return slice slice_id along the last axis of data as if data had
+    been padded with pad zeros on every side. data can also be an
+    orientation.OrientedVolume, which cuts the slice itself.
+    '''
+    if hasattr(data, 'padded_slice'):
+        return data.padded_slice(slice_id, pad)
+
+    rows, columns, n_slices = data.shape
+    i = slice_id - pad
+
+    if i < 0 or i >= n_slices:
+        return np.zeros((rows + 2 * pad, columns + 2 * pad), dtype=data.dtype)
+
+    if pad == 0:
+        return data[:, :, i]
+
+    return np.pad(data[:, :, i], pad, mode='constant')
@@ -0,0 +1,55 @@
+'''
+Direction encoded color (DEC) pictures of the principal diffusion
+direction
+
+dtifit saves the principal eigenvector of the diffusion tensor at each
+voxel as V1 (a 4D image with three volumes: its x, y and z components)
+and the fractional anisotropy as FA. The usual way to look at them
+together (eg: to check the tracts before running tractography) is to
+color each voxel by its direction, red for left-right, green for
+anterior-posterior and blue for inferior-superior, as bright as its FA:
+    red, green, blue = |V1| * FA
+V1 has no sign, so only its absolute value is used, and the colors
+belong to the x, y and z axes of the volume whichever way up the
+slices are turned.
+
+The colors are worked out for the whole volume in one go and kept as
+a (3, x, y, z) array: three volumes (red, green and blue) that are
+cropped, turned and sliced exactly like any other overlay.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def direction_colors(v1, fa, threshold=None):
+    '''
+    The red, green and blue volumes, as a (3, x, y, z) float32 array,
+    for an (x, y, z, 3) V1 array and an (x, y, z) FA array. Voxels
+    where FA is below threshold (if it's given) are 0 in all three.
+    '''
+    if threshold is not None:
+        fa = np.where(fa >= threshold, fa, 0)
+
+    # Work on the whole volume at once without any temporary copies
+    colors = np.empty((3,) + fa.shape, dtype=np.float32)
+    np.abs(np.moveaxis(v1, -1, 0), out=colors)
+    colors *= fa
+
+    return colors
+
+def slice_rgba(rgb_slices, alpha=1.0):
+    '''
+    Turn the red, green and blue slices (eg: of the direction_colors
+    volumes) into an (h, w, 4) float RGBA picture that is transparent
+    wherever all three are 0 and alpha everywhere else
+    '''
+    rgb = np.clip(np.nan_to_num(np.asarray(rgb_slices, dtype=np.float32)), 0, 1)
+
+    rgba = np.empty(rgb.shape[1:] + (4,), dtype=np.float32)
+    rgba[..., :3] = np.moveaxis(rgb, 0, -1)
+    rgba[..., 3] = rgb.any(axis=0) * np.float32(alpha)
+
+    return rgba
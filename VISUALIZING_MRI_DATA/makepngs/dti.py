@@ -0,0 +1,727 @@
+'''
+The code behind MakePngs_DTI.py: pngs of every slice of an overlay
+(eg: a DTI map) drawn faintly on top of a background image
+
+More than one overlay (eg: several contrasts) can be drawn on the same
+background, each with its own colormap, opacity and threshold. They're
+all read, cropped and turned together and the numpy renderer blends
+the whole stack onto each slice in one go.
+
+With dtifit's V1 image (--v1_file) the overlay, which should be the FA
+image, is drawn in the direction encoded colors from makepngs.direction
+instead of a colormap. The pngs can be made by a pool of processes
+(--jobs) that all read the cropped data from shared memory.
+
+Run it with MakePngs_DTI.py, which has the help text for all the
+options. main() reads the command line and makes the pngs.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+import os
+import argparse
+import multiprocessing as mp
+from makepngs import cli
+from makepngs import compositor
+from makepngs import direction
+from makepngs import encoder
+from makepngs import loading
+from makepngs import profiling
+from makepngs import cropping
+from makepngs import orientation
+from makepngs import preview
+from makepngs.pairs import hardcoded_variables, load_stack, load_stack_lazy, rotate_stack
+from makepngs.slice_figure import SliceFigure
+from makepngs.writer import PngWriter
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def setup_argparser():
+    '''
+    # CODE TO READ ARGUMENTS FROM THE COMMAND LINE AND SET OPTIONS
+    # ALSO INCLUDES SOME HELP TEXT
+    '''
+    
+    # Build a basic parser.
+    help_text = ('Overlay a one nifti image (of the same size) on top of a '
+                    + 'background nifti image (eg: highre_brain and highres) '
+                    + 'and create pngs of all slices in all directions '
+					+ '(axial, coronal, sagittal)')
+    
+    sign_off = 'Author: Kirstie Whitaker <kw401@cam.ac.uk>'
+    
+    parser = argparse.ArgumentParser(description=help_text, epilog=sign_off)
+    
+    # Now add the arguments
+    # Required argument: background file
+    parser.add_argument(dest='background_file', 
+                            type=str,
+                            metavar='bg_fname',
+                            help='File name for background .nii.gz image')
+    
+    # Required argument: overlay file(s)
+    parser.add_argument(dest='overlay_files', 
+                            type=str,
+                            nargs='+',
+                            metavar='overlay_fname',
+                            help=('File name for overlay .nii.gz image. Give more than one to '
+                                    + 'draw them all on the same background, in order (the last '
+                                    + 'one is on top)') )
+    
+    # Required argument: output dir
+    parser.add_argument(dest='output_dir', 
+                            type=str,
+                            metavar='output_dirname',
+                            help='Output directory for .png images')
+    
+    # Optional argument: verbosity
+    parser.add_argument('-v', '--verbose',
+                            dest='verbose',
+                            action='store_true',
+                            help='Print verbose updates of each step to the screen')
+                            
+    # Optional argument: colormap1
+    #       default: autumn
+    parser.add_argument('-cm1', '--colormap1',
+                            dest='colormap1',
+                            type=str,
+                            default='gray',
+                            metavar='colormap1',
+                            help= ('Colormap used to plot background data. Default is gray. '
+                                    + 'See wiki.scipy.org/Cookbook/Matplotlib/Show_colormaps '
+                                    + 'for all possible colormaps') )
+                                    
+    # Optional argument: colormap2
+    #       default: autumn
+    parser.add_argument('-cm2', '--colormap2',
+                            dest='colormap2',
+                            type=str,
+                            nargs='+',
+                            default=['autumn'],
+                            metavar='colormap2',
+                            help= ('Colormap used to plot overlay data. Default is autumn. '
+                                    + 'Give one for each overlay file to use a different '
+                                    + 'colormap for each of them. '
+                                    + 'See wiki.scipy.org/Cookbook/Matplotlib/Show_colormaps '
+                                    + 'for all possible colormaps') )
+                                    
+    # Optional argument: alpha
+    #       default: 0.2
+    parser.add_argument('-al', '--alpha',
+                            dest='alpha',
+                            type=float,
+                            nargs='+',
+                            default=None,
+                            metavar='alpha',
+                            help=('Opacity of the overlay, between 0 and 1. Default is 0.2 '
+                                    + '(1 with --v1_file). Give one for each overlay file to '
+                                    + 'draw each of them at its own opacity') )
+                                    
+    # Optional argument: threshold
+    #       default: None
+    parser.add_argument('-th', '--threshold',
+                            dest='threshold',
+                            type=float,
+                            nargs='+',
+                            default=None,
+                            metavar='threshold',
+                            help=('Only draw overlay values that are at least this fraction of '
+                                    + 'the overlay\'s maximum. Give one for each overlay file to '
+                                    + 'threshold each of them separately. Default is to draw every '
+                                    + 'value that isn\'t 0') )
+                                    
+    # Optional argument: v1_file
+    #       default: None
+    parser.add_argument('-v1', '--v1_file',
+                            dest='v1_file',
+                            type=str,
+                            default=None,
+                            metavar='v1_fname',
+                            help=('dtifit\'s V1 image (the principal diffusion direction, 4D with '
+                                    + '3 volumes). Color the overlay, which should be the FA image, '
+                                    + 'by the direction at each voxel (red: left-right, green: '
+                                    + 'anterior-posterior, blue: inferior-superior) as bright as '
+                                    + 'its FA, instead of with colormap2. Needs the numpy or '
+                                    + 'matplotlib renderer') )
+                                    
+    # Optional argument: crop_option
+    #       default: background
+    parser.add_argument('-cr', '--crop_option',
+                            dest='crop_option',
+                            type=str,
+                            default='background',
+                            choices=['background', 'overlay'],
+                            metavar='crop_option',
+                            help='Choose to crop either the background image, or the overlay image. Default is background')
+
+    # Optional argument: textcolor_R
+    #       default: black
+    parser.add_argument('-tc2', '--textcolor_R',
+                            dest='textcolor_R',
+                            type=str,
+                            default='k',
+                            metavar='textcolor_R',
+                            help='Color for side indicator (R) on axial slices. Default is black. Enter "none" to leave blank')
+    
+    # Optional argument: transparency
+    #       default: False
+    parser.add_argument('-tr', '--transparency',
+                            dest='transparency',
+                            action='store_true',
+                            help='Make background transparent. Default is black')
+    
+    # Optional argument: jobs
+    #       default: 1
+    parser.add_argument('-j', '--jobs',
+                            dest='jobs',
+                            type=int,
+                            default=1,
+                            metavar='n_jobs',
+                            help='Number of processes used to make the pngs. Default is 1. Enter 0 to use all available cores')
+    
+    # Optional arguments: renderer and lazy
+    cli.add_renderer_arguments(parser)
+    
+    # Optional arguments: preview and preview_step
+    cli.add_preview_arguments(parser)
+    
+    # Optional arguments: profiling and saving the pngs
+    cli.add_output_arguments(parser, needs='the numpy or persistent renderer and --jobs 1')
+    
+    arguments = parser.parse_args()
+    
+    # The pngs are added to the container and the animations by the
+    # png_writer so they can't be saved by matplotlib or by other
+    # processes
+    if (arguments.container or arguments.animate) and (arguments.renderer == 'matplotlib'
+                                                        or arguments.jobs != 1):
+        cli.error(parser, '--container and --animate need the numpy or persistent renderer and --jobs 1')
+    
+    # The direction colors are drawn at full strength unless you ask
+    # for something else
+    if arguments.alpha is None:
+        arguments.alpha = [ 1.0 ] if arguments.v1_file else [ 0.2 ]
+    
+    # There's either one colormap, alpha and threshold for all the
+    # overlays or one for each of them
+    n_overlays = len(arguments.overlay_files)
+    for option in [ 'colormap2', 'alpha', 'threshold' ]:
+        values = getattr(arguments, option)
+        if values is not None and not len(values) in (1, n_overlays):
+            cli.error(parser, 'give one --{} or one for each of the {} overlay files'.format(
+                                option, n_overlays))
+    
+    # The persistent figure only has one overlay layer
+    if n_overlays > 1 and arguments.renderer == 'persistent':
+        cli.error(parser, 'more than one overlay file needs the numpy or matplotlib renderer')
+    
+    # The direction colors are worked out from V1 and one FA image
+    if arguments.v1_file:
+        if n_overlays > 1:
+            cli.error(parser, '--v1_file needs exactly one overlay file (the FA image)')
+        if arguments.renderer == 'persistent':
+            cli.error(parser, '--v1_file needs the numpy or matplotlib renderer')
+    
+    return arguments, parser
+
+def overlay_layers(arguments):
+    '''
+    The colormap, alpha and threshold of each overlay as a list of
+    compositor.OverlayLayers, in the same order as the overlay files
+    '''
+    n_overlays = len(arguments.overlay_files)
+    
+    def each(values):
+        if values is None:
+            return [ None ] * n_overlays
+        if len(values) == 1:
+            return values * n_overlays
+        return values
+    
+    return [ compositor.OverlayLayer(cmap, alpha, threshold)
+                for cmap, alpha, threshold in zip(each(arguments.colormap2),
+                                                    each(arguments.alpha),
+                                                    each(arguments.threshold)) ]
+
+def load_directions(arguments, parser, fa, offset):
+    '''
+    READ IN THE PRINCIPAL DIFFUSION DIRECTION
+    from the V1 image, for the same box of voxels as the (scaled) FA
+    data that has already been read in (offset is where the box starts
+    in the whole volume), and turn it in to the red, green and blue
+    direction color volumes. Returns a list of the three volumes
+    '''
+    try:
+        v1_img = loading.load_image(arguments.v1_file)
+    except:
+        cli.error(parser, 'V1 file can not be loaded')
+    
+    # Check that it has one volume for each of x, y and z and that
+    # it's the same size as the FA image
+    if not loading.n_volumes(v1_img) == 3:
+        cli.error(parser, 'V1 file does not have 3 volumes')
+    
+    try:
+        loading.check_same_space(loading.load_image(arguments.background_file), v1_img)
+    except ValueError as err:
+        cli.error(parser, err)
+    
+    # Only read the voxels inside the box, as float32
+    box = tuple( slice(start, start + n) for start, n in zip(offset, fa.shape) )
+    v1 = loading.LazyVolume(v1_img).read(box)
+    
+    threshold = None
+    if arguments.threshold is not None:
+        threshold = arguments.threshold[0]
+    
+    return list(direction.direction_colors(v1, fa, threshold))
+
+def make_png(bg_slice, overlay_slices,
+                        axis_name, 
+                        png_name, arguments):
+    '''
+    Makes a png image from a background slice with the overlay
+    slices (a list) on top of it and saves to the output directory 
+    The transparency option makes the background transparent
+    or not
+    The colormap options (1 and 2) are the colors that the background and
+    overlay files will be presented in
+    '''
+
+    # Set up the figure
+    plt = cli.pyplot()
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    
+    # If you don't want a transparent background, add in a
+    # black background first
+    if not arguments.transparency:
+        black = ax.imshow(np.ones_like(bg_slice),
+                                interpolation='none',
+                                cmap='gray')
+    # First show the background slice
+    im1 = ax.imshow(bg_slice,
+                        interpolation='none',
+                        cmap=arguments.colormap1,
+                        vmin = 0,
+                        vmax = 1)
+    
+    # Then the direction colors, if you've given a V1 image,
+    # or else overlay each of the overlay_slices
+    if arguments.v1_file:
+        im2 = ax.imshow(direction.slice_rgba(overlay_slices, arguments.alpha[0]),
+                            interpolation='none')
+        overlay_slices = []
+    
+    for layer, overlay_slice in zip(overlay_layers(arguments), overlay_slices):
+        
+        # Mask the data
+        m_overlay_slice = np.ma.masked_where(~layer.visible(overlay_slice), overlay_slice)
+        
+        im2 = ax.imshow(m_overlay_slice,
+                            interpolation='none',
+                            cmap=layer.cmap,
+                            vmin = 0,
+                            vmax = 1,
+                            alpha = layer.alpha)
+               
+    # Add a black line around the edge of the background image
+    # it makes the brain look nicer :)
+    #CS = plt.contour(bg_slice, [0.06, 1], linewidths=3, colors='k')
+         
+    # Put a little "R" in the middle right side of the image 
+    # if you're making axial slices
+    if axis_name == 'axial' and not arguments.textcolor_R == 'none':
+        text = ax.text(0.99, 0.5 , 'R',
+        horizontalalignment='right',
+        verticalalignment='center',
+        transform=ax.transAxes,
+        color = arguments.textcolor_R)
+    
+    # Turn off axis labels
+    ax.get_xaxis().set_visible(False)
+    ax.get_yaxis().set_visible(False)
+    ax.set_frame_on(False)
+
+    # Save the figure
+    with profiler.stage('savefig', png_name):
+        cli.save_figure(os.path.join(arguments.output_dir, png_name), arguments, png_writer)
+    
+    plt.close()
+
+def make_png_numpy(bg_slice, overlay_slices,
+                        axis_name,
+                        png_name, arguments):
+    '''
+    Makes the same png as make_png but composites the slices
+    directly with numpy instead of building a matplotlib figure
+    '''
+    rgba = composite_png(bg_slice, overlay_slices, axis_name, arguments)
+    
+    # Save the png
+    with profiler.stage('savefig', png_name):
+        png_writer.write(os.path.join(arguments.output_dir, png_name), rgba)
+
+def composite_png(bg_slice, overlay_slices,
+                        axis_name, arguments,
+                        scale=4, text_size=2):
+    '''
+    Composite the picture that make_png_numpy saves and return it
+    as an RGBA array. scale is the number of pixels for each voxel.
+    '''
+    # The contour line is switched off for these images
+    outline = None
+    
+    # Overlay the direction colors (the red, green and blue slices)
+    # or all the overlay slices on the background slice
+    if arguments.v1_file:
+        rgba = compositor.composite_rgba(bg_slice,
+                                            direction.slice_rgba(overlay_slices, arguments.alpha[0]),
+                                            bg_cmap=arguments.colormap1,
+                                            outline=outline,
+                                            transparency=arguments.transparency,
+                                            scale=scale)
+    else:
+        rgba = compositor.composite_layers(bg_slice, overlay_slices,
+                                            overlay_layers(arguments),
+                                            bg_cmap=arguments.colormap1,
+                                            outline=outline,
+                                            transparency=arguments.transparency,
+                                            scale=scale)
+    
+    # Put a little "R" in the middle right side of the image 
+    # if you're making axial slices
+    if axis_name == 'axial':
+        compositor.draw_text(rgba, 'R', arguments.textcolor_R,
+                                0.99, 0.5, ha='right', va='center',
+                                size=text_size)
+    
+    return rgba
+
+def make_preview(bg, overlays, n_slices, axis_name, arguments):
+    '''
+    Make one small contact sheet from every preview_step-th slice
+    of the (block averaged and rotated) data
+    '''
+    tiles = []
+    for slice_id in range(0, n_slices, arguments.preview_step):
+        
+        overlay_slices = [ cropping.padded_slice(overlay, slice_id, 0) for overlay in overlays ]
+        
+        if arguments.crop_option == 'overlay':
+            if not any( np.sum(overlay_slice) > 0 for overlay_slice in overlay_slices ):
+                continue
+        
+        tiles.append(composite_png(cropping.padded_slice(bg, slice_id, 0),
+                                    overlay_slices,
+                                    axis_name,
+                                    arguments,
+                                    scale=2, text_size=1))
+    
+    if not tiles:
+        return
+    
+    png_name = 'preview_{}.png'.format(axis_name)
+    compositor.write_png(os.path.join(arguments.output_dir, png_name),
+                            preview.contact_sheet(tiles, transparency=arguments.transparency))
+    
+    if arguments.verbose:
+        print('    ' + png_name)
+
+def make_png_persistent(bg_slice, overlay_slices,
+                        axis_name,
+                        png_name, arguments):
+    '''
+    Makes the same picture as make_png but only builds one matplotlib
+    figure for each axis orientation and reuses it for every slice.
+    The figure only has room for one overlay
+    '''
+    overlay_slice = overlay_slices[0]
+    
+    if not axis_name in slice_figures:
+        # Only put an "R" on axial slices
+        textcolor_R = None
+        if axis_name == 'axial':
+            textcolor_R = arguments.textcolor_R
+        
+        layer = overlay_layers(arguments)[0]
+        slice_figures[axis_name] = SliceFigure(bg_slice.shape,
+                                                bg_cmap=arguments.colormap1,
+                                                overlay_cmap=layer.cmap,
+                                                overlay_alpha=layer.alpha,
+                                                overlay_threshold=layer.threshold,
+                                                contour_levels=None,
+                                                textcolor_R=textcolor_R,
+                                                transparency=arguments.transparency)
+    
+    fig = slice_figures[axis_name]
+    fig.update(bg_slice, overlay_slice, contour_slice=overlay_slice)
+    with profiler.stage('savefig', png_name):
+        cli.save_slice_figure(fig, os.path.join(arguments.output_dir, png_name), arguments, png_writer)
+
+def set_render_data(bg, overlays, arguments):
+    '''
+    Store the cropped data (and the arguments) that render_unit needs
+    in the process that will make the pngs
+    '''
+    global render_data
+    render_data = { 'bg': bg,
+                    'overlays': overlays,
+                    'arguments': arguments,
+                    'rotated': {} }
+
+def init_worker(shared, layouts, arguments, worker_xyz_dict, compress_level, palette):
+    '''
+    Point each worker process at the cropped data in shared memory and
+    give it everything else that render_unit needs. layouts is the
+    (shape, dtype) of each shared array. Nothing is taken from the
+    globals that main sets, so the workers don't have to be forked from
+    the main process (eg: with the spawn start method)
+    '''
+    volumes = [ np.frombuffer(data, dtype=dtype).reshape(shape)
+                    for data, (shape, dtype) in zip(shared, layouts) ]
+    
+    set_render_data(volumes[0], volumes[1:], arguments)
+    
+    global profiler, png_writer, png_makers, slice_figures, xyz_dict
+    
+    xyz_dict = worker_xyz_dict
+    png_makers = renderers()
+    slice_figures = {}
+    
+    # Each worker saves its own pngs, in the same way
+    png_writer = PngWriter(0, compress_level=compress_level, palette=palette)
+    
+    # and only sends back what it records itself
+    profiler = profiling.Profiler(enabled=arguments.profile or arguments.profile_stats is not None)
+
+def render_unit(unit):
+    '''
+    Make one png from an (axis_name, slice_id, png_name) work unit.
+    The data is only rotated once per axis in each process
+    '''
+    axis_name, slice_id, png_name = unit
+    
+    if not axis_name in render_data['rotated']:
+        # The slices_list isn't needed here so rotate an empty one
+        bg, overlays, slices_list = rotate_stack(render_data['bg'],
+                                                    render_data['overlays'],
+                                                    [ [], [], [] ],
+                                                    axis_name,
+                                                    0,
+                                                    xyz_dict['orientation'])
+        render_data['rotated'][axis_name] = (bg, overlays)
+    
+    bg, overlays = render_data['rotated'][axis_name]
+    
+    arguments = render_data['arguments']
+    png_maker = png_makers[arguments.renderer]
+    
+    with profiler.stage('make_png', png_name):
+        png_maker(cropping.padded_slice(bg, slice_id, 0),
+                    [ cropping.padded_slice(overlay, slice_id, 0) for overlay in overlays ],
+                    axis_name,
+                    png_name,
+                    arguments)
+    
+    return png_name
+
+def render_unit_records(unit):
+    '''
+    render_unit in a worker process. The profiler records made for
+    the png are returned with its name so that they can be added to
+    the main process' profiler
+    '''
+    png_name = render_unit(unit)
+    
+    return png_name, profiler.take_records()
+
+def start_pool(bg, overlays, arguments):
+    '''
+    Start a pool of processes that all read the same cropped data
+    from shared memory. The orientations and the png writer's settings
+    are handed to each process as well.
+    '''
+    n_jobs = arguments.jobs
+    if n_jobs < 1:
+        n_jobs = mp.cpu_count()
+    
+    volumes = [ bg ] + list(overlays)
+    shared = [ loading.share_array(data) for data in volumes ]
+    layouts = [ (data.shape, data.dtype) for data in volumes ]
+    
+    return mp.Pool(n_jobs,
+                    initializer=init_worker,
+                    initargs=(shared, layouts, arguments,
+                                xyz_dict, png_writer.compress_level, png_writer.palette))
+
+def render_parallel(pool, work_units, arguments):
+    '''
+    Hand the work units out to the pool of processes
+    '''
+    for png_name, records in pool.imap_unordered(render_unit_records, work_units, chunksize=4):
+        profiler.add_records(records)
+        if arguments.verbose:
+            print('    ' + png_name)
+
+def renderers():
+    '''
+    The function that makes each png for each --renderer
+    '''
+    return { 'matplotlib': make_png,
+                'persistent': make_png_persistent,
+                'numpy': make_png_numpy }
+
+
+#==============================================================================
+# NOW THE FUN BEGINS
+def main():
+    '''
+    Read the arguments from the command line and make the pngs
+    '''
+    # The functions above share these with main
+    global profiler, png_writer, png_makers, slice_figures, xyz_dict
+    
+    profiler = profiling.Profiler() # Keep track of the time and memory
+                                    # used by each stage
+    
+    with profiler.stage('setup_argparser'):
+        arguments, parser = setup_argparser() # Read arguments from command line
+    
+    cli.start_profiler(profiler, arguments)
+    
+    cli.make_output_dir(arguments.output_dir)     # Make the output directory if
+                                                  # it doesn't already exist
+    
+    xyz_dict = hardcoded_variables() # Define some of the hardcoded
+                                                     # variables
+    
+    with profiler.stage('load_data'):
+        if arguments.lazy:
+            bg, overlays, zooms, shape, offset = load_stack_lazy(arguments, parser,
+                                                            arguments.overlay_files)
+                                                      # Only load the data you'll draw
+        else:
+            bg, overlays, zooms = load_stack(arguments, parser, arguments.overlay_files)
+                                                      # Load data
+            shape, offset = bg.shape, (0, 0, 0)
+    
+    # Turn the FA overlay and V1 in to the red, green and blue
+    # direction colors, which are drawn instead of the overlay
+    if arguments.v1_file:
+        with profiler.stage('direction_colors'):
+            overlays = load_directions(arguments, parser, overlays[0], offset)
+    
+    # Block average the data for the previews
+    if arguments.preview:
+        overlays = [ preview.block_average(overlay, arguments.preview, offset)[0]
+                        for overlay in overlays ]
+        bg, offset = preview.block_average(bg, arguments.preview, offset)
+        shape = preview.averaged_shape(shape, arguments.preview)
+        zooms = tuple( z * arguments.preview for z in zooms[:3] )
+    
+    xyz_dict['shape'] = shape # Add shape into your xyz_dict
+    
+    xyz_dict['zooms'] = zooms # Add voxel dimensions to your xyz_dict
+    
+    xyz_dict['orientation'] = orientation.from_affine(loading.load_image(arguments.background_file).affine)
+                                      # Work out which way up each
+                                      # axis' slices go from the affine
+    
+    with profiler.stage('crop_data'):
+        if arguments.crop_option == 'overlay':
+            crop_to = overlays                        # Crop to all of the overlays
+        else:
+            crop_to = [ bg ]
+        cropped, slices_list = cropping.crop_stack([ bg ] + overlays, crop_to)
+                                                      # Crop data (but keep slice_ids)
+        bg_cropped, overlays_cropped = cropped[0], cropped[1:]
+    
+    # Make the slice_ids relative to the whole volume
+    slices_list = [ [ n + offset[i] for n in sl ] for i, sl in enumerate(slices_list) ]
+    
+    # Choose how to draw the pngs
+    png_makers = renderers()
+    png_maker = png_makers[arguments.renderer]
+    slice_figures = {}
+    
+    # The palette for 8 bit pngs (if you want smaller files) and the
+    # animations is made from the same colormaps that the pictures are
+    # drawn with (or from evenly spaced colors for the direction colors)
+    if arguments.v1_file:
+        palette = encoder.palette_from_cube(arguments.colormap1)
+    else:
+        layers = overlay_layers(arguments)
+        palette = encoder.palette_from_luts(arguments.colormap1,
+                                            [ layer.cmap for layer in layers ],
+                                            overlay_alpha=[ layer.alpha for layer in layers ])
+    
+    # Save the pngs in the background while the next ones are drawn
+    # (or add them to a container file and the animations)
+    png_writer = cli.make_png_writer(arguments, palette)
+    
+    # Hand the pngs out to a pool of processes if you've asked for
+    # more than one
+    pool = None
+    work_units = []
+    if arguments.jobs != 1 and not arguments.preview:
+        pool = start_pool(bg_cropped, overlays_cropped, arguments)
+    
+    # Loop through the three axes
+    for axis_id in range(3):  
+    
+        axis_name = xyz_dict['name'][axis_id] # Get the name of the axis
+        print(axis_name.capitalize())        # and print to screen
+    
+        shape = xyz_dict['shape'][axis_id] # You also need the shape of the array
+    
+        with profiler.stage('rotate_data', axis_name):
+            bg, overlays, slices_list = rotate_stack(bg_cropped, # Rotate the data so your
+                                            overlays_cropped,    # axis of interest is last 
+                                            slices_list,       # and the slices look good
+                                            axis_name,
+                                            shape,
+                                            xyz_dict['orientation'])
+    
+        # Only make the contact sheet in preview mode
+        if arguments.preview:
+            make_preview(bg, overlays, len(slices_list[axis_id]), axis_name, arguments)
+            continue
+    
+        # Loop through the slices
+        for slice_id, slice_n in enumerate(slices_list[axis_id]):
+    
+            png_name = '{}_slice_{:04.0f}.png'.format(axis_name, slice_id)
+    
+            overlay_slices = [ cropping.padded_slice(overlay, slice_id, 0)
+                                for overlay in overlays ]
+    
+            if arguments.crop_option == 'overlay':
+                if not any( np.sum(overlay_slice) > 0 for overlay_slice in overlay_slices ):
+                    continue                         # Make the image ONLY from slices
+                                                     # that have overlay data
+    
+            if pool is not None:
+                work_units.append((axis_name, slice_id, png_name))
+                continue                             # The pool makes it later
+    
+            bg_slice = cropping.padded_slice(bg, slice_id, 0)
+    
+            with profiler.stage('make_png', png_name):
+                png_maker(bg_slice,              # Make the image from each slice
+                            overlay_slices,      # and save in output_directory 
+                            axis_name,
+                            png_name,
+                            arguments)
+    
+    # Now make the pngs with the pool of processes
+    if pool is not None:
+        with profiler.stage('render_parallel'):
+            render_parallel(pool, work_units, arguments)
+        pool.close()
+        pool.join()
+    
+    # Wait for the last pngs to be saved and report the time
+    # and memory used
+    cli.finish(profiler, png_writer, arguments)
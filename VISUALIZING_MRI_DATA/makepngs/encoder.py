@@ -0,0 +1,251 @@
+'''
+Smaller png files for the slices
+
+The slice pngs are saved as 32 bit RGBA but they are made from a gray
+background colormap, one overlay colormap, black outlines and a little
+text. They can nearly always be saved as 8 bit palette (indexed) pngs,
+which are about a quarter of the size:
+  * if a picture has no more than 256 different colors it is saved
+    with exactly those colors, so nothing changes at all
+  * otherwise each color is replaced by the nearest color in a
+    palette built from the background and overlay colormaps (see
+    palette_from_luts), or from evenly spaced colors for overlays that
+    have their own colors (see palette_from_cube)
+
+The zlib compression level can be chosen too, and strip_metadata
+removes the text and other ancillary chunks that matplotlib adds to
+the files it saves. Pngs that matplotlib has already saved can be
+read back and saved again with reencode.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import struct
+import numpy as np
+
+from makepngs import compositor
+
+#==============================================================================
+# The chunks that are needed to draw a png, everything else is metadata
+_CRITICAL_CHUNKS = ( b'IHDR', b'PLTE', b'tRNS', b'IDAT', b'IEND' )
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def palette_from_luts(bg_cmap='gray', overlay_cmap='autumn', overlay_alpha=1.0,
+                        n_bg=160, n_overlay=30, bg_levels=(0.25, 0.5, 0.75),
+                        extra_colors=((0, 0, 0, 255), (255, 255, 255, 255), (0, 0, 0, 0))):
+    '''
+    Build a 256 color RGBA palette (uint8) for pictures of an overlay
+    on top of a background:
+      * n_bg colors from the background colormap
+      * n_overlay colors from the overlay colormap, blended at
+        overlay_alpha on top of each of the bg_levels of the
+        background colormap (the overlay colors on their own if
+        overlay_alpha is 1)
+      * the extra colors (black, white and transparent by default)
+    Any spaces left over are filled with more background colors.
+    overlay_cmap and overlay_alpha can also be lists, one for each of
+    a stack of overlays (see compositor.composite_layers), and then
+    the n_overlay colors are shared out between them.
+    '''
+    bg_lut = compositor.get_lut(bg_cmap)
+
+    if not isinstance(overlay_cmap, (list, tuple)):
+        overlay_cmap, overlay_alpha = [ overlay_cmap ], [ overlay_alpha ]
+
+    colors = []
+    for cmap, alpha in zip(overlay_cmap, overlay_alpha):
+        overlay_lut = compositor.get_lut(cmap)
+        overlay = overlay_lut[np.linspace(0, 255, n_overlay // len(overlay_cmap)).astype(int)]
+
+        if alpha >= 1:
+            colors.append(overlay)
+        else:
+            for level in bg_levels:
+                under = bg_lut[int(level * 255)]
+                colors.append(overlay * alpha + under * (1 - alpha))
+
+    colors = np.round(np.vstack(colors) * 255).astype(np.uint8)
+    colors[:, 3] = 255
+
+    extra = np.array(extra_colors, dtype=np.uint8).reshape(-1, 4)
+
+    n_left = 256 - len(colors) - len(extra)
+    bg = np.round(bg_lut[np.linspace(0, 255, max(n_left, n_bg)).astype(int)] * 255).astype(np.uint8)
+
+    return np.vstack([ extra, bg[:n_left], colors ])[:256]
+
+def palette_from_cube(bg_cmap='gray', n_levels=5,
+                        extra_colors=((0, 0, 0, 255), (255, 255, 255, 255), (0, 0, 0, 0))):
+    '''
+    Build a 256 color RGBA palette (uint8) for pictures of an overlay
+    that has its own colors (eg: the direction colors from
+    makepngs.direction) on top of a background:
+      * n_levels x n_levels x n_levels evenly spaced colors
+      * the extra colors (black, white and transparent by default)
+      * as many background colors as there is space left for
+    '''
+    levels = np.round(np.linspace(0, 255, n_levels))
+    cube = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    colors = np.empty((len(cube), 4), dtype=np.uint8)
+    colors[:, :3] = cube
+    colors[:, 3] = 255
+
+    extra = np.array(extra_colors, dtype=np.uint8).reshape(-1, 4)
+
+    n_left = 256 - len(colors) - len(extra)
+    bg_lut = compositor.get_lut(bg_cmap)
+    bg = np.round(bg_lut[np.linspace(0, 255, max(n_left, 0)).astype(int)] * 255).astype(np.uint8)
+
+    return np.vstack([ extra, bg, colors ])[:256]
+
+def quantise(rgba, palette=None):
+    '''
+    Turn an (h, w, 4) uint8 RGBA picture into (h, w) uint8 indices and
+    an (n, 4) palette. Pictures with 256 colors or fewer keep exactly
+    their own colors. Otherwise every color is replaced by the nearest
+    color in palette (and transparent pixels by its most transparent
+    color). Returns None if a palette is needed but there isn't one.
+    '''
+    h, w = rgba.shape[:2]
+    rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+
+    # Look at each different color only once
+    packed = rgba.view(np.uint32).reshape(-1)
+    colors, inverse = np.unique(packed, return_inverse=True)
+    colors = colors.view(np.uint8).reshape(-1, 4)
+
+    if len(colors) <= 256:
+        return inverse.astype(np.uint8).reshape(h, w), colors
+
+    if palette is None:
+        return None
+
+    palette = np.asarray(palette, dtype=np.uint8)
+
+    # The nearest opaque palette color for each opaque color
+    # and the most transparent palette color for the rest
+    distance = np.zeros((len(colors), len(palette)), dtype=np.float32)
+    for c in range(3):
+        diff = colors[:, c, None].astype(np.float32) - palette[None, :, c]
+        distance += diff * diff
+    distance[:, palette[:, 3] < 128] = np.inf
+    nearest = np.argmin(distance, axis=1)
+
+    nearest[colors[:, 3] < 128] = np.argmin(palette[:, 3])
+
+    return nearest.astype(np.uint8)[inverse].reshape(h, w), palette
+
+def color_table(palette, bits=6):
+    '''
+    A lookup table of the nearest opaque color in palette for every
+    color, with each channel rounded down to bits bits. Use it with
+    lookup, which is much quicker than quantise when a lot of
+    pictures are matched to the same palette.
+    '''
+    palette = np.asarray(palette, dtype=np.uint8)
+    opaque = np.nonzero(palette[:, 3] >= 128)[0]
+
+    # The middle of the range of colors that each level stands for
+    levels = (np.arange(1 << bits) << (8 - bits)) + (1 << (8 - bits)) // 2
+    r, g, b = [ c.reshape(-1).astype(np.float32)
+                    for c in np.meshgrid(levels, levels, levels, indexing='ij') ]
+
+    table = np.empty(len(r), dtype=np.uint8)
+    for start in range(0, len(r), 1 << 14):
+        chunk = slice(start, start + (1 << 14))
+        distance = ( (r[chunk, None] - palette[None, opaque, 0]) ** 2
+                        + (g[chunk, None] - palette[None, opaque, 1]) ** 2
+                        + (b[chunk, None] - palette[None, opaque, 2]) ** 2 )
+        table[chunk] = opaque[np.argmin(distance, axis=1)]
+
+    return table
+
+def lookup(rgba, table, palette, bits=6):
+    '''
+    Turn an (h, w, 4) uint8 RGBA picture into (h, w) uint8 indices in
+    to palette using a table from color_table. Transparent pixels get
+    the most transparent color in the palette.
+    '''
+    shift = 8 - bits
+    key = rgba[..., 0].astype(np.intp) >> shift
+    key <<= bits
+    key |= rgba[..., 1] >> shift
+    key <<= bits
+    key |= rgba[..., 2] >> shift
+
+    indices = table[key]
+    indices[rgba[..., 3] < 128] = np.argmin(np.asarray(palette)[:, 3])
+
+    return indices
+
+def png_bytes(rgba, compress_level=6, palette=None):
+    '''
+    Encode an (h, w, 4) uint8 RGBA picture as the bytes of a png file.
+    If palette is given (eg: from palette_from_luts) it's an 8 bit
+    palette png, otherwise an RGBA png.
+    '''
+    if palette is not None:
+        indices, colors = quantise(rgba, palette)
+        return compositor.indexed_png_bytes(indices, colors, compress_level=compress_level)
+
+    return compositor.png_bytes(rgba, compress_level=compress_level)
+
+def write_png(fname, rgba, compress_level=6, palette=None):
+    '''
+    Save an (h, w, 4) uint8 RGBA picture as a png file (see png_bytes)
+    '''
+    if palette is not None:
+        indices, colors = quantise(rgba, palette)
+        compositor.write_indexed_png(fname, indices, colors, compress_level=compress_level)
+    else:
+        compositor.write_png(fname, rgba, compress_level=compress_level)
+
+def to_rgba_uint8(image):
+    '''
+    Convert a picture read by matplotlib (floats from 0 to 1, with or
+    without an alpha channel) to an (h, w, 4) uint8 RGBA array
+    '''
+    if image.dtype != np.uint8:
+        image = np.round(image * 255).astype(np.uint8)
+
+    # Pictures without an alpha channel are completely opaque
+    if image.shape[2] == 3:
+        opaque = np.empty(image.shape[:2] + (1,), dtype=np.uint8)
+        opaque.fill(255)
+        image = np.concatenate([ image, opaque ], axis=2)
+
+    return image
+
+def reencode(fname, compress_level=6, palette=None):
+    '''
+    Read a png file (eg: one saved by plt.savefig) and save it again,
+    in place, with write_png
+    '''
+    import matplotlib.image as mpimg
+
+    image = to_rgba_uint8(mpimg.imread(fname))
+
+    write_png(fname, image, compress_level=compress_level, palette=palette)
+
+def strip_metadata(fname):
+    '''
+    Remove every chunk that isn't needed to draw the picture (eg: the
+    "Software" text and the resolution that matplotlib adds) from a
+    png file, in place
+    '''
+    with open(fname, 'rb') as f:
+        data = f.read()
+
+    chunks = [ data[:8] ]
+    position = 8
+    while position < len(data):
+        length, = struct.unpack('>I', data[position : position + 4])
+        end = position + 12 + length
+        if data[position + 4 : position + 8] in _CRITICAL_CHUNKS:
+            chunks.append(data[position:end])
+        position = end
+
+    with open(fname, 'wb') as f:
+        f.write(b''.join(chunks))
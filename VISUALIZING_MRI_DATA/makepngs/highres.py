@@ -0,0 +1,570 @@
+'''
+The code behind MakePngs_HighRes.py: pngs of every slice of an overlay
+(eg: a brain extracted image) on top of a high resolution background
+
+Run it with MakePngs_HighRes.py, which has the help text for all the
+options. main() reads the command line and makes the pngs.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+import os
+import argparse
+from makepngs import cli
+from makepngs import compositor
+from makepngs import encoder
+from makepngs import loading
+from makepngs import profiling
+from makepngs import cropping
+from makepngs import orientation
+from makepngs import preview
+from makepngs import tiles
+from makepngs.pairs import hardcoded_variables, load_data, load_data_lazy, load_data_chunked, rotate_data
+from makepngs.slice_figure import SliceFigure
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def setup_argparser():
+    '''
+    # CODE TO READ ARGUMENTS FROM THE COMMAND LINE AND SET OPTIONS
+    # ALSO INCLUDES SOME HELP TEXT
+    '''
+    
+    # Build a basic parser.
+    help_text = ('Overlay a one nifti image (of the same size) on top of a '
+                    + 'background nifti image (eg: highre_brain and highres) '
+                    + 'and create pngs of all slices in all directions '
+					+ '(axial, coronal, sagittal)')
+    
+    sign_off = 'Author: Kirstie Whitaker <kw401@cam.ac.uk>'
+    
+    parser = argparse.ArgumentParser(description=help_text, epilog=sign_off)
+    
+    # Now add the arguments
+    # Required argument: background file
+    parser.add_argument(dest='background_file', 
+                            type=str,
+                            metavar='bg_fname',
+                            help='File name for background .nii.gz image')
+    
+    # Required argument: overlay file
+    parser.add_argument(dest='overlay_file', 
+                            type=str,
+                            metavar='overlay_fname',
+                            help='File name for overlay .nii.gz image')
+    
+    # Required argument: output dir
+    parser.add_argument(dest='output_dir', 
+                            type=str,
+                            metavar='output_dirname',
+                            help='Output directory for .png images')
+    
+    # Optional argument: verbosity
+    parser.add_argument('-v', '--verbose',
+                            dest='verbose',
+                            action='store_true',
+                            help='Print verbose updates of each step to the screen')
+                            
+    # Optional argument: colormap1
+    #       default: autumn
+    parser.add_argument('-cm1', '--colormap1',
+                            dest='colormap1',
+                            type=str,
+                            default='gray',
+                            metavar='colormap1',
+                            help= ('Colormap used to plot background data. Default is gray. '
+                                    + 'See wiki.scipy.org/Cookbook/Matplotlib/Show_colormaps '
+                                    + 'for all possible colormaps') )
+                                    
+    # Optional argument: colormap2
+    #       default: autumn
+    parser.add_argument('-cm2', '--colormap2',
+                            dest='colormap2',
+                            type=str,
+                            default='autumn',
+                            metavar='colormap2',
+                            help= ('Colormap used to plot overlay data. Default is autumn. '
+                                    + 'See wiki.scipy.org/Cookbook/Matplotlib/Show_colormaps '
+                                    + 'for all possible colormaps') )
+                                    
+    # Optional argument: crop_option
+    #       default: background
+    parser.add_argument('-cr', '--crop_option',
+                            dest='crop_option',
+                            type=str,
+                            default='background',
+                            choices=['background', 'overlay'],
+                            metavar='crop_option',
+                            help='Choose to crop either the background image, or the overlay image. Default is background')
+
+    # Optional argument: textcolor_R
+    #       default: black
+    parser.add_argument('-tc2', '--textcolor_R',
+                            dest='textcolor_R',
+                            type=str,
+                            default='k',
+                            metavar='textcolor_R',
+                            help='Color for side indicator (R) on axial slices. Default is black. Enter "none" to leave blank')
+    
+    # Optional argument: transparency
+    #       default: False
+    parser.add_argument('-tr', '--transparency',
+                            dest='transparency',
+                            action='store_true',
+                            help='Make background transparent. Default is black')
+    
+    # Optional argument: axial
+    #       default: False
+    parser.add_argument('-ax', '--axial_only',
+                            dest='axial',
+                            action='store_true',
+                            help='Only create axial pngs. Default is false - create all 3 axes')
+                           
+    # Optional argument: contour
+    #       default: True
+    parser.add_argument('-co', '--contour',
+                            dest='contour',
+                            action='store_true',
+                            help='Add a contour line around the overlay file. Default is false.')
+                           
+    # Optional arguments: renderer and lazy
+    cli.add_renderer_arguments(parser)
+    
+    # Optional arguments: preview and preview_step
+    cli.add_preview_arguments(parser)
+    
+    # Optional argument: deepzoom
+    #       default: False
+    parser.add_argument('-dz', '--deepzoom',
+                            dest='deepzoom',
+                            action='store_true',
+                            help=('Save each slice as a deep zoom (DZI) pyramid of png tiles instead '
+                                    + 'of one large png. Tiles that are all background are skipped '
+                                    + 'and tiles_index.json lists the tiles at every level') )
+    
+    # Optional argument: tile_size
+    #       default: 256
+    parser.add_argument('-ts', '--tile_size',
+                            dest='tile_size',
+                            type=int,
+                            default=256,
+                            metavar='tile_size',
+                            help='Width and height of the deep zoom tiles in pixels. Default is 256')
+    
+    # Optional arguments: profiling and saving the pngs
+    cli.add_output_arguments(parser,
+                                needs='the numpy or persistent renderer and can\'t be used with --deepzoom')
+    
+    # Optional argument: max_memory
+    #       default: None
+    parser.add_argument('-mm', '--max_memory',
+                            dest='max_memory',
+                            type=float,
+                            default=None,
+                            metavar='MB',
+                            help=('Read and draw the volumes a slab of slices at a time so that the '
+                                    + 'voxel data in memory at once stays within this many MB, whatever '
+                                    + 'the size of the volumes. The slab along each axis is read straight '
+                                    + 'from the files (uncompressed .nii files are memory mapped, which is '
+                                    + 'much quicker). Can\'t be used with --preview') )
+    
+    arguments = parser.parse_args()
+    
+    # The pngs are added to the container and the animations by the
+    # png_writer so they can't be saved by matplotlib or as tiles
+    if (arguments.container or arguments.animate) and (arguments.renderer == 'matplotlib'
+                                                        or arguments.deepzoom):
+        cli.error(parser, '--container and --animate need the numpy or persistent renderer and no --deepzoom')
+    
+    # The previews are block averaged from the whole volume
+    if arguments.max_memory is not None and arguments.preview:
+        cli.error(parser, '--max_memory can\'t be used with --preview')
+    
+    return arguments, parser
+
+def make_png(bg_slice, overlay_slice,
+                        axis_name, 
+                        png_name, arguments):
+    '''
+    Makes a png image from two slices overlayed and saves to the
+    output directory 
+    The transparency option makes the background transparent
+    or not
+    The colormap options (1 and 2) are the colors that the background and
+    overlay files will be presented in
+    '''
+
+    # Set up the figure
+    plt = cli.pyplot()
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    
+    # If you don't want a transparent background, add in a
+    # black background first
+    if not arguments.transparency:
+        black = ax.imshow(np.ones_like(bg_slice),
+                                interpolation='none',
+                                cmap='gray')
+    # Mask the data
+    m_overlay_slice = np.ma.masked_where(overlay_slice==0, overlay_slice)
+
+    # First show the background slice
+    im1 = ax.imshow(bg_slice,
+                        interpolation='none',
+                        cmap=arguments.colormap1,
+                        vmin = 0,
+                        vmax = 1)
+    
+    # Then overlay the overlay_slice
+    im2 = ax.imshow(m_overlay_slice,
+                        interpolation='none',
+                        cmap=arguments.colormap2,
+                        vmin = 0,
+                        vmax = 1)
+               
+    if arguments.contour:
+        # Add a black line around the edge of the background image
+        # it makes the brain look nicer :)
+        CS = plt.contour(overlay_slice, [0.01, 1], linewidths=3, colors='k')
+         
+    # Put a little "R" in the middle right side of the image 
+    # if you're making axial slices
+    if axis_name == 'axial' and not arguments.textcolor_R == 'none':
+        text = ax.text(0.99, 0.5 , 'R',
+        horizontalalignment='right',
+        verticalalignment='center',
+        transform=ax.transAxes,
+        color = arguments.textcolor_R)
+    
+    # Turn off axis labels
+    ax.get_xaxis().set_visible(False)
+    ax.get_yaxis().set_visible(False)
+    ax.set_frame_on(False)
+
+    # Save the figure
+    with profiler.stage('savefig', png_name):
+        cli.save_figure(os.path.join(arguments.output_dir, png_name), arguments, png_writer)
+    
+    plt.close()
+
+def make_png_numpy(bg_slice, overlay_slice,
+                        axis_name,
+                        png_name, arguments):
+    '''
+    Makes the same png as make_png but composites the two slices
+    directly with numpy instead of building a matplotlib figure
+    '''
+    rgba = composite_png(bg_slice, overlay_slice, axis_name, arguments)
+    
+    # Save the png
+    with profiler.stage('savefig', png_name):
+        png_writer.write(os.path.join(arguments.output_dir, png_name), rgba)
+
+def composite_png(bg_slice, overlay_slice,
+                        axis_name, arguments,
+                        scale=4, text_size=2):
+    '''
+    Composite the picture that make_png_numpy saves and return it
+    as an RGBA array. scale is the number of pixels for each voxel.
+    '''
+    # Add a black line around the edge of the overlay image
+    # if you've asked for one
+    outline = None
+    if arguments.contour:
+        outline = overlay_slice >= 0.01
+    
+    # Overlay the overlay slice on the background slice
+    rgba = compositor.composite_slice(bg_slice, overlay_slice,
+                                        bg_cmap=arguments.colormap1,
+                                        overlay_cmap=arguments.colormap2,
+                                        overlay_alpha=1.0,
+                                        outline=outline,
+                                        transparency=arguments.transparency,
+                                        scale=scale)
+    
+    # Put a little "R" in the middle right side of the image 
+    # if you're making axial slices
+    if axis_name == 'axial':
+        compositor.draw_text(rgba, 'R', arguments.textcolor_R,
+                                0.99, 0.5, ha='right', va='center',
+                                size=text_size)
+    
+    return rgba
+
+def make_preview(bg, overlay, n_slices, axis_name, arguments):
+    '''
+    Make one small contact sheet from every preview_step-th slice
+    of the (block averaged and rotated) data
+    '''
+    tiles = []
+    for slice_id in range(0, n_slices, arguments.preview_step):
+        
+        overlay_slice = cropping.padded_slice(overlay, slice_id, 5)
+        
+        if arguments.crop_option == 'overlay':
+            if not np.sum(overlay_slice) > 0:
+                continue
+        
+        tiles.append(composite_png(cropping.padded_slice(bg, slice_id, 5),
+                                    overlay_slice,
+                                    axis_name,
+                                    arguments,
+                                    scale=2, text_size=1))
+    
+    if not tiles:
+        return
+    
+    png_name = 'preview_{}.png'.format(axis_name)
+    compositor.write_png(os.path.join(arguments.output_dir, png_name),
+                            preview.contact_sheet(tiles, transparency=arguments.transparency))
+    
+    if arguments.verbose:
+        print('    ' + png_name)
+
+def make_png_deepzoom(bg_slice, overlay_slice,
+                        axis_name,
+                        png_name, arguments):
+    '''
+    Composites the same picture as make_png_numpy but saves it as
+    a deep zoom pyramid of tiles (named after the png) instead
+    '''
+    rgba = composite_png(bg_slice, overlay_slice, axis_name, arguments)
+    
+    # The color of an empty part of the picture, tiles that
+    # are only this color aren't saved
+    empty = np.zeros((1, 1))
+    background = composite_png(empty, empty, 'sagittal', arguments, scale=1)[0, 0]
+    
+    with profiler.stage('savefig', png_name):
+        pyramids.append(tiles.write_pyramid(rgba,
+                                            arguments.output_dir,
+                                            os.path.splitext(png_name)[0],
+                                            tile_size=arguments.tile_size,
+                                            background=tuple(background)))
+
+def make_png_persistent(bg_slice, overlay_slice,
+                        axis_name,
+                        png_name, arguments):
+    '''
+    Makes the same picture as make_png but only builds one matplotlib
+    figure for each axis orientation and reuses it for every slice
+    '''
+    if not axis_name in slice_figures:
+        # Add a black line around the edge of the overlay image
+        # if you've asked for one
+        contour_levels = None
+        if arguments.contour:
+            contour_levels = [0.01, 1]
+        
+        # Only put an "R" on axial slices
+        textcolor_R = None
+        if axis_name == 'axial':
+            textcolor_R = arguments.textcolor_R
+        
+        slice_figures[axis_name] = SliceFigure(bg_slice.shape,
+                                                bg_cmap=arguments.colormap1,
+                                                overlay_cmap=arguments.colormap2,
+                                                overlay_alpha=1.0,
+                                                contour_levels=contour_levels,
+                                                textcolor_R=textcolor_R,
+                                                transparency=arguments.transparency)
+    
+    fig = slice_figures[axis_name]
+    fig.update(bg_slice, overlay_slice, contour_slice=overlay_slice)
+    with profiler.stage('savefig', png_name):
+        cli.save_slice_figure(fig, os.path.join(arguments.output_dir, png_name), arguments, png_writer)
+
+def slab_slices(bg_vol, overlay_vol, scales, box, axis_name, arguments, scale=4):
+    '''
+    Cut the padded slices of one axis out of the two volumes a slab at
+    a time. The slabs are as big as they can be while the slabs of both
+    volumes and the pictures that are being drawn and saved fit within
+    max_memory
+    '''
+    axis_orientation = xyz_dict['orientation'][axis_name]
+    axis = axis_orientation.permutation[2]
+    plane_shape = [ sl.stop - sl.start + 10 for i, sl in enumerate(box) if i != axis ]
+    
+    # Every picture being drawn, waiting for the png_writer or being
+    # saved is scale times bigger on each side and 4 bytes per pixel,
+    # and it's composited from 16 bytes per voxel
+    n_pictures = 1 + png_writer.queue_size + png_writer.n_threads
+    reserved_mb = np.prod(plane_shape) * (16 + n_pictures * scale * scale * 4) / (1024. * 1024.)
+    
+    # Each voxel of the two slabs is read as up to 8 bytes (nibabel
+    # scales the data to float64) and kept as a 4 byte float32
+    slab_size = loading.slab_size(plane_shape, arguments.max_memory,
+                                    bytes_per_voxel=2 * (8 + 4),
+                                    reserved_mb=reserved_mb)
+    
+    if arguments.verbose:
+        print('    Reading {} slices at a time'.format(slab_size))
+    
+    return loading.SlabSlicer([ bg_vol, overlay_vol ], box, axis_orientation, slab_size,
+                                scales=scales, pad=5)
+
+def padded_slices(bg, overlay, n_slices):
+    '''
+    Cut the padded slices of one axis out of the two (rotated) volumes
+    in memory, one at a time
+    '''
+    for slice_id in range(n_slices):
+        yield slice_id, [ cropping.padded_slice(bg, slice_id, 5),
+                            cropping.padded_slice(overlay, slice_id, 5) ]
+
+
+#==============================================================================
+# NOW THE FUN BEGINS
+def main():
+    '''
+    Read the arguments from the command line and make the pngs
+    '''
+    # The functions above share these with main
+    global profiler, png_writer, slice_figures, pyramids, xyz_dict
+    
+    profiler = profiling.Profiler() # Keep track of the time and memory
+                                    # used by each stage
+    
+    with profiler.stage('setup_argparser'):
+        arguments, parser = setup_argparser() # Read arguments from command line
+    
+    cli.start_profiler(profiler, arguments)
+    
+    cli.make_output_dir(arguments.output_dir)     # Make the output directory if
+                                                  # it doesn't already exist
+    
+    xyz_dict = hardcoded_variables() # Define some of the hardcoded
+                                                     # variables
+    
+    with profiler.stage('load_data'):
+        if arguments.max_memory is not None:
+            bg_vol, overlay_vol, scales, box, zooms, shape = load_data_chunked(arguments, parser)
+                                                      # Only open the data, it's read
+                                                      # a slab at a time as it's drawn
+            offset = [ sl.start for sl in box ]
+        elif arguments.lazy:
+            bg, overlay, zooms, shape, offset = load_data_lazy(arguments, parser)
+                                                      # Only load the data you'll draw
+        else:
+            bg, overlay, zooms = load_data(arguments, parser) # Load data
+            shape, offset = bg.shape, (0, 0, 0)
+    
+    # Block average the data for the previews
+    if arguments.preview:
+        bg = preview.block_average(bg, arguments.preview, offset)[0]
+        overlay, offset = preview.block_average(overlay, arguments.preview, offset)
+        shape = preview.averaged_shape(shape, arguments.preview)
+        zooms = tuple( z * arguments.preview for z in zooms[:3] )
+    
+    xyz_dict['shape'] = shape # Add shape into your xyz_dict
+    
+    xyz_dict['zooms'] = zooms # Add voxel dimensions to your xyz_dict
+    
+    xyz_dict['orientation'] = orientation.from_affine(loading.load_image(arguments.background_file).affine)
+                                      # Work out which way up each
+                                      # axis' slices go from the affine
+    
+    with profiler.stage('crop_data'):
+        if arguments.max_memory is not None:
+            slices_list = [ list(range(-5, sl.stop - sl.start + 5)) for sl in box ]
+                                                      # The data is already cropped
+                                                      # to the box, just add the 5
+                                                      # slices of padding
+        elif arguments.crop_option == 'overlay':
+            overlay_cropped, bg_cropped, slices_list = cropping.crop_data(overlay, bg, pad=5)
+                                                      # Crop data (but keep slice_ids)
+                                                      # the 5 slices of padding on all
+                                                      # sides are added when each slice
+                                                      # is drawn
+        else:
+            bg_cropped, overlay_cropped, slices_list = cropping.crop_data(bg, overlay, pad=5)
+                                                      # Crop data (but keep slice_ids)
+                                                      # the 5 slices of padding on all
+                                                      # sides are added when each slice
+                                                      # is drawn
+    
+    # Make the slice_ids relative to the whole volume
+    slices_list = [ [ n + offset[i] for n in sl ] for i, sl in enumerate(slices_list) ]
+    
+    # Figure out which axes to make pngs of
+    if arguments.axial:
+        axes_range = range(2,3)
+    else:
+        axes_range = range(3)
+    
+    # Choose how to draw the pngs
+    png_makers = { 'matplotlib': make_png,
+                    'persistent': make_png_persistent,
+                    'numpy': make_png_numpy }
+    png_maker = png_makers[arguments.renderer]
+    slice_figures = {}
+    
+    # The palette for 8 bit pngs (if you want smaller files) and the
+    # animations is made from the same colormaps that the pictures are
+    # drawn with
+    palette = encoder.palette_from_luts(arguments.colormap1, arguments.colormap2, overlay_alpha=1.0)
+    
+    # Save the pngs in the background while the next ones are drawn
+    # (or add them to a container file and the animations)
+    png_writer = cli.make_png_writer(arguments, palette)
+    
+    # Or save deep zoom pyramids of tiles
+    pyramids = []
+    if arguments.deepzoom:
+        png_maker = make_png_deepzoom
+    
+    # Loop through the axes
+    for axis_id in axes_range:
+    
+        axis_name = xyz_dict['name'][axis_id] # Get the name of the axis
+        print(axis_name.capitalize())        # and print to screen
+    
+        shape = xyz_dict['shape'][axis_id] # You also need the shape of the array
+    
+        with profiler.stage('rotate_data', axis_name):
+            if arguments.max_memory is not None:
+                slices = slab_slices(bg_vol,        # Read the slices a slab
+                                        overlay_vol,    # at a time
+                                        scales,
+                                        box,
+                                        axis_name,
+                                        arguments)
+            else:
+                bg, overlay, slices_list = rotate_data(bg_cropped, # Rotate the data so your
+                                                overlay_cropped,   # axis of interest is last 
+                                                slices_list,       # and the slices look good
+                                                axis_name,
+                                                shape,
+                                                xyz_dict['orientation'])
+                slices = padded_slices(bg, overlay, len(slices_list[axis_id]))
+    
+        # Only make the contact sheet in preview mode
+        if arguments.preview:
+            make_preview(bg, overlay, len(slices_list[axis_id]), axis_name, arguments)
+            continue
+    
+        # Loop through the slices
+        for slice_id, (bg_slice, overlay_slice) in slices:
+    
+            png_name = '{}_slice_{:04.0f}.png'.format(axis_name, slice_id)
+    
+            if arguments.crop_option == 'overlay':
+                if not np.sum(overlay_slice) > 0:
+                    continue                         # Make the image ONLY from slices
+                                                     # that have overlay data
+    
+            with profiler.stage('make_png', png_name):
+                png_maker(bg_slice,                # Make the image from each slice
+                            overlay_slice,         # and save in output_directory 
+                            axis_name,
+                            png_name,
+                            arguments)
+    
+    # Write out the list of all the tiles
+    if arguments.deepzoom:
+        tiles.write_index(arguments.output_dir, pyramids)
+    
+    # Wait for the last pngs to be saved and report the time
+    # and memory used
+    cli.finish(profiler, png_writer, arguments)
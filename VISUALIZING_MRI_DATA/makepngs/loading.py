@@ -0,0 +1,257 @@
+'''
+Memory friendly loading of nifti images for the MakePngs_* scripts
+
+load_data in the scripts calls get_data() on both images and then makes
+a few full size float64 copies of each volume while it normalises them.
+The functions here instead:
+  * check the shape and voxel size of the images from their headers
+    before any voxel data is read
+  * memory map uncompressed .nii files through nibabel's dataobj
+  * read the data in slabs along the last axis (which is contiguous
+    on disk) to find the maximum value and the bounding box of the
+    voxels that will be drawn
+  * only convert the part of the volume inside that bounding box
+    to float32
+  * read 4D images (eg: one volume per contrast or timepoint) one
+    3D volume at a time
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+from makepngs.cropping import occupancy, occupied_box
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def load_image(fname, mmap=True):
+    '''
+    Load a nifti image without reading any of its voxel data.
+    Uncompressed (.nii) files are memory mapped.
+    '''
+    import nibabel as nib
+    return nib.load(fname, mmap=mmap)
+
+def n_volumes(img):
+    '''
+    The number of 3D volumes in an image: the length of the fourth
+    dimension of a 4D image, or None for a 3D image
+    '''
+    shape = img.header.get_data_shape()
+
+    if len(shape) < 4:
+        return None
+
+    return shape[3]
+
+def check_same_space(img1, img2):
+    '''
+    Raise a ValueError if the two images don't have the same shape
+    and voxel dimensions. Only the first three (spatial) dimensions
+    are compared so a 4D image can be checked against a 3D one.
+    Only the headers are used.
+    '''
+    if not img1.header.get_data_shape()[:3] == img2.header.get_data_shape()[:3]:
+        raise ValueError('files are not the same shape')
+
+    if not img1.header.get_zooms()[:3] == img2.header.get_zooms()[:3]:
+        raise ValueError('files do not have the same voxel dimensions')
+
+def peak_memory_mb():
+    '''
+    Peak resident memory of this process so far, in MB
+    '''
+    import resource
+    import sys
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, OS X reports bytes
+    if sys.platform == 'darwin':
+        return peak / 1024. / 1024.
+    return peak / 1024.
+
+def share_array(data):
+    '''
+    Copy an array into a block of shared memory so that it can be
+    read by worker processes (eg: a multiprocessing.Pool that is
+    started afterwards) without pickling it. Read it back with
+    np.frombuffer(shared, dtype=data.dtype).reshape(data.shape)
+    '''
+    import multiprocessing as mp
+
+    # Keep the same data type (float64, or float32 if the data was
+    # loaded lazily)
+    shared = mp.RawArray(data.dtype.char, data.size)
+    shared_data = np.frombuffer(shared, dtype=data.dtype).reshape(data.shape)
+    shared_data[...] = data
+
+    return shared
+
+class LazyVolume(object):
+    '''
+    A 3D nifti image that is only read a slab at a time
+
+    img         the (ideally memory mapped) nibabel image
+    slab_size   number of slices along the last axis read at once
+    volume      which volume to read if img is 4D
+    '''
+    def __init__(self, img, slab_size=16, volume=None):
+        self.dataobj = img.dataobj
+        self.volume = volume
+        self.shape = tuple(img.header.get_data_shape()[:3])
+        self.zooms = img.header.get_zooms()[:3]
+        self.slab_size = slab_size
+        self._max = None
+
+    def _get(self, box):
+        '''
+        Read the voxels inside a box of three slices (from the
+        right volume if the image is 4D)
+        '''
+        if self.volume is not None:
+            box = box + (self.volume,)
+
+        return np.asarray(self.dataobj[box])
+
+    def iter_slabs(self):
+        '''
+        Yield (z_start, raw slab) for slabs along the last axis
+        '''
+        for z in range(0, self.shape[2], self.slab_size):
+            yield z, self._get((slice(None), slice(None), slice(z, z + self.slab_size)))
+
+    def max(self):
+        '''
+        The maximum value in the volume
+        '''
+        if self._max is None:
+            self._max = max(float(np.max(slab)) for z, slab in self.iter_slabs())
+
+        return self._max
+
+    def bounding_box(self, threshold=None):
+        '''
+        Return a tuple of three slices that covers every voxel that is at
+        least threshold (or every non-zero voxel if threshold is None).
+        Returns None if there aren't any.
+        '''
+        occupied = [ np.zeros(n, dtype=bool) for n in self.shape ]
+
+        for z, slab in self.iter_slabs():
+            if threshold is None:
+                mask = slab != 0
+            else:
+                mask = slab >= threshold
+            slab_occupied = occupancy(mask)
+            occupied[0] |= slab_occupied[0]
+            occupied[1] |= slab_occupied[1]
+            occupied[2][z : z + slab.shape[2]] = slab_occupied[2]
+
+        return occupied_box(occupied)
+
+    def read(self, box=None, scale=1.):
+        '''
+        Read the voxels inside box (the whole volume if box is None)
+        as a float32 array multiplied by scale
+        '''
+        if box is None:
+            box = (slice(None),) * 3
+
+        data = self._get(tuple(box)).astype(np.float32)
+        if scale != 1:
+            data *= np.float32(scale)
+
+        return data
+
+def slab_size(plane_shape, max_memory_mb, bytes_per_voxel=24, reserved_mb=0):
+    '''
+    The number of slices (each plane_shape voxels) that can be read at
+    once while staying within max_memory_mb. bytes_per_voxel is what
+    each voxel of a slab costs while it is read and reserved_mb is
+    kept back for everything else (eg: drawing the pngs). It's never
+    less than one slice.
+    '''
+    budget = (max_memory_mb - reserved_mb) * 1024. * 1024.
+    plane_bytes = float(np.prod(plane_shape)) * bytes_per_voxel
+
+    return max(1, int(budget // plane_bytes))
+
+class SlabSlicer(object):
+    '''
+    Cut the slices of one axis out of LazyVolumes a slab at a time so
+    that only slab_size slices of each volume are in memory at once
+
+    volumes         the LazyVolumes to cut the same slices from
+    box             the three slices of the volumes to draw (eg: from
+                    LazyVolume.bounding_box)
+    orientation     the orientation.Orientation of the axis
+    slab_size       the number of slices read at once
+    scales          what each volume is multiplied by (eg: 1 / its max)
+    pad             the number of pad slices and voxels around the box,
+                    as in cropping.padded_slice
+
+    The slices come out in the same order, and exactly the same, as
+    padded_slice gives them from the whole box read with
+    LazyVolume.read and turned with orientation.OrientedVolume.
+    '''
+    def __init__(self, volumes, box, orientation, slab_size, scales=None, pad=0):
+        self.volumes = volumes
+        self.box = tuple(box)
+        self.orientation = orientation
+        self.slab_size = slab_size
+        self.scales = scales or [ 1. ] * len(volumes)
+        self.pad = pad
+
+        self.axis = orientation.permutation[2]
+        self.n_slices = self.box[self.axis].stop - self.box[self.axis].start + 2 * pad
+
+    def __len__(self):
+        return self.n_slices
+
+    def _read_slab(self, start, stop):
+        '''
+        Read the part of the box from start to stop (counted from the
+        start of the box) along the axis from every volume
+        '''
+        box = list(self.box)
+        box[self.axis] = slice(self.box[self.axis].start + start,
+                                self.box[self.axis].start + stop)
+
+        # nibabel can't read an empty slab
+        if stop <= start:
+            shape = [ sl.stop - sl.start for sl in box ]
+            shape[self.axis] = 0
+            return [ np.zeros(shape, dtype=np.float32) for volume in self.volumes ]
+
+        return [ volume.read(box, scale)
+                    for volume, scale in zip(self.volumes, self.scales) ]
+
+    def __iter__(self):
+        '''
+        Yield (slice_id, [ padded 2D slice of each volume ])
+        '''
+        n_box = self.n_slices - 2 * self.pad
+
+        for first in range(0, self.n_slices, self.slab_size):
+            slice_ids = range(first, min(first + self.slab_size, self.n_slices))
+            indices = [ self.orientation.source_index(slice_id, n_box, self.pad)
+                            for slice_id in slice_ids ]
+
+            # Consecutive slices come from one block of the box
+            # (backwards if the axis is flipped). Pad slices don't
+            # need any of it.
+            inside = [ index for index in indices if index is not None ]
+            start = 0
+            if inside:
+                start = min(inside)
+                slabs = self._read_slab(start, max(inside) + 1)
+            else:
+                slabs = self._read_slab(0, 0)
+
+            for slice_id, index in zip(slice_ids, indices):
+                if index is not None:
+                    index -= start
+                yield slice_id, [ self.orientation.cut_at(slab, index, self.pad)
+                                    for slab in slabs ]
+
+            del slabs
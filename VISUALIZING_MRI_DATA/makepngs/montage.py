@@ -0,0 +1,161 @@
+'''
+Combined (lightbox) strips of slices, built straight from the volume
+
+CombiningPngs.py reads back the single slice pngs that the MakePngs
+scripts have written, decodes them and pastes a selection of them side
+by side. The functions here make the same strips from the slices that
+are already in memory, so only the combined pngs are written.
+
+The slice selections are the same as the ones in CombiningPngs.py:
+  * whole     every other slice from the 0 and 5 mm sagittal slices
+  * right     the sagittal slices in the right hemisphere (0 and 5 mm)
+  * left      the sagittal slices in the left hemisphere (0 and 5 mm)
+  * syn       the synesthesia figure sets of 10 mm sagittal and
+              axial slices
+Each selection is a list of (slice_id, mni) pairs in slice_id order.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+from makepngs import compositor
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def mni_label(mni):
+    '''
+    The mni value as it appears at the end of the single slice png
+    names (eg: +010, -045)
+    '''
+    return '{:+04.0f}'.format(mni)
+
+def every(slices, step):
+    '''
+    The (slice_id, mni) pairs whose mni value is a multiple of step mm
+    '''
+    return [ (slice_id, mni) for slice_id, mni in slices
+                if int(mni_label(mni)) % step == 0 ]
+
+def select_strips(axis_name, slices):
+    '''
+    Pick the selections of slices that CombiningPngs.py would combine
+    for one axis. slices is a list of (slice_id, mni) pairs for all
+    the slices that could be drawn, in slice_id order.
+    Returns a list of selections, empty ones are left out.
+    '''
+    slices = sorted(slices)
+    strips = []
+
+    if axis_name == 'sagittal':
+        slices_0 = every(slices, 10)
+        slices_0_5 = every(slices, 5)
+
+        half = len(slices_0_5) // 2
+
+        strips.append(slices_0_5[2:-2:2])             # whole brain
+        strips.append(slices_0_5[4:half])             # right hemisphere
+        strips.append(slices_0_5[half:-4])            # left hemisphere
+        strips.append(slices_0[3:6] + slices_0[-6:-3]) # synesthesia
+
+    elif axis_name == 'axial':
+        strips.append(every(slices, 10)[4:11])       # synesthesia
+
+    return [ sorted(strip) for strip in strips if len(strip) > 0 ]
+
+def strip_name(axis_name, strip):
+    '''
+    Name the combined png in the same way as CombiningPngs.py:
+    combined_<sliceorientation>_<lowest_mni>_to_<highest_mni>.png
+    '''
+    return 'combined_{}_{}_to_{}.png'.format(axis_name,
+                                                mni_label(strip[-1][1]),
+                                                mni_label(strip[0][1]))
+
+def paste_over(canvas, tile, x):
+    '''
+    Alpha blend a uint8 RGBA tile on to a uint8 RGBA canvas, in place,
+    with its left edge at column x. Transparent parts of the tile let
+    the slices underneath show through.
+    '''
+    h, w = tile.shape[:2]
+    region = canvas[:h, x:x + w]
+
+    alpha = tile[..., 3:].astype(np.float32) / 255
+    region_alpha = region[..., 3:].astype(np.float32) / 255
+
+    out_alpha = alpha + region_alpha * (1 - alpha)
+    weight = np.where(out_alpha > 0, out_alpha, 1)
+
+    rgb = (tile[..., :3] * alpha + region[..., :3] * region_alpha * (1 - alpha)) / weight
+
+    region[..., :3] = np.round(rgb).astype(np.uint8)
+    region[..., 3:] = np.round(out_alpha * 255).astype(np.uint8)
+
+    return canvas
+
+def combine(tiles, mnis, axis_name, width_ratio=1.3,
+                text_color='w', transparency=False, text_size=3):
+    '''
+    Put the (h, w, 4) uint8 RGBA tiles of one selection side by side
+    in order of increasing mni value. Neighbouring tiles overlap so
+    that each one takes up 1 / width_ratio of its width, as they do
+    in CombiningPngs.py. The tiles must have transparent backgrounds.
+
+    Sagittal slices in the left hemisphere (negative mni) are flipped
+    so that they face the other way. Slices nearer the middle of the
+    brain are drawn on top. Axial strips are labelled L and R.
+    '''
+    n = len(tiles)
+    h, w = tiles[0].shape[:2]
+
+    # The distance between the left edges of neighbouring tiles
+    diff = width_ratio - 1
+    step = w * (1 - diff / n) / width_ratio
+
+    positions = [ int(round(i * step)) for i in range(n) ]
+
+    canvas = np.zeros((h, positions[-1] + w, 4), dtype=np.uint8)
+    if not transparency:
+        canvas[..., 3] = 255
+
+    order = np.argsort(mnis, kind='mergesort')
+
+    # The order that the tiles are drawn in
+    if axis_name == 'sagittal':
+        drawing_order = sorted(order, key=lambda i: -abs(mnis[i]))
+    else:
+        drawing_order = list(order)
+
+    column = dict( (tile_id, positions[i]) for i, tile_id in enumerate(order) )
+
+    for tile_id in drawing_order:
+        tile = tiles[tile_id]
+        mni = mnis[tile_id]
+
+        text_x, text_y = 0.5, 0.0
+        if axis_name == 'sagittal':
+            text_x, text_y = 0.75, 0.07
+            # Flip sagittal slices that are on the left
+            if mni < 0:
+                tile = tile[:, ::-1].copy()
+                text_x = 0.25
+        else:
+            tile = tile.copy()
+
+        # Write the MNI value on to the slice
+        letter = { 'sagittal': 'X', 'coronal': 'Y', 'axial': 'Z' }[axis_name]
+        compositor.draw_text(tile, '{} = {:1.0f}'.format(letter, mni), text_color,
+                                text_x, text_y, ha='center', va='bottom',
+                                size=text_size)
+
+        paste_over(canvas, tile, column[tile_id])
+
+    # Add the R and L text indicators to the right and left of the image
+    if axis_name == 'axial':
+        compositor.draw_text(canvas, 'L', text_color, 0.0, 0.5,
+                                ha='left', va='center', size=text_size + 1)
+        compositor.draw_text(canvas, 'R', text_color, 1.0, 0.5,
+                                ha='right', va='center', size=text_size + 1)
+
+    return canvas
@@ -0,0 +1,179 @@
+'''
+Turn the slices of a volume the right way up without rotating it
+
+rotate_data used to chain np.rot90, np.fliplr, np.flipud and
+np.swapaxes on the whole (cropped) volume for each axis, and every
+slice was then cut out of the rotated volume as a strided view that
+had to be copied again when it was drawn. Every one of those rotations
+is just a permutation of the three axes plus a flip of some of them,
+so here that is worked out once for each axis and every slice is cut
+straight out of the original volume, in one copy, already the right
+way up (and padded).
+
+The orientations match what rotate_data did for a volume stored like
+the standard space (MNI152) templates: x from right to left, y from
+posterior to anterior and z from inferior to superior (LAS). For a
+volume that is stored the other way round along x, y or z the flips
+are worked out from its affine so that, for example, right is still
+on the right of the axial slices.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+#==============================================================================
+# The permutation and flips of the axes for each axis name. The slices
+# are cut along the last axis of the permutation.
+STANDARD = { 'axial': ((1, 0, 2), (True, True, False)),
+                'coronal': ((2, 0, 1), (True, False, True)),
+                'sagittal': ((2, 1, 0), (True, False, False)) }
+
+# The direction of each axis (+1 towards right, anterior and superior)
+# in the standard space templates
+STANDARD_DIRECTIONS = (-1, 1, 1)
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+class Orientation(object):
+    '''
+    A permutation of the three axes of a volume plus a flip of any of
+    them, so that the slices along the last (permuted) axis are the
+    right way up
+
+    permutation     the original axis for each new axis
+    flips           whether each new axis is flipped
+    '''
+    def __init__(self, permutation, flips):
+        self.permutation = tuple(permutation)
+        self.flips = tuple( bool(flip) for flip in flips )
+
+    def shape(self, shape):
+        '''
+        The shape of the volume after it has been turned
+        '''
+        return tuple( shape[axis] for axis in self.permutation )
+
+    def view(self, data):
+        '''
+        The whole volume turned the right way (a view, nothing is
+        copied). Only needed for things that work on the whole volume
+        at once (eg: outline.edge_mask), otherwise use cut.
+        '''
+        data = data.transpose(self.permutation)
+        return data[ tuple( slice(None, None, -1) if flip else slice(None)
+                                for flip in self.flips ) ]
+
+    def cut(self, data, slice_id, pad=0):
+        '''
+        Slice slice_id (counted along the last axis of the turned
+        volume) as a new contiguous 2D array, with pad zeros on every
+        side. It's the same as padded_slice(view(data), slice_id, pad).
+        '''
+        index = self.source_index(slice_id, self.shape(data.shape)[2], pad)
+
+        return self.cut_at(data, index, pad)
+
+    def source_index(self, slice_id, n_slices, pad=0):
+        '''
+        The index along the original axis that slice slice_id is cut
+        from, or None if it is one of the pad slices on either side
+        '''
+        i = slice_id - pad
+        if i < 0 or i >= n_slices:
+            return None
+
+        if self.flips[2]:
+            i = n_slices - 1 - i
+
+        return i
+
+    def slice_id(self, index, n_slices, pad=0):
+        '''
+        The slice_id of the slice cut from index along the original
+        axis, the other way round to source_index
+        '''
+        if self.flips[2]:
+            index = n_slices - 1 - index
+
+        return index + pad
+
+    def cut_at(self, data, index, pad=0):
+        '''
+        The slice at index along the original axis (see source_index)
+        turned the right way up, as a new contiguous 2D array with pad
+        zeros on every side. It's all zeros if index is None.
+        '''
+        rows, columns = self.shape(data.shape)[:2]
+
+        out = np.zeros((rows + 2 * pad, columns + 2 * pad), dtype=data.dtype)
+        if index is None:
+            return out
+
+        # The two axes that are left keep their original order
+        box = [ slice(None) ] * 3
+        box[self.permutation[2]] = index
+        plane = data[tuple(box)]
+        if self.permutation[0] > self.permutation[1]:
+            plane = plane.T
+
+        plane = plane[ slice(None, None, -1) if self.flips[0] else slice(None),
+                        slice(None, None, -1) if self.flips[1] else slice(None) ]
+
+        out[pad : pad + rows, pad : pad + columns] = plane
+
+        return out
+
+class OrientedVolume(object):
+    '''
+    A volume and the Orientation to cut its slices in. It stands in for
+    the rotated array that rotate_data used to return:
+    cropping.padded_slice cuts each slice with Orientation.cut.
+    '''
+    def __init__(self, data, orientation):
+        self.data = data
+        self.orientation = orientation
+        self.shape = orientation.shape(data.shape)
+        self.dtype = data.dtype
+
+    def padded_slice(self, slice_id, pad=0):
+        return self.orientation.cut(self.data, slice_id, pad)
+
+    def view(self):
+        return self.orientation.view(self.data)
+
+def standard_orientations():
+    '''
+    The Orientation for each axis name for a volume stored like the
+    standard space templates
+    '''
+    return dict( (axis_name, Orientation(permutation, flips))
+                    for axis_name, (permutation, flips) in STANDARD.items() )
+
+def from_affine(affine):
+    '''
+    The Orientation for each axis name for a volume with this affine.
+    Any of x, y and z that run the other way from the standard space
+    templates are flipped back inside each slice. The order of the
+    slices, and volumes whose axes aren't stored in x, y, z order, are
+    left as they are in standard_orientations.
+    '''
+    import nibabel as nib
+
+    orientations = standard_orientations()
+    if affine is None:
+        return orientations
+
+    ornt = nib.orientations.io_orientation(affine)
+    if not np.all(ornt[:, 0] == [0, 1, 2]):
+        return orientations
+
+    for axis_name, orientation in orientations.items():
+        flips = list(orientation.flips)
+        for i in range(2):
+            axis = orientation.permutation[i]
+            if ornt[axis, 1] != STANDARD_DIRECTIONS[axis]:
+                flips[i] = not flips[i]
+        orientations[axis_name] = Orientation(orientation.permutation, flips)
+
+    return orientations
@@ -0,0 +1,51 @@
+'''
+Precomputed outlines for the edge of the brain
+
+make_png used to call plt.contour(bg_slice, [0.06, 1]) for every slice,
+which runs marching squares and builds a path collection for a line
+that only depends on the background image. Instead the outline is
+computed once for the whole (rotated) background volume as a boolean
+edge mask, and each slice of that mask is drawn as a black raster layer.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def erode_in_plane(mask):
+    '''
+    Binary erosion of a 3D boolean mask along its first two axes only
+    (a 4-connected cross in every slice along the last axis). Voxels
+    outside the volume count as False.
+    '''
+    eroded = mask.copy()
+
+    for axis in (0, 1):
+        before = [ slice(None) ] * 3
+        after = [ slice(None) ] * 3
+        first = [ slice(None) ] * 3
+        last = [ slice(None) ] * 3
+
+        before[axis] = slice(None, -1)
+        after[axis] = slice(1, None)
+        first[axis] = slice(0, 1)
+        last[axis] = slice(-1, None)
+
+        # A voxel survives if its neighbours on both sides are in the mask
+        eroded[tuple(after)] &= mask[tuple(before)]
+        eroded[tuple(before)] &= mask[tuple(after)]
+        eroded[tuple(first)] = False
+        eroded[tuple(last)] = False
+
+    return eroded
+
+def edge_mask(mask):
+    '''
+    The voxels on the edge of a 3D boolean mask within each slice along
+    the last axis: the mask minus its in plane erosion
+    '''
+    mask = np.asarray(mask, dtype=bool)
+
+    return mask & ~erode_in_plane(mask)
@@ -0,0 +1,255 @@
+'''
+Loading and turning a background and one overlay image of the same size
+
+MakePngs_DTI.py (makepngs.dti) and MakePngs_HighRes.py
+(makepngs.highres) both draw one overlay on top of a background and
+read, crop and turn the two images in exactly the same way. The
+functions they share are here, the ways they draw the pngs are in
+their own modules.
+
+MakePngs_DTI.py can also draw a stack of overlays on the same
+background. The *_stack functions read, crop and turn any number of
+overlays at once and the functions for one overlay are built on them.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+from makepngs import cli
+from makepngs import loading
+from makepngs import orientation
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def hardcoded_variables():
+    # The xyz_dict is a dictionary that allows us to loop through the dimensions
+    # and label them with meaningful words
+    xyz_dict = { 'name': ('sagittal', 'coronal', 'axial'),
+                'letter': ('X', 'Y', 'Z'),
+				'mni_const': (90, 126, 72) }
+    # Name and letter are self explanatory. The mni_const is a list of values
+	# that can be added to the slice number in order to convert the voxel value
+	# to mni coordinates - it isn't actually used for this code but a hangover
+	# from a previous reincarnation
+
+	# The xyz_dict will actually be added to with important values from the
+	# data later on
+    
+    return xyz_dict
+
+def load_data(arguments, parser):
+    '''
+    READ IN THE DATA
+    and check that the two files are the same size
+    
+    '''
+    bg_data, overlays, zooms = load_stack(arguments, parser, [ arguments.overlay_file ])
+    
+    return bg_data, overlays[0], zooms
+
+def load_stack(arguments, parser, overlay_files):
+    '''
+    READ IN THE DATA
+    for the background and every one of the overlay_files and check
+    that they're all the same size. Returns the background data, a
+    list of the overlay data and the voxel dimensions
+    '''
+    try:
+        bg_img = loading.load_image(arguments.background_file)
+        bg_data = bg_img.get_data()
+    except:
+        cli.error(parser, 'background file can not be loaded')
+    
+    # Make sure all data is float and scale it by its maximum
+    bg_data = bg_data/1.
+    bg_data = bg_data / bg_data.max()
+    
+    overlays = []
+    for overlay_file in overlay_files:
+        try:
+            overlay_img = loading.load_image(overlay_file)
+            overlay_data = overlay_img.get_data()
+        except:
+            cli.error(parser, overlay_error(overlay_files, overlay_file, 'can not be loaded'))
+        
+        # Check that they're the same shape and have the same zoom dimensions
+        if not bg_data.shape == overlay_data.shape:
+            cli.error(parser, 'files are not the same shape')
+        
+        if not bg_img.get_header().get_zooms() == overlay_img.get_header().get_zooms():
+            cli.error(parser, 'files do not have the same voxel dimensions')
+        
+        overlay_data = overlay_data/1.
+        overlays.append(overlay_data / overlay_data.max())
+    
+    # Now also save the pixel dimensions
+    zooms = bg_img.get_header().get_zooms()
+
+    return bg_data, overlays, zooms
+
+def overlay_error(overlay_files, overlay_file, problem):
+    '''
+    The error message for one of the overlay files, which only needs
+    its name if there's more than one
+    '''
+    if len(overlay_files) == 1:
+        return 'overlay file {}'.format(problem)
+    
+    return 'overlay file {} {}'.format(overlay_file, problem)
+
+def load_volumes(arguments, parser, slab_size=16):
+    '''
+    OPEN THE DATA WITHOUT READING IT
+    The headers are checked before any voxel data is read and
+    uncompressed files are memory mapped. Returns a LazyVolume for each
+    file (that reads slab_size slices at a time) and the bounding box
+    of the voxels that will be drawn
+    '''
+    bg_vol, overlay_vols, box = open_stack(arguments, parser, [ arguments.overlay_file ],
+                                            slab_size=slab_size)
+    
+    return bg_vol, overlay_vols[0], box
+
+def open_stack(arguments, parser, overlay_files, slab_size=16):
+    '''
+    OPEN THE DATA WITHOUT READING IT
+    Like load_volumes but for the background and every one of the
+    overlay_files. Returns the background LazyVolume, a list of the
+    overlay LazyVolumes and the bounding box of the voxels that will be
+    drawn (around all of the overlays if you're cropping to them)
+    '''
+    try:
+        bg_img = loading.load_image(arguments.background_file)
+    except:
+        cli.error(parser, 'background file can not be loaded')
+    
+    overlay_vols = []
+    for overlay_file in overlay_files:
+        try:
+            overlay_img = loading.load_image(overlay_file)
+        except:
+            cli.error(parser, overlay_error(overlay_files, overlay_file, 'can not be loaded'))
+        
+        # Check that they're the same shape and have the same zoom dimensions
+        try:
+            loading.check_same_space(bg_img, overlay_img)
+        except ValueError as err:
+            cli.error(parser, err)
+        
+        overlay_vols.append(loading.LazyVolume(overlay_img, slab_size=slab_size))
+    
+    bg_vol = loading.LazyVolume(bg_img, slab_size=slab_size)
+    
+    # Find the voxels in the image(s) you're cropping to,
+    # these are the only ones that are drawn
+    if arguments.crop_option == 'overlay':
+        box = union_box([ overlay_vol.bounding_box() for overlay_vol in overlay_vols ])
+    else:
+        box = bg_vol.bounding_box()
+    
+    if box is None:
+        cli.error(parser, '{} file is empty'.format(arguments.crop_option))
+    
+    return bg_vol, overlay_vols, box
+
+def union_box(boxes):
+    '''
+    The box of three slices around all of the boxes (any of them can be
+    None if that volume is empty). Returns None if they're all None.
+    '''
+    boxes = [ box for box in boxes if box is not None ]
+    if not boxes:
+        return None
+    
+    return tuple( slice(min(box[i].start for box in boxes), max(box[i].stop for box in boxes))
+                    for i in range(3) )
+
+def load_data_lazy(arguments, parser):
+    '''
+    READ IN ONLY THE DATA THAT WILL BE DRAWN
+    The headers are checked before any voxel data is read, uncompressed
+    files are memory mapped and only the bounding box of the voxels that
+    will be drawn is converted to float32.
+    Returns the data inside the box, the voxel dimensions, the shape of
+    the whole volume and the offset of the box in the whole volume
+    '''
+    bg_data, overlays, zooms, shape, offset = load_stack_lazy(arguments, parser,
+                                                                [ arguments.overlay_file ])
+    
+    return bg_data, overlays[0], zooms, shape, offset
+
+def load_stack_lazy(arguments, parser, overlay_files):
+    '''
+    READ IN ONLY THE DATA THAT WILL BE DRAWN
+    Like load_data_lazy but for the background and every one of the
+    overlay_files, which are returned as a list
+    '''
+    bg_vol, overlay_vols, box = open_stack(arguments, parser, overlay_files)
+    
+    # Read in the box and scale the data by its maximum
+    bg_data = bg_vol.read(box, 1. / bg_vol.max())
+    overlays = [ overlay_vol.read(box, 1. / overlay_vol.max()) for overlay_vol in overlay_vols ]
+    
+    offset = [ sl.start for sl in box ]
+    
+    return bg_data, overlays, bg_vol.zooms, bg_vol.shape, offset
+
+def load_data_chunked(arguments, parser):
+    '''
+    OPEN THE DATA TO BE READ A SLAB AT A TIME
+    Like load_data_lazy but none of the data is kept, the bounding box
+    and the maximum of each volume are found a slab at a time within
+    the max_memory budget. Returns the two LazyVolumes, what each one
+    is scaled by, the bounding box, the voxel dimensions and the shape
+    of the whole volume
+    '''
+    # Each voxel of a slab is read as up to 8 bytes (nibabel scales
+    # the data to float64) and then turned in to a 1 byte mask
+    shape = loading.load_image(arguments.background_file).header.get_data_shape()
+    slab_size = loading.slab_size(shape[:2], arguments.max_memory, bytes_per_voxel=9)
+    
+    bg_vol, overlay_vol, box = load_volumes(arguments, parser, slab_size=slab_size)
+    
+    scales = [ 1. / bg_vol.max(), 1. / overlay_vol.max() ]
+    
+    return bg_vol, overlay_vol, scales, box, bg_vol.zooms, bg_vol.shape
+
+def overlay_only(overlay, slices_list):
+    
+    slices_list_x = list(np.argwhere(np.sum(overlay, (1,2))!=0)[:,0])
+    slices_list_y = list(np.argwhere(np.sum(overlay, (0,2))!=0)[:,0])
+    slices_list_z = list(np.argwhere(np.sum(overlay, (0,1))!=0)[:,0])
+
+    slices_list = [slices_list_x, slices_list_y, slices_list_z]
+    
+    return slices_list
+
+def rotate_data(bg, overlay, slices_list, axis_name, shape, orientations=None):
+    # Turn the data as required. Nothing is rotated or copied here, each
+    # slice is cut out the right way up when it's drawn (see
+    # makepngs.orientation). The orientations come from the affine of
+    # the background image, or are the standard space ones.
+    # Return the turned data, and an updated slice list if necessary
+    bg, overlays, slices_list = rotate_stack(bg, [ overlay ], slices_list,
+                                                axis_name, shape, orientations)
+    
+    return bg, overlays[0], slices_list
+
+def rotate_stack(bg, overlays, slices_list, axis_name, shape, orientations=None):
+    # The same as rotate_data but for a list of overlays, which all
+    # share the background's orientation
+    if orientations is None:
+        orientations = orientation.standard_orientations()
+    
+    if not axis_name in orientations:
+        raise ValueError('data could not be rotated to {}'.format(axis_name))
+    
+    if axis_name == 'coronal':
+        slices_list[1] = [ shape - n - 3 for n in slices_list[1] ] 
+    
+    bg = orientation.OrientedVolume(bg, orientations[axis_name])
+    overlays = [ orientation.OrientedVolume(overlay, orientations[axis_name])
+                    for overlay in overlays ]
+    
+    return bg, overlays, slices_list
@@ -0,0 +1,72 @@
+'''
+Small, fast previews of a volume for quality control
+
+Instead of drawing every slice at full resolution the volumes are
+block averaged (eg: every 2 x 2 x 2 or 4 x 4 x 4 block of voxels
+becomes one voxel), only every k-th slice is drawn, and the slices
+for each axis are put together in one contact sheet.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def block_average(data, factor, offset=(0, 0, 0)):
+    '''
+    Average every factor x factor x factor block of voxels in a 3D
+    array. offset is the position of data[0, 0, 0] in the whole
+    volume (eg: if only a box of the volume was read in) and the
+    blocks line up with the whole volume rather than with the box.
+    Voxels outside the data count as 0.
+    Returns the float32 averaged data and its offset in the
+    averaged volume.
+    '''
+    if factor == 1:
+        return data, tuple(offset)
+
+    # Pad the data so that it starts and ends on a block boundary
+    before = [ o % factor for o in offset ]
+    after = [ -(b + n) % factor for b, n in zip(before, data.shape) ]
+
+    if any(before) or any(after):
+        data = np.pad(data, list(zip(before, after)), mode='constant')
+
+    nx, ny, nz = [ n // factor for n in data.shape ]
+
+    blocks = data.reshape(nx, factor, ny, factor, nz, factor)
+    averaged = blocks.mean(axis=(1, 3, 5), dtype=np.float32)
+
+    return averaged, tuple( o // factor for o in offset )
+
+def averaged_shape(shape, factor):
+    '''
+    The shape of a whole volume after it has been block averaged
+    '''
+    return tuple( -(-n // factor) for n in shape )
+
+def contact_sheet(tiles, columns=None, transparency=False):
+    '''
+    Put (h, w, 4) uint8 RGBA tiles (all the same size) in a grid, row
+    by row, on a black (or transparent) background. The number of
+    columns is chosen to make the sheet roughly square if it isn't
+    given.
+    '''
+    n = len(tiles)
+    h, w = tiles[0].shape[:2]
+
+    if columns is None:
+        columns = int(np.ceil(np.sqrt(n * h / float(w))))
+    columns = max(1, min(columns, n))
+    rows = -(-n // columns)
+
+    sheet = np.zeros((rows * h, columns * w, 4), dtype=np.uint8)
+    if not transparency:
+        sheet[..., 3] = 255
+
+    for i, tile in enumerate(tiles):
+        row, column = divmod(i, columns)
+        sheet[ row * h : (row + 1) * h, column * w : (column + 1) * w ] = tile
+
+    return sheet
@@ -0,0 +1,179 @@
+'''
+Time and memory used by each stage of the MakePngs_* scripts
+
+Each stage (setup_argparser, load, crop, rotate_data, make_png...) is
+run inside profiler.stage(name). For every call the profiler records:
+  * the wall clock time
+  * the CPU time (user + system) of the process
+  * the change in memory: bytes allocated by python and numpy if
+    tracemalloc is running (python 3), otherwise the change in the
+    resident memory of the process
+The calls are added up for each stage in the summary table and each
+call is also kept (eg: so the time for each slice can be printed, and
+the slowest slices are listed under the table). Stages that run in
+worker processes (eg: with --jobs) are recorded in the worker and sent
+back to the main process with each result (see take_records).
+
+A cProfile profile of the whole run can be saved as well, it can be
+read with the pstats module or a viewer such as snakeviz.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import os
+import time
+from contextlib import contextmanager
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def cpu_time():
+    '''
+    User plus system CPU time of this process in seconds
+    '''
+    times = os.times()
+    return times[0] + times[1]
+
+def memory_bytes():
+    '''
+    The memory in use by this process: the traced memory if
+    tracemalloc is running, otherwise the resident set size
+    '''
+    try:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+    except ImportError:
+        pass
+
+    # The second number in /proc/self/statm is the resident size in pages
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Profiler(object):
+    '''
+    Collect the time and memory used by each stage of a script
+
+    enabled         record anything at all (stage() does nothing if False)
+    cprofile_file   save cProfile stats of everything between start()
+                    and stop() to this file (None for no cProfile)
+    '''
+    def __init__(self, enabled=True, cprofile_file=None):
+        self.enabled = enabled
+        self.cprofile_file = cprofile_file
+        self.records = []
+        self._cprofile = None
+
+    def start(self):
+        '''
+        Start tracing memory allocations (python 3 only) and cProfile
+        '''
+        if not self.enabled:
+            return
+
+        try:
+            import tracemalloc
+            tracemalloc.start()
+        except ImportError:
+            pass
+
+        if self.cprofile_file:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        '''
+        Stop cProfile and save its stats
+        '''
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_file)
+            self._cprofile = None
+
+    @contextmanager
+    def stage(self, name, label=None):
+        '''
+        Record the time and memory used inside a with block.
+        label tells calls of the same stage apart (eg: the png name).
+        '''
+        if not self.enabled:
+            yield
+            return
+
+        wall, cpu, memory = time.time(), cpu_time(), memory_bytes()
+        try:
+            yield
+        finally:
+            self.records.append({ 'stage': name,
+                                    'label': label,
+                                    'wall': time.time() - wall,
+                                    'cpu': cpu_time() - cpu,
+                                    'bytes': memory_bytes() - memory })
+
+    def take_records(self):
+        '''
+        Return the records so far and start again with none, eg: to
+        send a worker process' records back to the main process
+        '''
+        records, self.records = self.records, []
+        return records
+
+    def add_records(self, records):
+        '''
+        Add records from somewhere else (eg: from take_records in a
+        worker process)
+        '''
+        self.records.extend(records)
+
+    def last(self, name):
+        '''
+        The most recent record for a stage (or None)
+        '''
+        for record in reversed(self.records):
+            if record['stage'] == name:
+                return record
+
+    def summary(self, slowest_stage='make_png', n_slowest=5):
+        '''
+        A table of the calls, total wall time, total CPU time, mean
+        wall time per call and total change in memory for each stage
+        (in the order the stages were first used), followed by the
+        n_slowest calls of slowest_stage
+        '''
+        stages = []
+        totals = {}
+        for record in self.records:
+            name = record['stage']
+            if not name in totals:
+                stages.append(name)
+                totals[name] = { 'calls': 0, 'wall': 0., 'cpu': 0., 'bytes': 0 }
+            totals[name]['calls'] += 1
+            totals[name]['wall'] += record['wall']
+            totals[name]['cpu'] += record['cpu']
+            totals[name]['bytes'] += record['bytes']
+
+        lines = [ '{:<18}{:>7}{:>12}{:>12}{:>14}{:>12}'.format('stage', 'calls', 'wall (s)',
+                                                            'cpu (s)', 'mean (ms)', 'mem (MB)') ]
+        for name in stages:
+            total = totals[name]
+            lines.append('{:<18}{:>7}{:>12.3f}{:>12.3f}{:>14.1f}{:>12.1f}'.format(
+                            name,
+                            total['calls'],
+                            total['wall'],
+                            total['cpu'],
+                            total['wall'] * 1000 / total['calls'],
+                            total['bytes'] / 1024. / 1024.))
+
+        slowest = sorted([ record for record in self.records
+                                if record['stage'] == slowest_stage ],
+                            key=lambda record: -record['wall'])[:n_slowest]
+        if slowest:
+            lines.append('slowest {}:'.format(slowest_stage))
+            for record in slowest:
+                lines.append('    {:<40}{:>10.1f} ms'.format(record['label'], record['wall'] * 1000))
+
+        return '\n'.join(lines)
@@ -0,0 +1,96 @@
+'''
+Incremental rendering: only re-make the pngs whose inputs have changed
+
+A manifest file in the output directory records, for every png, a hash
+of the 2D slices it was drawn from together with the options that
+change how it looks (colormap, transparency, text colors...). When the
+script is run again a png is only made if its hash is different, or if
+the png file has gone missing.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import hashlib
+import json
+import os
+import numpy as np
+
+#==============================================================================
+class RenderCache(object):
+    '''
+    The manifest of pngs in one output directory
+
+    output_dir  directory that holds the pngs (and the manifest)
+    options     dictionary of everything (other than the data) that
+                changes how the pngs look. It must be json serialisable.
+    '''
+    manifest_name = '.makepngs_manifest.json'
+    version = 1
+
+    def __init__(self, output_dir, options):
+        self.output_dir = output_dir
+        self.manifest_file = os.path.join(output_dir, self.manifest_name)
+        self.options = json.dumps(options, sort_keys=True)
+
+        self.old_hashes = {}
+        self.new_hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.isfile(self.manifest_file):
+            try:
+                with open(self.manifest_file) as f:
+                    manifest = json.load(f)
+                if manifest.get('version') == self.version:
+                    self.old_hashes = manifest['pngs']
+            except (ValueError, KeyError):
+                # A broken manifest just means everything is made again
+                self.old_hashes = {}
+
+    def slice_hash(self, *items):
+        '''
+        Hash the options together with any number of arrays and strings
+        (eg: the background slice, the stats slice and the mni text)
+        '''
+        sha = hashlib.sha1(self.options.encode('utf-8'))
+
+        for item in items:
+            if isinstance(item, np.ndarray):
+                item = np.ascontiguousarray(item)
+                sha.update('{}{}'.format(item.dtype.str, item.shape).encode('utf-8'))
+                sha.update(item.tobytes())
+            else:
+                sha.update(str(item).encode('utf-8'))
+
+        return sha.hexdigest()
+
+    def is_fresh(self, png_name, png_hash):
+        '''
+        Return True if png_name already exists and was made from data
+        with the same hash. Either way the hash is remembered for the
+        new manifest.
+        '''
+        self.new_hashes[png_name] = png_hash
+
+        fresh = ( self.old_hashes.get(png_name) == png_hash
+                    and os.path.isfile(os.path.join(self.output_dir, png_name)) )
+
+        if fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        return fresh
+
+    def save(self):
+        '''
+        Write the new manifest. It only lists the pngs from this run.
+        '''
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({ 'version': self.version, 'pngs': self.new_hashes },
+                        f, indent=0, sort_keys=True)
+        os.rename(tmp_file, self.manifest_file)
+
+    def summary(self):
+        return '{} pngs up to date, {} pngs made'.format(self.hits, self.misses)
@@ -0,0 +1,187 @@
+'''
+A matplotlib figure that is built once for each axis orientation and
+then reused for every slice.
+
+make_png builds a new figure for every slice: plt.figure(), three
+imshow calls, the text, a tight bounding box layout pass and then
+plt.close(). SliceFigure creates the figure, axes, image artists and
+text artists once. For each slice it only calls set_data/set_text,
+redraws the contour (if there is one) and saves.
+
+The brain outline can either be a contour that is redrawn for every
+slice, or a precomputed edge mask (see makepngs.outline) that is drawn
+as another image layer and is updated with set_data like the others.
+
+The figure covers exactly the slice (scale pixels per voxel), so no
+tight bounding box calculation is needed when saving.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+
+#==============================================================================
+class SliceFigure(object):
+    '''
+    Reusable figure for slices of one shape (ie: one axis orientation)
+
+    shape           (rows, columns) of every slice that will be drawn
+    bg_cmap         colormap for the background slice
+    overlay_cmap    colormap for the overlay slice (masked where it is 0)
+    overlay_alpha   opacity of the overlay
+    overlay_threshold
+                    mask overlay values below this (None to only mask
+                    where the overlay is 0)
+    bg_threshold    mask background values below this (None for no mask)
+    contour_levels  levels for a black contour line (None for no line)
+    outline         add a black image layer for a precomputed edge mask
+    textcolor_mni   color of the coordinate text in the bottom center
+                    (None if there won't be any coordinate text)
+    textcolor_R     color of the "R" on the right hand side
+                    (None if there shouldn't be an "R")
+    transparency    make the background transparent rather than black
+    scale           number of pixels for each voxel
+    '''
+    def __init__(self, shape,
+                    bg_cmap='gray', overlay_cmap='autumn',
+                    overlay_alpha=1.0, bg_threshold=None,
+                    overlay_threshold=None,
+                    contour_levels=None, outline=False,
+                    textcolor_mni=None, textcolor_R=None,
+                    transparency=False, scale=4, dpi=100):
+
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.shape = shape
+        self.bg_threshold = bg_threshold
+        self.overlay_threshold = overlay_threshold
+        self.contour_levels = contour_levels
+        self.contour = None
+
+        # Set up a figure that is exactly the size of the image
+        rows, columns = shape
+        self.figure = Figure(figsize=(columns * scale / float(dpi),
+                                        rows * scale / float(dpi)),
+                                dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+
+        # Black background, unless you want it to be transparent
+        if transparency:
+            self.figure.patch.set_alpha(0)
+        else:
+            self.figure.patch.set_facecolor('k')
+
+        self.ax = self.figure.add_axes([0, 0, 1, 1])
+        self.ax.set_axis_off()
+
+        empty = np.ma.masked_all(shape)
+
+        # The background slice
+        self.bg_image = self.ax.imshow(empty,
+                                        interpolation='none',
+                                        cmap=bg_cmap,
+                                        vmin=0,
+                                        vmax=1)
+
+        # The overlay slice
+        self.overlay_image = self.ax.imshow(empty,
+                                            interpolation='none',
+                                            cmap=overlay_cmap,
+                                            alpha=overlay_alpha,
+                                            vmin=0,
+                                            vmax=1)
+
+        # The precomputed outline, black wherever it isn't masked
+        self.outline_image = None
+        if outline:
+            from matplotlib.colors import ListedColormap
+            self.outline_image = self.ax.imshow(empty,
+                                                interpolation='none',
+                                                cmap=ListedColormap(['k']),
+                                                vmin=0,
+                                                vmax=1)
+
+        # Fix the limits so that drawing contours doesn't move them
+        self.ax.set_xlim(-0.5, columns - 0.5)
+        self.ax.set_ylim(rows - 0.5, -0.5)
+        self.ax.set_autoscale_on(False)
+
+        # The coordinate text in the bottom center of the picture
+        self.mni_text = None
+        if textcolor_mni is not None:
+            self.mni_text = self.ax.text(0.5, 0.01, '',
+                                            horizontalalignment='center',
+                                            verticalalignment='bottom',
+                                            transform=self.ax.transAxes,
+                                            color=textcolor_mni)
+
+        # A little "R" in the middle right side of the image
+        if textcolor_R is not None:
+            self.ax.text(0.99, 0.5, 'R',
+                            horizontalalignment='right',
+                            verticalalignment='center',
+                            transform=self.ax.transAxes,
+                            color=textcolor_R)
+
+    def update(self, bg_slice, overlay_slice, contour_slice=None,
+                    mni_text=None, outline_slice=None):
+        '''
+        Swap a new pair of slices (and a new coordinate text and
+        outline) into the figure
+        '''
+        if bg_slice.shape != self.shape:
+            raise ValueError('Slice shape {} does not match figure shape {}'.format(
+                                bg_slice.shape, self.shape))
+
+        if self.bg_threshold is not None:
+            bg_slice = np.ma.masked_where(bg_slice < self.bg_threshold, bg_slice)
+        self.bg_image.set_data(bg_slice)
+
+        if self.overlay_threshold is None:
+            overlay_mask = overlay_slice == 0
+        else:
+            overlay_mask = overlay_slice < self.overlay_threshold
+        self.overlay_image.set_data(np.ma.masked_where(overlay_mask, overlay_slice))
+
+        if self.outline_image is not None and outline_slice is not None:
+            self.outline_image.set_data(np.ma.masked_where(~outline_slice, outline_slice))
+
+        if self.mni_text is not None and mni_text is not None:
+            self.mni_text.set_text(mni_text)
+
+        # The contour can't be updated in place so remove the last one
+        # and draw it again (old versions of matplotlib can only remove
+        # each of its collections, newer ones don't have them any more)
+        if self.contour is not None:
+            if hasattr(self.contour, 'remove'):
+                self.contour.remove()
+            else:
+                for collection in self.contour.collections:
+                    collection.remove()
+            self.contour = None
+
+        if self.contour_levels is not None and contour_slice is not None:
+            if contour_slice.min() < self.contour_levels[0] <= contour_slice.max():
+                self.contour = self.ax.contour(contour_slice,
+                                                self.contour_levels,
+                                                linewidths=3,
+                                                colors='k')
+
+    def save(self, fname):
+        '''
+        Write the current state of the figure to a png file
+        '''
+        self.canvas.print_png(fname)
+
+    def render(self):
+        '''
+        Draw the current state of the figure and return a copy of it
+        as an (h, w, 4) uint8 RGBA array (eg: for makepngs.writer)
+        '''
+        self.canvas.draw()
+        width, height = self.canvas.get_width_height()
+
+        rgba = np.frombuffer(self.canvas.buffer_rgba(), dtype=np.uint8)
+
+        return rgba.reshape(height, width, 4).copy()
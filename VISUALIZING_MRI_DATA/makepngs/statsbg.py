@@ -0,0 +1,1309 @@
+'''
+The code behind MakePngs_StatsBg_StandardSpace.py: pngs of every slice
+of one or more stats maps on top of a standard space background
+
+Run it with MakePngs_StatsBg_StandardSpace.py, which has the help text
+for all the options. main() reads the command line and makes the pngs.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import numpy as np
+import os
+import argparse
+from makepngs import cli
+from makepngs import clusters
+from makepngs import compositor
+from makepngs import encoder
+from makepngs import loading
+from makepngs import profiling
+from makepngs.writer import PngWriter
+from makepngs import cropping
+from makepngs import outline
+from makepngs import montage
+from makepngs import orientation
+from makepngs import preview
+from makepngs.slice_figure import SliceFigure
+from makepngs.render_cache import RenderCache
+import multiprocessing as mp
+import glob
+import copy
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def setup_argparser():
+    '''
+    # CODE TO READ ARGUMENTS FROM THE COMMAND LINE AND SET OPTIONS
+    # ALSO INCLUDES SOME HELP TEXT
+    '''
+    
+    # Build a basic parser.
+    help_text = ('Overlay a stats nifti image on top of a standard space '
+                    + 'background nifti image (eg: mean_FA, FMRIB58_FA_1mm, '
+					+ 'MNI152lin_T1_2mm_brain) and create pngs of all slices '
+					+ 'in all directions (axial, coronal, sagittal)')
+    
+    sign_off = 'Author: Kirstie Whitaker <kw401@cam.ac.uk>'
+    
+    parser = argparse.ArgumentParser(description=help_text, epilog=sign_off)
+    
+    # Now add the arguments
+    # Required argument: background file
+    parser.add_argument(dest='background_file', 
+                            type=str,
+                            metavar='bg_fname',
+                            help='File name for background .nii.gz image')
+    
+    # Required argument: stats file(s)
+    parser.add_argument(dest='stats_files', 
+                            type=str,
+                            nargs='+',
+                            metavar='stats_fname',
+                            help=('File name for stats .nii.gz image. Give more than one '
+                                    + '(or a wildcard pattern) to draw them all on the same '
+                                    + 'background. Each volume of a 4D stats file is drawn in '
+                                    + 'its own directory (vol0000, vol0001...)') )
+    
+    # Required argument: output dir
+    parser.add_argument(dest='output_dir', 
+                            type=str,
+                            metavar='output_dirname',
+                            help='Output directory for .png images')
+    
+    # Optional argument: verbosity
+    parser.add_argument('-v', '--verbose',
+                            dest='verbose',
+                            action='store_true',
+                            help='Print verbose updates of each step to the screen')
+                            
+    # Optional argument: use_specificcolors
+    parser.add_argument('-oc', '--use_specificcolors',
+                            dest='use_specificcolors',
+                            action='store_true',
+                            help='Ignore the colormap and generate one from a list of colors')
+    
+    # Optional argument: colormap
+    #       default: autumn
+    parser.add_argument('-cm', '--colormap',
+                            dest='colormap',
+                            type=str,
+                            default='autumn',
+                            metavar='colormap',
+                            help= ('Colormap used to plot stats data. Default is autumn. '
+                                    + 'See wiki.scipy.org/Cookbook/Matplotlib/Show_colormaps '
+                                    + 'for all possible colormaps') )
+                                    
+    # Optional argument: colorlist
+    #       default: blue
+    parser.add_argument('-c', '--colorlist',
+                            dest='colorlist',
+                            type=str,
+                            nargs='+',
+                            default='blue',
+                            metavar='colorlist',
+                            help= ('One color for every integer value in the stats file.'
+                                    + 'Default is blue.') )
+    
+    # Optional argument: textcolor_mni
+    #       default: black
+    parser.add_argument('-tc1', '--textcolor_mni',
+                            dest='textcolor_mni',
+                            type=str,
+                            default='k',
+                            metavar='textcolor_mni',
+                            help='Color for coordinate text information. Default is black. Enter "none" to leave blank')
+    
+    # Optional argument: textcolor_R
+    #       default: black
+    parser.add_argument('-tc2', '--textcolor_R',
+                            dest='textcolor_R',
+                            type=str,
+                            default='k',
+                            metavar='textcolor_R',
+                            help='Color for side indicator (R) on axial slices. Default is black. Enter "none" to leave blank')
+    
+    # Optional argument: transparency
+    #       default: False
+    parser.add_argument('-tr', '--transparency',
+                            dest='transparency',
+                            action='store_true',
+                            help='Make background transparent. Default is black')
+    
+    # Optional argument: crop_option
+    #       default: background
+    parser.add_argument('-cr', '--crop_option',
+                            dest='crop_option',
+                            type=str,
+                            default='background',
+                            choices=['background', 'stats'],
+                            metavar='crop_option',
+                            help='Choose to crop either the background image, or the stats image. Default is background')
+    
+    # Optional argument: jobs
+    #       default: 1
+    parser.add_argument('-j', '--jobs',
+                            dest='jobs',
+                            type=int,
+                            default=1,
+                            metavar='n_jobs',
+                            help='Number of processes used to make the pngs. Default is 1. Enter 0 to use all available cores')
+    
+    # Optional arguments: renderer and lazy
+    cli.add_renderer_arguments(parser)
+    
+    # Optional argument: incremental
+    #       default: False
+    parser.add_argument('-in', '--incremental',
+                            dest='incremental',
+                            action='store_true',
+                            help=('Only make the pngs whose data or drawing options have changed '
+                                    + 'since the last run. A manifest of the pngs is kept in the '
+                                    + 'output directory. Default is to make all the pngs') )
+    
+    # Optional argument: batch
+    #       default: False
+    parser.add_argument('-b', '--batch',
+                            dest='batch',
+                            action='store_true',
+                            help=('Put the pngs for each stats file in their own directory '
+                                    + '(named after the stats file, and the directories it is in '
+                                    + 'if the stats files are not all in the same directory) inside '
+                                    + 'the output directory. This is always done if there is more '
+                                    + 'than one stats file') )
+    
+    # Optional argument: montage
+    #       default: False
+    parser.add_argument('-mo', '--montage',
+                            dest='montage',
+                            action='store_true',
+                            help=('Make the combined sagittal and axial strips (the same ones '
+                                    + 'as CombiningPngs.py) directly from the volume instead of '
+                                    + 'the pngs of every slice') )
+    
+    # Optional argument: clusters
+    #       default: False
+    parser.add_argument('-cl', '--clusters',
+                            dest='clusters',
+                            action='store_true',
+                            help=('Label the clusters of the stats map (voxels above the cluster '
+                                    + 'threshold that touch on a face, edge or corner) and save '
+                                    + 'their size, peak value and peak voxel and MNI coordinates '
+                                    + 'in clusters.csv in the output directory, biggest first') )
+    
+    # Optional argument: cluster_threshold
+    #       default: 0
+    parser.add_argument('-clt', '--cluster_threshold',
+                            dest='cluster_threshold',
+                            type=float,
+                            default=0,
+                            metavar='threshold',
+                            help=('Only the voxels above this value are part of a cluster. '
+                                    + 'Default is 0 (all the stats data)') )
+    
+    # Optional argument: peak_slices
+    #       default: False
+    parser.add_argument('-pk', '--peak_slices',
+                            dest='peak_slices',
+                            action='store_true',
+                            help=('Only make the pngs of the slices through the peak of each '
+                                    + 'cluster (and save clusters.csv). Can\'t be used with '
+                                    + '--preview or --montage') )
+    
+    # Optional arguments: preview and preview_step
+    cli.add_preview_arguments(parser)
+    
+    # Optional arguments: profiling and saving the pngs
+    cli.add_output_arguments(parser,
+                                needs=('the numpy or persistent renderer, --jobs 1 and can\'t be '
+                                        + 'used with --incremental'))
+    
+    arguments = parser.parse_args()
+    
+    # The pngs are added to the container and the animations by the
+    # png_writer so they can't be saved by matplotlib or by other
+    # processes, and there are no png files for --incremental to check
+    if (arguments.container or arguments.animate) and (arguments.renderer == 'matplotlib'
+                                                        or arguments.jobs != 1 or arguments.incremental):
+        cli.error(parser, ('--container and --animate need the numpy or persistent renderer, '
+                            + '--jobs 1 and no --incremental'))
+    
+    # The previews and montages don't have a png for each slice
+    if arguments.peak_slices and (arguments.preview or arguments.montage):
+        cli.error(parser, '--peak_slices can\'t be used with --preview or --montage')
+    
+    return arguments, parser
+
+def hardcoded_variables():
+    # The xyz_dict is a dictionary that allows us to loop through the dimensions
+    # and label them with meaningful words
+    xyz_dict = { 'name': ('sagittal', 'coronal', 'axial'),
+                'letter': ('X', 'Y', 'Z'),
+				'mni_const': (90, 126, 72) }
+    # Name and letter are self explanatory. The mni_const is a list of values
+	# that can be added to the slice number in order to convert the voxel value
+	# to mni coordinates
+
+	# The xyz_dict will actually be added to with important values from the
+	# data later on
+    
+    # Now define the functions that convert the voxel values to mni space
+    def mni_x(constant, slice_n, zoom):
+        x = constant - (slice_n * zoom)
+        return x
+    
+    def mni_y(constant, slice_n, zoom):
+        y = (slice_n * zoom) - constant
+        return y
+    
+    def mni_z(constant, slice_n, zoom):
+        z = (slice_n * zoom) - constant
+        return z
+
+    mni_func_list = [ mni_x, mni_y, mni_z ]
+
+    return xyz_dict, mni_func_list
+
+def find_stats_files(arguments, parser):
+    '''
+    Make a list of all the stats files, expanding any wildcards
+    that the shell didn't (eg: if the pattern was in quotes)
+    '''
+    stats_files = []
+    
+    for pattern in arguments.stats_files:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            cli.error(parser, 'stats file {} can not be found'.format(pattern))
+        stats_files += matches
+    
+    return stats_files
+
+def find_stats_volumes(stats_files, arguments, parser):
+    '''
+    Make a list of (stats_file, volume, output_dir) for every 3D
+    volume that will be drawn. volume is None for a 3D stats file.
+    Each volume of a 4D stats file gets its own directory
+    (vol0000, vol0001...) in the output directory. Only the headers
+    are read here.
+    '''
+    stats_volumes = []
+    
+    names = batch_names(stats_files)
+    
+    for stats_file, name in zip(stats_files, names):
+        
+        output_dir = arguments.output_dir
+        if arguments.batch:
+            output_dir = os.path.join(output_dir, name)
+        
+        try:
+            n_volumes = loading.n_volumes(loading.load_image(stats_file))
+        except:
+            cli.error(parser, 'stats file {} can not be loaded'.format(stats_file))
+        
+        if n_volumes is None:
+            stats_volumes.append((stats_file, None, output_dir))
+        else:
+            for volume in range(n_volumes):
+                stats_volumes.append((stats_file,
+                                        volume,
+                                        os.path.join(output_dir, 'vol{:04d}'.format(volume))))
+    
+    # Don't let the pngs of one stats file overwrite another's
+    # (eg: x.nii and x.nii.gz)
+    output_dirs = {}
+    for stats_file, volume, output_dir in stats_volumes:
+        if output_dir in output_dirs and output_dirs[output_dir] != stats_file:
+            cli.error(parser, 'stats files {} and {} would both be drawn in {}'.format(output_dirs[output_dir],
+                                                                                        stats_file,
+                                                                                        output_dir))
+        output_dirs[output_dir] = stats_file
+    
+    return stats_volumes
+
+def stats_name(stats_file):
+    '''
+    The name of a stats file without its directory or
+    .nii/.nii.gz extension (eg: tstat1 for /path/to/tstat1.nii.gz)
+    '''
+    name = os.path.basename(stats_file)
+    for ext in [ '.gz', '.nii' ]:
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    
+    return name
+
+def batch_names(stats_files):
+    '''
+    The name of the directory for each stats file in batch mode: its
+    stats_name, inside the directories it is in below the one that all
+    the stats files share (eg: a.feat/stats/zstat1 and
+    b.feat/stats/zstat1 for /path/a.feat/stats/zstat1.nii.gz and
+    /path/b.feat/stats/zstat1.nii.gz, or just zstat1 if they're all in
+    the same directory)
+    '''
+    dirs = [ os.path.dirname(os.path.abspath(stats_file)).split(os.sep)
+                for stats_file in stats_files ]
+    common = os.path.commonprefix(dirs)
+    
+    return [ os.path.join(*(d[len(common):] + [ stats_name(stats_file) ]))
+                for d, stats_file in zip(dirs, stats_files) ]
+
+def load_background(arguments, parser):
+    '''
+    READ IN THE BACKGROUND DATA
+    scale it by its maximum and get rid of the bottom 6% of values
+    
+    '''
+    try:
+        bg_img = loading.load_image(arguments.background_file)
+        bg_data = bg_img.get_data()
+    except:
+        cli.error(parser, 'background file can not be loaded')
+    
+    # Make sure all data is float:
+    bg_data = bg_data/1.
+
+    # Scale the background_data by its maximum
+    bg_data = bg_data / bg_data.max()
+
+    # And get rid of the bottom 6% of values in the background image
+    bg_data[bg_data < 0.06] = 0
+    
+    # Now also save the pixel dimensions
+    zooms = bg_img.get_header().get_zooms()
+
+    return bg_img, bg_data, zooms
+
+def load_stats(stats_file, bg_img, bg_data, parser, volume=None):
+    '''
+    READ IN A STATS FILE
+    and check that it is the same size as the background file
+    If the stats file is 4D only the given volume is read in
+    
+    '''
+    try:
+        stats_img = loading.load_image(stats_file)
+        if volume is None:
+            stats_data = stats_img.get_data()
+        else:
+            stats_data = np.asarray(stats_img.dataobj[..., volume])
+    except:
+        cli.error(parser, 'stats file {} can not be loaded'.format(stats_file))
+    
+    # Check that they're the same shape and have the same zoom dimensions
+    if not bg_data.shape == stats_data.shape:
+        cli.error(parser, 'files are not the same shape')
+    
+    if not bg_img.get_header().get_zooms()[:3] == stats_img.get_header().get_zooms()[:3]:
+        cli.error(parser, 'files do not have the same voxel dimensions')
+    
+    # Make sure all data is float:
+    stats_data = stats_data/1.
+
+    # And get rid of the stats values outside the background image
+    stats_data[bg_data < 0.06] = 0
+    
+    return stats_data
+
+def load_background_lazy(arguments, parser):
+    '''
+    READ IN ONLY THE BACKGROUND DATA THAT WILL BE DRAWN
+    The file is memory mapped (if it is uncompressed) and only the
+    bounding box of the voxels above 6% of the maximum is converted
+    to float32.
+    Returns the image, the data inside the box, the voxel dimensions,
+    the shape of the whole volume and the box
+    '''
+    try:
+        bg_img = loading.load_image(arguments.background_file)
+    except:
+        cli.error(parser, 'background file can not be loaded')
+    
+    bg_vol = loading.LazyVolume(bg_img)
+    
+    # Find the voxels that are at least 6% of the maximum
+    # background value, these are the only ones that are drawn
+    bg_max = bg_vol.max()
+    box = bg_vol.bounding_box(0.06 * bg_max)
+    
+    if box is None:
+        cli.error(parser, 'background file is empty')
+    
+    # Read in the box and scale the background_data by its maximum
+    bg_data = bg_vol.read(box, 1. / bg_max)
+    
+    # And get rid of the bottom 6% of values in the background image
+    bg_data[bg_data < 0.06] = 0
+    
+    return bg_img, bg_data, bg_vol.zooms, bg_vol.shape, box
+
+def load_stats_lazy(stats_file, bg_img, bg_data, box, parser, volume=None):
+    '''
+    READ IN THE PART OF A STATS FILE INSIDE THE BACKGROUND BOX
+    The headers are checked before any voxel data is read
+    If the stats file is 4D only the given volume is read in
+    '''
+    try:
+        stats_img = loading.load_image(stats_file)
+    except:
+        cli.error(parser, 'stats file {} can not be loaded'.format(stats_file))
+    
+    # Check that they're the same shape and have the same zoom dimensions
+    try:
+        loading.check_same_space(bg_img, stats_img)
+    except ValueError as err:
+        cli.error(parser, err)
+    
+    stats_data = loading.LazyVolume(stats_img, volume=volume).read(box)
+    
+    # And get rid of the stats values outside the background image
+    stats_data[bg_data < 0.06] = 0
+    
+    return stats_data
+
+def create_colormap(arguments):
+    # make a color map of fixed colors given in the arguments
+    import matplotlib.colors as mcolors
+    cmap = mcolors.ListedColormap(arguments.colorlist)
+    bounds = np.linspace(0,1,len(arguments.colorlist)+1)
+    norm = mcolors.BoundaryNorm(bounds, cmap.N)
+
+    arguments.colormap = cmap
+    return arguments, cmap
+
+def create_test_data(shape=(20, 40, 30)):
+    '''
+    Make a synthetic background and stats volume. The default shape
+    gives the original little test volume, bigger shapes (eg: the
+    standard space sizes in makepngs.bench_render) have the same
+    pattern scaled up.
+    '''
+    nx, ny, nz = shape
+    
+    # The background gets brighter along the x and z axes
+    x, y, z = np.ogrid[:nx, :ny, :nz]
+    bg = (x + z) + np.zeros(shape)
+    
+    # Blank out the same fraction of the edges as in the 20 x 40 x 30
+    # version
+    bg[:int(round(nx * 3 / 20.)),:,:] = 0
+    bg[nx - int(round(nx * 2 / 20.)):,:,:] = 0
+    bg[:,:int(round(ny * 11 / 40.)),:] = 0
+    bg[:,ny - int(round(ny * 17 / 40.)):,:] = 0
+    
+    bg = bg/1.
+    bg = bg/np.max(bg)
+
+    # And put a cube of random stats values in the middle
+    stats = np.zeros_like(bg)
+    stats = stats/1.
+    side = max(5, min(shape) // 4)
+    x0, y0, z0 = nx // 2, ny // 4, nz // 3
+    stats[x0:x0+side, y0:y0+side, z0:z0+side] = np.random.random([side, side, side])
+    
+    return bg, stats
+
+def stats_only(stats):
+    '''
+    Find the slices along each axis that have stats data in them.
+    Returns three boolean arrays (see cropping.occupancy) from one pass
+    over the stats volume, so it only needs to be done once for each
+    stats file whatever the number of axes and slices you draw.
+    '''
+    return cropping.occupancy(stats > 0)
+
+def occupied_slice_ids(occupied, axis_name, xyz_dict, pad=5):
+    '''
+    The slice_ids, counted the way they are after rotate_data (with pad
+    empty slices at the start), of the slices that have stats data
+    '''
+    axis_orientation = xyz_dict['orientation'][axis_name]
+    axis_occupied = occupied[axis_orientation.permutation[2]]
+    
+    return sorted(axis_orientation.slice_id(np.flatnonzero(axis_occupied), len(axis_occupied), pad).tolist())
+
+def make_cluster_table(stats, offset, zooms, output_dir, xyz_dict, mni_func_list, arguments):
+    '''
+    Label the clusters in the (full resolution) stats data and save
+    their sizes and peaks in clusters.csv in the output directory.
+    offset is where the stats data starts in the whole volume (if it
+    was loaded lazily). Returns the voxel coordinates of the peaks in
+    the stats data, biggest cluster first.
+    '''
+    labels, n_clusters = clusters.label_clusters(stats, arguments.cluster_threshold)
+    sizes, peak_values, peaks = clusters.cluster_peaks(stats, labels)
+    
+    # The peaks in the whole volume, and in MNI space
+    peaks_volume = peaks + np.asarray(offset, dtype=np.intp)
+    peaks_mni = np.column_stack([ mni_func_list[i](xyz_dict['mni_const'][i], peaks_volume[:, i], zooms[i])
+                                    for i in range(3) ])
+    
+    clusters.write_table(os.path.join(output_dir, 'clusters.csv'),
+                            sizes, peak_values, peaks_volume, peaks_mni)
+    
+    if arguments.verbose:
+        print('{} clusters'.format(n_clusters))
+    
+    return peaks
+
+def peak_slice_ids(peaks, box, shape, xyz_dict, pad=5):
+    '''
+    The slice_ids for each axis, counted the way they are after
+    rotate_data (with pad empty slices at the start), of the slices
+    through the peaks (from make_cluster_table). box is the crop box
+    and shape the shape of the cropped data.
+    '''
+    peaks = peaks - np.array([ sl.start for sl in box ], dtype=np.intp)
+    
+    slice_ids = {}
+    for axis_name in xyz_dict['name']:
+        axis_orientation = xyz_dict['orientation'][axis_name]
+        axis = axis_orientation.permutation[2]
+    
+        # Leave out any peaks outside the cropped data
+        index = peaks[:, axis]
+        index = index[(index >= 0) & (index < shape[axis])]
+    
+        slice_ids[axis_name] = sorted(set(axis_orientation.slice_id(index, shape[axis], pad).tolist()))
+    
+    return slice_ids
+
+def rotate_data(bg, stats, slices_list, axis_name, shape, orientations=None):
+    # Turn the data as required. Nothing is rotated or copied here, each
+    # slice is cut out the right way up when it's drawn (see
+    # makepngs.orientation). The orientations come from the affine of
+    # the background image, or are the standard space ones.
+    # Return the turned data, and an updated slice list if necessary
+    if orientations is None:
+        orientations = orientation.standard_orientations()
+    
+    if not axis_name in orientations:
+        raise ValueError('data could not be rotated to {}'.format(axis_name))
+    
+    # Put the slice numbers in the order that the slices are cut (eg:
+    # the coronal slices go from the front to the back) so that each
+    # slice is labelled with the voxel it was cut from
+    axis_orientation = orientations[axis_name]
+    if axis_orientation.flips[2]:
+        axis = axis_orientation.permutation[2]
+        slices_list[axis] = slices_list[axis][::-1]
+    
+    bg = orientation.OrientedVolume(bg, axis_orientation)
+    stats = orientation.OrientedVolume(stats, axis_orientation)
+    
+    return bg, stats, slices_list
+
+def make_png(bg_slice, stats_slice,
+                        axis_name, mni_text, 
+                        png_name, arguments,
+                        outline_slice=None):
+    '''
+    Makes a png image from two slices overlayed, writes the 
+    mni coordinate in the bottom left corner, and saves to the
+    output directory 
+    The transparency option makes the background transparent
+    or not
+    The colormap option is the color that the statistics will
+    be presented in (over a gray background)
+    If an outline_slice (precomputed edge mask) is given it is drawn
+    instead of contouring the background slice
+    '''
+
+    # Set up the figure
+    import matplotlib.colors as mcolors
+    plt = cli.pyplot()
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    
+    # If you don't want a transparent background, add in a
+    # black background first
+    if not arguments.transparency:
+        black = ax.imshow(np.ones_like(bg_slice),
+                                interpolation='none',
+                                cmap='gray')
+    # Mask the data
+    m_stats_slice = np.ma.masked_where(stats_slice==0, stats_slice)
+    m_bg_slice = np.ma.masked_where(bg_slice < 0.06, bg_slice)
+
+    # First show the background slice
+    im1 = ax.imshow(m_bg_slice,
+                        interpolation='none',
+                        cmap='gray',
+                        vmin = 0,
+                        vmax = 1)
+    
+    # Then overlay the stats_slice
+    im2 = ax.imshow(m_stats_slice,
+                        interpolation='none',
+                        cmap=arguments.colormap,
+                        alpha=0.75,
+                        vmin = 0,
+                        vmax = 1)
+                        
+    # Add a black line around the edge of the background image
+    # it makes the brain look nicer :)
+    if outline_slice is None:
+        CS = plt.contour(bg_slice, [0.06, 1], linewidths=3, colors='k')
+    else:
+        m_outline_slice = np.ma.masked_where(~outline_slice, outline_slice)
+        im3 = ax.imshow(m_outline_slice,
+                            interpolation='none',
+                            cmap=mcolors.ListedColormap(['k']),
+                            vmin = 0,
+                            vmax = 1)
+
+    # Put a text box in the bottom center of the picture with the
+    # slice number in MNI space
+    text = ax.text(0.5, 0.01 , mni_text,
+        horizontalalignment='center',
+        verticalalignment='bottom',
+        transform=ax.transAxes,
+        color = arguments.textcolor_mni)
+    
+    # Put a little "R" in the middle right side of the image 
+    # if you're making axial slices
+    if axis_name == 'axial':
+        text = ax.text(0.99, 0.5 , 'R',
+        horizontalalignment='right',
+        verticalalignment='center',
+        transform=ax.transAxes,
+        color = arguments.textcolor_R)
+    
+    # Turn off axis labels
+    ax.get_xaxis().set_visible(False)
+    ax.get_yaxis().set_visible(False)
+    ax.set_frame_on(False)
+
+    # Save the figure
+    with profiler.stage('savefig', png_name):
+        cli.save_figure(os.path.join(arguments.output_dir, png_name), arguments, png_writer)
+    
+    plt.close()
+
+def make_png_numpy(bg_slice, stats_slice,
+                        axis_name, mni_text,
+                        png_name, arguments,
+                        outline_slice=None):
+    '''
+    Makes the same png as make_png but composites the two slices
+    directly with numpy instead of building a matplotlib figure
+    '''
+    rgba = composite_png(bg_slice, stats_slice,
+                            axis_name, mni_text,
+                            arguments,
+                            outline_slice=outline_slice)
+    
+    # Save the png
+    with profiler.stage('savefig', png_name):
+        png_writer.write(os.path.join(arguments.output_dir, png_name), rgba)
+
+def composite_png(bg_slice, stats_slice,
+                        axis_name, mni_text,
+                        arguments,
+                        outline_slice=None,
+                        scale=4, text_size=2):
+    '''
+    Composite the picture that make_png_numpy saves and return it
+    as an RGBA array. scale is the number of pixels for each voxel.
+    '''
+    # Use the precomputed outline if there is one, otherwise
+    # find the edge of the background image in this slice
+    outline = None
+    if outline_slice is None:
+        outline = bg_slice >= 0.06
+    
+    # Overlay the stats slice on the background slice and add a
+    # black line around the edge of the background image
+    rgba = compositor.composite_slice(bg_slice, stats_slice,
+                                        bg_cmap='gray',
+                                        overlay_cmap=arguments.colormap,
+                                        overlay_alpha=0.75,
+                                        bg_threshold=0.06,
+                                        outline=outline,
+                                        edge=outline_slice,
+                                        transparency=arguments.transparency,
+                                        scale=scale)
+    
+    # Put the slice number in MNI space in the bottom center
+    compositor.draw_text(rgba, mni_text, arguments.textcolor_mni,
+                            0.5, 0.01, ha='center', va='bottom',
+                            size=text_size)
+    
+    # Put a little "R" in the middle right side of the image 
+    # if you're making axial slices
+    if axis_name == 'axial':
+        compositor.draw_text(rgba, 'R', arguments.textcolor_R,
+                                0.99, 0.5, ha='right', va='center',
+                                size=text_size)
+    
+    return rgba
+
+def render_options(arguments):
+    '''
+    All the options that change what the pngs look like, so that
+    the incremental mode knows to remake pngs when they change
+    '''
+    colormap = arguments.colormap
+    if arguments.use_specificcolors:
+        colormap = arguments.colorlist
+    
+    return { 'colormap': colormap,
+                'transparency': arguments.transparency,
+                'textcolor_mni': arguments.textcolor_mni,
+                'textcolor_R': arguments.textcolor_R,
+                'renderer': arguments.renderer,
+                'compress_level': arguments.compress_level,
+                'palette': arguments.palette,
+                'strip_metadata': arguments.strip_metadata }
+
+def make_outlines(bg, xyz_dict):
+    '''
+    Make a boolean mask of the edge of the background image (above
+    the 6% threshold) for each axis. They're rotated in the same way
+    as the data so they can be sliced in the same way too.
+    '''
+    outlines = {}
+    
+    for axis_name in xyz_dict['name']:
+        bg_rot, bg_rot, slices_list = rotate_data(bg,
+                                                    bg,
+                                                    [ [], [], [] ],
+                                                    axis_name,
+                                                    0,
+                                                    xyz_dict['orientation'])
+        outlines[axis_name] = outline.edge_mask(bg_rot.view() >= 0.06)
+    
+    return outlines
+
+def set_render_data(bg, stats, pad, arguments):
+    '''
+    Store the cropped data (and the arguments) that render_unit needs
+    in the process that will make the pngs. pad is the number of
+    zeros that are added on every side of each slice.
+    '''
+    global render_data
+    render_data = { 'bg': bg,
+                    'stats': stats,
+                    'pad': pad,
+                    'arguments': arguments,
+                    'rotated': {} }
+
+def init_worker(bg_shared, stats_shared, shape, dtype, pad, arguments,
+                    worker_xyz_dict, outlines, compress_level, palette):
+    '''
+    Point each worker process at the cropped data in shared memory and
+    give it everything else that render_unit needs. Nothing is taken
+    from the globals that main sets, so the workers don't have to be
+    forked from the main process (eg: with the spawn start method)
+    '''
+    bg = np.frombuffer(bg_shared, dtype=dtype).reshape(shape)
+    stats = np.frombuffer(stats_shared, dtype=dtype).reshape(shape)
+    
+    set_render_data(bg, stats, pad, arguments)
+    
+    global profiler, png_writer, png_makers, slice_figures, bg_outlines, xyz_dict
+    
+    xyz_dict = worker_xyz_dict
+    bg_outlines = outlines
+    png_makers = renderers()
+    slice_figures = {}
+    
+    # Each worker saves its own pngs, in the same way
+    png_writer = PngWriter(0, compress_level=compress_level, palette=palette)
+    
+    # and only sends back what it records itself
+    profiler = profiling.Profiler(enabled=arguments.profile or arguments.profile_stats is not None)
+
+def render_unit(unit):
+    '''
+    Make one png from a (output_dir, axis_name, slice_id, mni_text, png_name)
+    work unit. The data is only rotated once per axis in each process
+    '''
+    output_dir, axis_name, slice_id, mni_text, png_name = unit
+    
+    if not axis_name in render_data['rotated']:
+        # The slices_list isn't needed here so rotate an empty one
+        with profiler.stage('rotate_data', axis_name):
+            bg, stats, slices_list = rotate_data(render_data['bg'],
+                                                    render_data['stats'],
+                                                    [ [], [], [] ],
+                                                    axis_name,
+                                                    0,
+                                                    xyz_dict['orientation'])
+        render_data['rotated'][axis_name] = (bg, stats)
+    
+    bg, stats = render_data['rotated'][axis_name]
+    
+    # Send the png to the right output directory
+    arguments = render_data['arguments']
+    if not arguments.output_dir == output_dir:
+        arguments = copy.copy(arguments)
+        arguments.output_dir = output_dir
+    
+    png_maker = png_makers[arguments.renderer]
+    
+    pad = render_data['pad']
+    
+    with profiler.stage('make_png', png_name):
+        png_maker(cropping.padded_slice(bg, slice_id, pad),
+                    cropping.padded_slice(stats, slice_id, pad),
+                    axis_name,
+                    mni_text,
+                    png_name,
+                    arguments,
+                    outline_slice=cropping.padded_slice(bg_outlines[axis_name], slice_id, pad))
+    
+    return png_name
+
+def render_unit_records(unit):
+    '''
+    render_unit in a worker process. The profiler records made for
+    the png are returned with its name so that they can be added to
+    the main process' profiler
+    '''
+    png_name = render_unit(unit)
+    
+    return png_name, profiler.take_records()
+
+def start_pool(bg, stats, pad, arguments):
+    '''
+    Start a pool of processes that all read the same cropped data
+    from shared memory. The orientations, the outlines and the png
+    writer's settings are handed to each process as well. Returns the
+    pool and a view of the shared stats data so that the next stats
+    map can be copied in to it.
+    '''
+    n_jobs = arguments.jobs
+    if n_jobs < 1:
+        n_jobs = mp.cpu_count()
+    
+    bg_shared = loading.share_array(bg)
+    stats_shared = loading.share_array(stats)
+    
+    pool = mp.Pool(n_jobs,
+                    initializer=init_worker,
+                    initargs=(bg_shared, stats_shared, bg.shape, bg.dtype, pad, arguments,
+                                xyz_dict, bg_outlines, png_writer.compress_level, png_writer.palette))
+    
+    shared_stats = np.frombuffer(stats_shared, dtype=stats.dtype).reshape(stats.shape)
+    
+    return pool, shared_stats
+
+def render_parallel(pool, work_units, arguments):
+    '''
+    Hand the work units out to the pool of processes
+    '''
+    for png_name, records in pool.imap_unordered(render_unit_records, work_units, chunksize=4):
+        profiler.add_records(records)
+        if arguments.verbose:
+            print('    ' + png_name)
+
+def make_work_units(bg, stats, slices_list, output_dir, cache,
+                        xyz_dict, mni_func_list, arguments, occupied=None, peak_slices=None):
+    '''
+    Loop through the three axes and make a list of all the pngs you
+    want to create as (output_dir, axis_name, slice_id, mni_text, png_name)
+    work units. If occupied (from stats_only) is given only the slices
+    that have stats data are included, and if peak_slices (from
+    peak_slice_ids) is given only the slices through the cluster peaks.
+    '''
+    work_units = []
+    
+    for axis_id in range(3):  
+        
+        axis_name = xyz_dict['name'][axis_id] # Get the name of the axis
+        print(axis_name.capitalize())        # and print to screen
+        
+        shape = xyz_dict['shape'][axis_id] # You also need the shape of the array
+        
+        bg_rot, stats_rot, rot_slices_list = rotate_data(bg,   # Rotate the data so your
+                                        stats,                 # axis of interest is last 
+                                        list(slices_list),     # and the slices look good
+                                        axis_name,             # (rotate a copy of the
+                                        shape,                 # slices_list each time)
+                                        xyz_dict['orientation'])
+        
+        slice_ids = range(len(rot_slices_list[axis_id]))
+        if occupied is not None:
+            slice_ids = occupied_slice_ids(occupied, axis_name, xyz_dict)
+                                                  # Make the image ONLY from slices
+                                                  # that have stats data
+        if peak_slices is not None:
+            slice_ids = peak_slices[axis_name]    # Or ONLY from the slices
+                                                  # through the cluster peaks
+        
+        # Loop through the slices
+        for slice_id in slice_ids:
+            
+            slice_n = rot_slices_list[axis_id][slice_id]
+            
+            mni = mni_func_list[axis_id](xyz_dict['mni_const'][axis_id], slice_n, xyz_dict['zooms'][axis_id])
+            
+            mni_text = '{} = {}'.format(xyz_dict['letter'][axis_id], mni)
+            
+            png_name = '{}_slice_{:04.0f}_{:+04.0f}.png'.format(axis_name, slice_id, mni)
+            
+            if cache is not None:
+                png_hash = cache.slice_hash(cropping.padded_slice(bg_rot, slice_id, 5),
+                                            cropping.padded_slice(stats_rot, slice_id, 5),
+                                            axis_name,
+                                            mni_text)
+                if cache.is_fresh(png_name, png_hash):
+                    continue                      # Don't make pngs that haven't
+                                                  # changed since the last run
+            
+            work_units.append((output_dir, axis_name, slice_id, mni_text, png_name))
+    
+    return work_units
+
+def make_montages(bg, stats, slices_list, output_dir,
+                        xyz_dict, mni_func_list, arguments, occupied=None):
+    '''
+    Make the combined strips of sagittal and axial slices that
+    CombiningPngs.py would make, straight from the (cropped) data
+    without writing a png for every slice (only from the slices that
+    have stats data if occupied is given)
+    '''
+    text_color = 'w'
+    if arguments.transparency:
+        text_color = 'k'
+    
+    for axis_id in range(3):
+        
+        axis_name = xyz_dict['name'][axis_id]
+        if not axis_name in [ 'sagittal', 'axial' ]:
+            continue                              # There aren't any combined
+                                                  # coronal strips
+        
+        shape = xyz_dict['shape'][axis_id]
+        
+        bg_rot, stats_rot, rot_slices_list = rotate_data(bg,
+                                        stats,
+                                        list(slices_list),
+                                        axis_name,
+                                        shape,
+                                        xyz_dict['orientation'])
+        
+        slice_ids = range(len(rot_slices_list[axis_id]))
+        if occupied is not None:
+            slice_ids = occupied_slice_ids(occupied, axis_name, xyz_dict)
+        
+        # Find the mni value of each of the slices you could draw
+        slices = []
+        for slice_id in slice_ids:
+            
+            slice_n = rot_slices_list[axis_id][slice_id]
+            mni = mni_func_list[axis_id](xyz_dict['mni_const'][axis_id], slice_n, xyz_dict['zooms'][axis_id])
+            slices.append((slice_id, mni))
+        
+        for strip in montage.select_strips(axis_name, slices):
+            
+            # Draw each slice on a transparent background so that
+            # the slices underneath show through where they overlap
+            tiles = [ compositor.composite_slice(cropping.padded_slice(bg_rot, slice_id, 5),
+                                                    cropping.padded_slice(stats_rot, slice_id, 5),
+                                                    bg_cmap='gray',
+                                                    overlay_cmap=arguments.colormap,
+                                                    overlay_alpha=0.75,
+                                                    bg_threshold=0.06,
+                                                    edge=cropping.padded_slice(bg_outlines[axis_name], slice_id, 5),
+                                                    transparency=True)
+                        for slice_id, mni in strip ]
+            
+            rgba = montage.combine(tiles,
+                                    [ mni for slice_id, mni in strip ],
+                                    axis_name,
+                                    text_color=text_color,
+                                    transparency=arguments.transparency)
+            
+            png_name = montage.strip_name(axis_name, strip)
+            png_writer.write(os.path.join(output_dir, png_name), rgba)
+            
+            if arguments.verbose:
+                print('    ' + png_name)
+
+def make_previews(bg, stats, slices_list, output_dir,
+                        xyz_dict, mni_func_list, arguments, occupied=None):
+    '''
+    Make one small contact sheet for each axis from every
+    preview_step-th slice of the (block averaged) data (that has
+    stats data if occupied is given)
+    '''
+    for axis_id in range(3):
+        
+        axis_name = xyz_dict['name'][axis_id]
+        shape = xyz_dict['shape'][axis_id]
+        
+        bg_rot, stats_rot, rot_slices_list = rotate_data(bg,
+                                        stats,
+                                        list(slices_list),
+                                        axis_name,
+                                        shape,
+                                        xyz_dict['orientation'])
+        
+        slice_ids = range(0, len(rot_slices_list[axis_id]), arguments.preview_step)
+        if occupied is not None:
+            occupied_ids = set(occupied_slice_ids(occupied, axis_name, xyz_dict))
+            slice_ids = [ slice_id for slice_id in slice_ids if slice_id in occupied_ids ]
+        
+        tiles = []
+        for slice_id in slice_ids:
+            
+            stats_slice = cropping.padded_slice(stats_rot, slice_id, 5)
+            
+            slice_n = rot_slices_list[axis_id][slice_id]
+            mni = mni_func_list[axis_id](xyz_dict['mni_const'][axis_id], slice_n, xyz_dict['zooms'][axis_id])
+            
+            tiles.append(composite_png(cropping.padded_slice(bg_rot, slice_id, 5),
+                                        stats_slice,
+                                        axis_name,
+                                        '{} = {}'.format(xyz_dict['letter'][axis_id], mni),
+                                        arguments,
+                                        outline_slice=cropping.padded_slice(bg_outlines[axis_name], slice_id, 5),
+                                        scale=2, text_size=1))
+        
+        if not tiles:
+            continue
+        
+        png_name = 'preview_{}.png'.format(axis_name)
+        compositor.write_png(os.path.join(output_dir, png_name),
+                                preview.contact_sheet(tiles, transparency=arguments.transparency))
+        
+        if arguments.verbose:
+            print('    ' + png_name)
+
+def make_png_persistent(bg_slice, stats_slice,
+                        axis_name, mni_text,
+                        png_name, arguments,
+                        outline_slice=None):
+    '''
+    Makes the same picture as make_png but only builds one matplotlib
+    figure for each axis orientation and reuses it for every slice
+    '''
+    if not axis_name in slice_figures:
+        # Only put an "R" on axial slices
+        textcolor_R = None
+        if axis_name == 'axial':
+            textcolor_R = arguments.textcolor_R
+        
+        # Contour the background unless there's a precomputed outline
+        contour_levels = None
+        if outline_slice is None:
+            contour_levels = [0.06, 1]
+        
+        slice_figures[axis_name] = SliceFigure(bg_slice.shape,
+                                                bg_cmap='gray',
+                                                overlay_cmap=arguments.colormap,
+                                                overlay_alpha=0.75,
+                                                bg_threshold=0.06,
+                                                contour_levels=contour_levels,
+                                                outline=outline_slice is not None,
+                                                textcolor_mni=arguments.textcolor_mni,
+                                                textcolor_R=textcolor_R,
+                                                transparency=arguments.transparency)
+    
+    fig = slice_figures[axis_name]
+    fig.update(bg_slice, stats_slice, contour_slice=bg_slice,
+                    mni_text=mni_text, outline_slice=outline_slice)
+    with profiler.stage('savefig', png_name):
+        cli.save_slice_figure(fig, os.path.join(arguments.output_dir, png_name), arguments, png_writer)
+
+def renderers():
+    '''
+    The function that makes each png for each --renderer
+    '''
+    return { 'matplotlib': make_png,
+                'persistent': make_png_persistent,
+                'numpy': make_png_numpy }
+
+
+#==============================================================================
+# NOW THE FUN BEGINS
+def main():
+    '''
+    Read the arguments from the command line and make the pngs
+    '''
+    # The functions above share these with main
+    global profiler, png_writer, png_makers, slice_figures, bg_outlines, xyz_dict
+    
+    profiler = profiling.Profiler() # Keep track of the time and memory
+                                    # used by each stage
+    
+    with profiler.stage('setup_argparser'):
+        arguments, parser = setup_argparser() # Read arguments from command line
+    
+    cli.start_profiler(profiler, arguments)
+    
+    stats_files = find_stats_files(arguments, parser) # Expand any wildcards
+    
+    if len(stats_files) > 1:            # Give each stats file its own
+        arguments.batch = True          # output directory if there's more than one
+    
+    xyz_dict, mni_func_list = hardcoded_variables() # Define some of the hardcoded
+                                                     # variables
+    
+    # Load the background once, whatever the number of stats files
+    with profiler.stage('load_background'):
+        if arguments.lazy:
+            bg_img, bg, zooms, shape, box = load_background_lazy(arguments, parser)
+                                                      # Only load the data you'll draw
+            offset = [ sl.start for sl in box ]
+        else:
+            bg_img, bg, zooms = load_background(arguments, parser) # Load data
+            shape, box, offset = bg.shape, None, (0, 0, 0)
+    
+    #bg, stats = create_test_data() # Use test data
+    
+    # Block average the data for the previews (but keep the full
+    # resolution background to mask the stats files as they're loaded)
+    load_bg, load_offset, load_zooms = bg, offset, zooms
+    if arguments.preview:
+        bg, offset = preview.block_average(bg, arguments.preview, load_offset)
+        shape = preview.averaged_shape(shape, arguments.preview)
+        zooms = tuple( z * arguments.preview for z in zooms[:3] )
+    
+    xyz_dict['shape'] = shape # Add shape into your xyz_dict
+    
+    xyz_dict['zooms'] = zooms # Add voxel dimensions to your xyz_dict
+    
+    xyz_dict['orientation'] = orientation.from_affine(bg_img.affine)
+                                      # Work out which way up each
+                                      # axis' slices go from the affine
+    
+    with profiler.stage('crop_data'):
+        bg_box, slices_list = cropping.crop_box(bg, pad=5)
+        bg_cropped = bg[bg_box]                       # Crop data (but keep slice_ids)
+                                                      # the 5 slices of padding on all
+                                                      # sides are added when each slice
+                                                      # is drawn
+    
+    # Make the slice_ids relative to the whole volume
+    slices_list = [ [ n + offset[i] for n in sl ] for i, sl in enumerate(slices_list) ]
+    
+    with profiler.stage('make_outlines'):
+        bg_outlines = make_outlines(bg_cropped, xyz_dict) # Work out the edge of the
+                                                          # brain once, it's the same
+                                                          # for every stats file
+    
+    if arguments.use_specificcolors:
+        arguments, cmap = create_colormap(arguments) # Update the colormap if necessary    
+    
+    # Choose how to draw the pngs
+    png_makers = renderers()
+    slice_figures = {}
+    
+    # The palette for 8 bit pngs (if you want smaller files) and the
+    # animations is made from the same colormaps that the pictures are
+    # drawn with
+    palette = encoder.palette_from_luts('gray', arguments.colormap, overlay_alpha=0.75)
+    
+    # Save the pngs in the background while the next ones are drawn
+    # (or add them to a container file and the animations)
+    png_writer = cli.make_png_writer(arguments, palette)
+    
+    # The pool of processes is started with the first stats file and
+    # then reused for all the others
+    pool = None
+    
+    # Make a list of all the 3D stats volumes, 4D stats files are
+    # read in one volume at a time
+    stats_volumes = find_stats_volumes(stats_files, arguments, parser)
+    
+    # Loop through the stats volumes
+    for stats_file, volume, output_dir in stats_volumes:
+    
+        if arguments.batch or volume is not None:
+            print(os.path.relpath(output_dir, arguments.output_dir))
+    
+        cli.make_output_dir(output_dir)     # Make the output directory if
+                                            # it doesn't already exist
+    
+        with profiler.stage('load_stats', output_dir):
+            if arguments.lazy:
+                stats = load_stats_lazy(stats_file, bg_img, load_bg, box, parser, volume)
+            else:
+                stats = load_stats(stats_file, bg_img, load_bg, parser, volume)
+    
+        # Find the clusters at full resolution and save the table
+        # of their sizes and peaks next to the pngs
+        peaks = None
+        if arguments.clusters or arguments.peak_slices:
+            with profiler.stage('clusters', output_dir):
+                peaks = make_cluster_table(stats, load_offset, load_zooms, output_dir,
+                                            xyz_dict, mni_func_list, arguments)
+    
+        if arguments.preview:
+            stats = preview.block_average(stats, arguments.preview, load_offset)[0]
+    
+        stats_cropped = stats[bg_box] # Crop the stats data to the same box
+    
+        # Find the slices that have stats data once, for every axis and mode
+        occupied = None
+        if arguments.crop_option == 'stats':
+            with profiler.stage('stats_only', output_dir):
+                occupied = stats_only(stats_cropped)
+    
+        # Only make the contact sheets in preview mode
+        if arguments.preview:
+            make_previews(bg_cropped, stats_cropped, slices_list, output_dir,
+                            xyz_dict, mni_func_list, arguments, occupied)
+            continue
+    
+        # Only make the combined strips in montage mode
+        if arguments.montage:
+            make_montages(bg_cropped, stats_cropped, slices_list, output_dir,
+                            xyz_dict, mni_func_list, arguments, occupied)
+            continue
+    
+        # Only make the slices through the cluster peaks
+        peak_slices = None
+        if arguments.peak_slices:
+            peak_slices = peak_slice_ids(peaks, bg_box, stats_cropped.shape, xyz_dict)
+    
+        # Keep track of the pngs that have already been made
+        cache = None
+        if arguments.incremental:
+            cache = RenderCache(output_dir, render_options(arguments))
+    
+        # Make a list of all the pngs you want to create
+        with profiler.stage('make_work_units', output_dir):
+            work_units = make_work_units(bg_cropped, stats_cropped, slices_list,
+                                            output_dir, cache,
+                                            xyz_dict, mni_func_list, arguments, occupied,
+                                            peak_slices)
+    
+        # Now make the pngs and save them in output_directory
+        if arguments.jobs == 1:
+            set_render_data(bg_cropped, stats_cropped, 5, arguments)
+            for unit in work_units:
+                png_name = render_unit(unit)
+                if arguments.verbose and profiler.enabled:
+                    print('    {}  {:.1f} ms'.format(png_name, profiler.last('make_png')['wall'] * 1000))
+                elif arguments.verbose:
+                    print('    ' + png_name)
+    
+        else:
+            if pool is None:
+                pool, shared_stats = start_pool(bg_cropped, stats_cropped, 5, arguments)
+            shared_stats[...] = stats_cropped
+            with profiler.stage('render_parallel', output_dir):
+                render_parallel(pool, work_units, arguments)
+    
+        # Save the manifest of pngs for next time
+        if cache is not None:
+            cache.save()
+            print('Incremental: ' + cache.summary())
+    
+        # Finish this stats file's container and animations
+        if arguments.container or arguments.animate:
+            with profiler.stage('png_writer', output_dir):
+                png_writer.close()
+    
+    if pool is not None:
+        pool.close()
+        pool.join()
+    
+    # Wait for the last pngs to be saved and report the time
+    # and memory used
+    cli.finish(profiler, png_writer, arguments)
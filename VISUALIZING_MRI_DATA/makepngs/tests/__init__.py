@@ -0,0 +1,39 @@
+'''
+Tests for the makepngs package
+
+Run them from the VISUALIZING_MRI_DATA directory with:
+    python -m unittest discover -s makepngs/tests -t .
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import io
+import numpy as np
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def read_png(data):
+    '''
+    Decode the bytes of a png file with matplotlib (libpng) as an
+    (h, w, 4) uint8 RGBA array
+    '''
+    from makepngs import cli
+    from makepngs import encoder
+
+    cli.use_agg()
+    import matplotlib.image as mpimg
+
+    return encoder.to_rgba_uint8(mpimg.imread(io.BytesIO(data), format='png'))
+
+def random_rgba(shape=(13, 17), n_colors=None, seed=0):
+    '''
+    A random (h, w, 4) uint8 RGBA picture, made from n_colors different
+    colors if it's given
+    '''
+    random = np.random.RandomState(seed)
+
+    if n_colors is None:
+        return random.randint(0, 256, shape + (4,)).astype(np.uint8)
+
+    colors = random.randint(0, 256, (n_colors, 4)).astype(np.uint8)
+    return colors[random.randint(0, n_colors, shape)]
@@ -0,0 +1,324 @@
+'''
+The APNG and GIF sweeps written by makepngs.animation play back every
+frame that was added
+
+The files are decoded here from scratch (the APNG chunks and the GIF
+blocks and LZW codes) and each frame is drawn on top of the last one,
+the way a viewer would show it.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+import numpy as np
+
+from makepngs import animation
+from makepngs import encoder
+from makepngs.tests import read_png
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def lzw_decompress(data, min_code_size=8):
+    '''
+    Decode GIF LZW data as a list of indices
+    '''
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+
+    out = []
+    bits, n_bits, position = 0, 0, 0
+    data = bytearray(data)
+
+    table = None
+    code_size = min_code_size + 1
+    previous = None
+
+    while True:
+        while n_bits < code_size:
+            bits |= data[position] << n_bits
+            n_bits += 8
+            position += 1
+        code = bits & ((1 << code_size) - 1)
+        bits >>= code_size
+        n_bits -= code_size
+
+        if code == clear_code:
+            table = [ [ i ] for i in range(clear_code) ] + [ None, None ]
+            code_size = min_code_size + 1
+            previous = None
+            continue
+
+        if code == end_code:
+            return out
+
+        if previous is None:
+            entry = table[code]
+        else:
+            if code < len(table):
+                entry = table[code]
+            else:
+                entry = previous + [ previous[0] ]
+            if len(table) < 4096:
+                table.append(previous + [ entry[0] ])
+
+        if len(table) == (1 << code_size) and code_size < 12:
+            code_size += 1
+
+        out.extend(entry)
+        previous = entry
+
+def read_apng(fname):
+    '''
+    The number of frames in the acTL chunk, the palette indices of the
+    picture after each frame, the (delay numerator, denominator) of
+    each frame and the sequence numbers of the fcTL and fdAT chunks
+    '''
+    with open(fname, 'rb') as f:
+        data = f.read()
+
+    frames, sequence = [], []
+    alpha = np.zeros(256, dtype=np.uint8) + 255
+    position = 8
+    while position < len(data):
+        length, = struct.unpack('>I', data[position : position + 4])
+        chunk_type = data[position + 4 : position + 8]
+        chunk = data[position + 8 : position + 8 + length]
+        position += 12 + length
+
+        if chunk_type == b'IHDR':
+            width, height = struct.unpack('>II', chunk[:8])
+        elif chunk_type == b'tRNS':
+            alpha[:length] = np.frombuffer(chunk, dtype=np.uint8)
+        elif chunk_type == b'acTL':
+            n_frames, = struct.unpack('>I', chunk[:4])
+        elif chunk_type == b'fcTL':
+            control = struct.unpack('>IIIIIHHBB', chunk)
+            sequence.append(control[0])
+            frames.append([ control, b'' ])
+        elif chunk_type == b'IDAT':
+            frames[-1][1] += chunk
+        elif chunk_type == b'fdAT':
+            sequence.append(struct.unpack('>I', chunk[:4])[0])
+            frames[-1][1] += chunk[4:]
+
+    canvas = np.zeros((height, width), dtype=np.uint8)
+    pictures, delays = [], []
+    for control, frame_data in frames:
+        seq, columns, rows, column, row, delay_num, delay_den, dispose, blend = control
+
+        raw = np.frombuffer(zlib.decompress(frame_data), dtype=np.uint8).reshape(rows, columns + 1)
+        assert np.all(raw[:, 0] == 0)           # Every row is unfiltered
+        frame = raw[:, 1:]
+
+        region = canvas[row : row + rows, column : column + columns]
+        if blend:
+            keep = alpha[frame] == 0             # Blend over the last frame
+            region[~keep] = frame[~keep]
+        else:
+            region[...] = frame
+
+        pictures.append(canvas.copy())
+        delays.append((delay_num, delay_den))
+
+    return n_frames, pictures, delays, sequence
+
+def sub_blocks(data, position):
+    '''
+    Join the GIF data sub-blocks that start at position. Returns the
+    data and the position after them
+    '''
+    blocks = b''
+    while True:
+        size = bytearray(data[position : position + 1])[0]
+        position += 1
+        if size == 0:
+            return blocks, position
+        blocks += data[position : position + size]
+        position += size
+
+def read_gif(fname):
+    '''
+    The palette (global color table), the palette indices of the
+    picture after each frame and the delay of each frame (in
+    hundredths of a second)
+    '''
+    with open(fname, 'rb') as f:
+        data = f.read()
+
+    assert data[:6] == b'GIF89a'
+    width, height, flags = struct.unpack('<HHB', data[6:11])
+    n_colors = 2 << (flags & 7)
+    palette = np.frombuffer(data[13 : 13 + 3 * n_colors], dtype=np.uint8).reshape(-1, 3)
+
+    canvas = np.zeros((height, width), dtype=np.uint8)
+    pictures, delays = [], []
+    transparent = None
+    position = 13 + 3 * n_colors
+    while True:
+        block = data[position : position + 1]
+
+        if block == b'\x3b':
+            return palette, pictures, delays
+
+        if block == b'\x21':
+            label = data[position + 1 : position + 2]
+            body, position = sub_blocks(data, position + 2)
+            if label == b'\xf9':
+                packed, delay, index = struct.unpack('<BHB', body)
+                transparent = index if packed & 1 else None
+                delays.append(delay)
+            continue
+
+        assert block == b'\x2c'
+        column, row, columns, rows, packed = struct.unpack('<HHHHB', data[position + 1 : position + 10])
+        min_code_size = bytearray(data[position + 10 : position + 11])[0]
+        lzw, position = sub_blocks(data, position + 11)
+
+        frame = np.array(lzw_decompress(lzw, min_code_size), dtype=np.uint8).reshape(rows, columns)
+
+        region = canvas[row : row + rows, column : column + columns]
+        if transparent is None:
+            region[...] = frame
+        else:
+            keep = frame == transparent
+            region[~keep] = frame[~keep]
+
+        pictures.append(canvas.copy())
+
+def make_frames(palette, shape=(20, 24)):
+    '''
+    A few frames made from the palette colors: a first frame with
+    some transparent pixels, a small opaque change, no change at all
+    and a change that makes some pixels transparent
+    '''
+    random = np.random.RandomState(0)
+    opaque = np.nonzero(palette[:, 3] == 255)[0]
+
+    frame = palette[random.choice(opaque, shape)]
+    frame[:3] = 0
+    frames = [ frame ]
+
+    frame = frame.copy()
+    frame[5:9, 6:15] = palette[random.choice(opaque, (4, 9))]
+    frames += [ frame, frame.copy() ]
+
+    frame = frame.copy()
+    frame[10:14, 2:5] = 0
+    frame[15, 20] = palette[opaque[0]]
+    frames.append(frame)
+
+    return frames
+
+#==============================================================================
+class TestSweepWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.palette = encoder.palette_from_luts('gray', 'autumn')
+        self.table = encoder.color_table(self.palette)
+        self.frames = make_frames(self.palette)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_sweep(self, animation_format, fps=10):
+        fname = animation.animation_name(self.tmp_dir, 'axial', animation_format)
+
+        sweep = animation.SweepWriter(fname, self.palette, animation_format=animation_format,
+                                        fps=fps, table=self.table)
+        for frame in self.frames:
+            sweep.add(frame)
+        sweep.close()
+
+        return fname
+
+    def test_apng(self):
+        fname = self.write_sweep('apng', fps=8)
+
+        n_frames, pictures, delays, sequence = read_apng(fname)
+
+        self.assertEqual(n_frames, len(self.frames))
+        self.assertEqual(sequence, list(range(len(sequence))))
+        self.assertEqual(delays, [ (1, 8) ] * len(self.frames))
+
+        for frame, picture in zip(self.frames, pictures):
+            np.testing.assert_array_equal(picture, encoder.lookup(frame, self.table, self.palette))
+
+        # Viewers that don't know about APNG show the first frame
+        with open(fname, 'rb') as f:
+            np.testing.assert_array_equal(read_png(f.read()),
+                                            self.palette[encoder.lookup(self.frames[0],
+                                                                        self.table, self.palette)])
+
+    def test_gif(self):
+        fname = self.write_sweep('gif', fps=20)
+
+        palette, pictures, delays = read_gif(fname)
+
+        np.testing.assert_array_equal(palette[:len(self.palette)], self.palette[:, :3])
+        self.assertEqual(delays, [ 5 ] * len(self.frames))
+        self.assertEqual(len(pictures), len(self.frames))
+
+        # Transparent pixels are drawn over black
+        for frame, picture in zip(self.frames, pictures):
+            frame = frame.copy()
+            frame[frame[..., 3] == 0] = (0, 0, 0, 255)
+            np.testing.assert_array_equal(picture, encoder.lookup(frame, self.table, self.palette))
+
+    def test_frame_shape(self):
+        fname = animation.animation_name(self.tmp_dir, 'axial', 'apng')
+        sweep = animation.SweepWriter(fname, self.palette, table=self.table)
+        sweep.add(self.frames[0])
+
+        self.assertRaises(ValueError, sweep.add, self.frames[0][1:])
+        sweep.close()
+
+    def test_no_frames(self):
+        fname = animation.animation_name(self.tmp_dir, 'axial', 'gif')
+        animation.SweepWriter(fname, self.palette, 'gif', table=self.table).close()
+
+        self.assertFalse(os.path.exists(fname))
+
+class TestLzw(unittest.TestCase):
+
+    def test_round_trip(self):
+        random = np.random.RandomState(0)
+
+        # Repetitive data fills the code table (and clears it) quickly,
+        # random data needs the longest codes
+        for indices in (np.zeros(5000, dtype=np.uint8),
+                        random.randint(0, 4, 30000).astype(np.uint8),
+                        random.randint(0, 256, 30000).astype(np.uint8),
+                        np.array([ 7 ], dtype=np.uint8)):
+            data = animation.lzw_compress(indices.tobytes())
+            self.assertEqual(lzw_decompress(data), indices.tolist())
+
+class TestSweepSet(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_one_sweep_for_each_axis(self):
+        palette = encoder.palette_from_luts('gray', 'autumn')
+        frames = make_frames(palette)
+
+        sweeps = animation.SweepSet(palette, animation_format='apng')
+        for i, frame in enumerate(frames):
+            for axis_name in ('axial', 'sagittal'):
+                sweeps.add(os.path.join(self.tmp_dir, '{}_slice_{:04d}.png'.format(axis_name, i)), frame)
+        sweeps.add(os.path.join(self.tmp_dir, 'montage.png'), frames[0])
+        sweeps.close()
+
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), [ 'sweep_axial.apng', 'sweep_sagittal.apng' ])
+        self.assertEqual(read_apng(os.path.join(self.tmp_dir, 'sweep_axial.apng'))[0], len(frames))
+
+if __name__ == '__main__':
+    unittest.main()
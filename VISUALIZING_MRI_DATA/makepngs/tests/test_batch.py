@@ -0,0 +1,77 @@
+'''
+In batch mode every stats file gets its own output directory, even if
+some of them have the same name
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+from makepngs import statsbg
+
+#==============================================================================
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.arguments = argparse.Namespace(output_dir=os.path.join(self.tmp_dir, 'pngs'), batch=True)
+        self.parser = argparse.ArgumentParser()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def save_stats(self, *names):
+        '''
+        Save a small stats file for each name (a path inside the
+        temporary directory) and return their file names
+        '''
+        import nibabel as nib
+
+        fnames = []
+        for name in names:
+            fname = os.path.join(self.tmp_dir, name)
+            if not os.path.isdir(os.path.dirname(fname)):
+                os.makedirs(os.path.dirname(fname))
+            nib.save(nib.Nifti1Image(np.zeros((2, 3, 4), dtype=np.float32), np.eye(4)), fname)
+            fnames.append(fname)
+
+        return fnames
+
+    def output_dirs(self, stats_files):
+        return [ os.path.relpath(output_dir, self.arguments.output_dir)
+                    for stats_file, volume, output_dir
+                    in statsbg.find_stats_volumes(stats_files, self.arguments, self.parser) ]
+
+    def test_same_directory(self):
+        stats_files = self.save_stats('zstat1.nii.gz', 'zstat2.nii')
+
+        self.assertEqual(self.output_dirs(stats_files), [ 'zstat1', 'zstat2' ])
+
+    def test_same_name(self):
+        stats_files = self.save_stats(os.path.join('a.feat', 'stats', 'zstat1.nii.gz'),
+                                        os.path.join('b.feat', 'stats', 'zstat1.nii.gz'))
+
+        self.assertEqual(self.output_dirs(stats_files),
+                            [ os.path.join('a.feat', 'stats', 'zstat1'),
+                                os.path.join('b.feat', 'stats', 'zstat1') ])
+
+    def test_same_output_dir(self):
+        # x.nii and x.nii.gz can't be told apart
+        stats_files = self.save_stats('x.nii', 'x.nii.gz')
+
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            self.assertRaises(SystemExit, self.output_dirs, stats_files)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+'''
+The slices drawn through each cluster peak (--peak_slices) are labelled
+with the same MNI coordinates as the peak in clusters.csv
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import csv
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+from makepngs import statsbg
+from makepngs.tests.test_jobs import SCRIPTS_DIR
+
+#==============================================================================
+class TestPeakSlices(unittest.TestCase):
+
+    def setUp(self):
+        import nibabel as nib
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+        # The background isn't in the middle of the volume, so the
+        # slices can't be labelled from the wrong end of the crop box
+        bg = statsbg.create_test_data()[0]
+        stats = np.zeros_like(bg)
+        stats[10:12, 13:15, 8:10] = 0.5
+        stats[11, 14, 9] = 0.9
+        stats[15:17, 20:23, 20:22] = 0.7
+        stats[16, 22, 20] = 0.8
+
+        affine = np.diag([-2., 2., 2., 1.])
+        self.bg_file = os.path.join(self.tmp_dir, 'bg.nii.gz')
+        self.stats_file = os.path.join(self.tmp_dir, 'stats.nii.gz')
+        nib.save(nib.Nifti1Image(bg.astype(np.float32), affine), self.bg_file)
+        nib.save(nib.Nifti1Image(stats.astype(np.float32), affine), self.stats_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_peak_slices(self):
+        output_dir = os.path.join(self.tmp_dir, 'pngs')
+
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([ sys.executable, 'MakePngs_StatsBg_StandardSpace.py',
+                                    '-re', 'numpy', '-pk',
+                                    self.bg_file, self.stats_file, output_dir ],
+                                    cwd=SCRIPTS_DIR, stdout=devnull)
+
+        with open(os.path.join(output_dir, 'clusters.csv')) as f:
+            rows = list(csv.DictReader(f))
+
+        self.assertEqual([ (row['peak_x'], row['peak_y'], row['peak_z']) for row in rows ],
+                            [ ('16', '22', '20'), ('11', '14', '9') ])
+
+        # Every png is a slice through one of the peaks, named with the
+        # peak's MNI coordinate
+        pngs = set(os.listdir(output_dir)) - set([ 'clusters.csv' ])
+        self.assertEqual(len(pngs), 3 * len(rows))
+
+        for axis_name, column in zip(('sagittal', 'coronal', 'axial'), ('x', 'y', 'z')):
+            mni = set( png[-8:-4] for png in pngs if png.startswith(axis_name) )
+            self.assertEqual(mni, set( '{:+04.0f}'.format(float(row['peak_mni_' + column]))
+                                        for row in rows ))
+
+if __name__ == '__main__':
+    unittest.main()
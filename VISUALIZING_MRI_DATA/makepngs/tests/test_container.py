@@ -0,0 +1,114 @@
+'''
+Slices saved in a container by makepngs.container.SliceArchive read
+back the same with SliceReader
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+import numpy as np
+
+from makepngs import container
+from makepngs import encoder
+from makepngs.tests import random_rgba, read_png
+from makepngs.writer import PngWriter
+
+#==============================================================================
+# The png names of the slices that are saved
+NAMES = [ 'axial_slice_0012_+020.png',
+            'axial_slice_0003_-004.png',
+            'coronal_slice_0007_+000.png',
+            'sagittal_slice_0010.png' ]
+
+#==============================================================================
+class TestSliceArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.slices = dict( (name, random_rgba(shape=(9 + i, 11), n_colors=50, seed=i))
+                                for i, name in enumerate(NAMES) )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_archive(self, container_format, **kwargs):
+        fname = container.container_name(self.tmp_dir, container_format)
+
+        archive = container.SliceArchive(fname, container_format, metadata={ 'stats': 'zstat1' })
+        for name in NAMES:
+            archive.add(name, self.slices[name], **kwargs)
+        archive.close()
+
+        return fname
+
+    def check_round_trip(self, container_format, **kwargs):
+        fname = self.write_archive(container_format, **kwargs)
+
+        with container.SliceReader(fname) as reader:
+            self.assertEqual(reader.container_format, container_format)
+            self.assertEqual(reader.metadata, { 'stats': 'zstat1' })
+            self.assertEqual(len(reader), len(NAMES))
+
+            for name in NAMES:
+                np.testing.assert_array_equal(reader.read(name[:-4]), self.slices[name])
+
+            # The index comes from the names
+            self.assertEqual(reader.names('axial'), [ 'axial_slice_0003_-004', 'axial_slice_0012_+020' ])
+            np.testing.assert_array_equal(reader.get('axial', 12), self.slices[NAMES[0]])
+            np.testing.assert_array_equal(reader.get('sagittal', 10), self.slices[NAMES[3]])
+
+            info = [ info for info in reader.slices if info['name'] == 'axial_slice_0003_-004' ][0]
+            self.assertEqual((info['axis'], info['slice'], info['mni'], info['shape']),
+                                ('axial', 3, -4, [ 10, 11, 4 ]))
+
+            self.assertRaises(KeyError, reader.get, 'axial', 99)
+
+    def test_zip(self):
+        self.check_round_trip('zip')
+
+    def test_zip_palette(self):
+        self.check_round_trip('zip', palette=encoder.palette_from_luts(), compress_level=9)
+
+    def test_npz(self):
+        self.check_round_trip('npz')
+
+        # The arrays can be read with numpy too
+        data = np.load(container.container_name(self.tmp_dir, 'npz'))
+        np.testing.assert_array_equal(data['coronal_slice_0007_+000'], self.slices[NAMES[2]])
+
+    def test_png(self):
+        fname = self.write_archive('zip')
+
+        with container.SliceReader(fname) as reader:
+            np.testing.assert_array_equal(read_png(reader.png('axial_slice_0012_+020')),
+                                            self.slices[NAMES[0]])
+
+        with container.SliceReader(self.write_archive('npz')) as reader:
+            self.assertRaises(ValueError, reader.png, 'axial_slice_0012_+020')
+
+    def test_unfinished(self):
+        fname = container.container_name(self.tmp_dir, 'zip')
+        with zipfile.ZipFile(fname, 'w') as f:
+            f.writestr('axial_slice_0012_+020.png', encoder.png_bytes(self.slices[NAMES[0]]))
+
+        # Without an index the slices are found from their names
+        with container.SliceReader(fname) as reader:
+            self.assertEqual(reader.metadata, {})
+            np.testing.assert_array_equal(reader.get('axial', 12), self.slices[NAMES[0]])
+
+    def test_png_writer(self):
+        png_writer = PngWriter(2, container_format='zip')
+        for name in NAMES:
+            png_writer.write(os.path.join(self.tmp_dir, name), self.slices[name])
+        png_writer.close()
+
+        with container.SliceReader(container.container_name(self.tmp_dir, 'zip')) as reader:
+            for name in NAMES:
+                np.testing.assert_array_equal(reader.read(name[:-4]), self.slices[name])
+
+if __name__ == '__main__':
+    unittest.main()
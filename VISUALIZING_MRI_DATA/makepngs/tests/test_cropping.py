@@ -0,0 +1,119 @@
+'''
+makepngs.cropping gives the same slices as the old crop_data, which
+copied and padded the whole volume
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import unittest
+import numpy as np
+
+from makepngs import cropping
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def old_crop_data(bg, stats):
+    '''
+    crop_data as it was in MakePngs_StatsBg_StandardSpace.py
+    '''
+    slices_list_x = list(np.argwhere(np.sum(bg, (1,2)) != 0)[:,0])
+    slices_list_y = list(np.argwhere(np.sum(bg, (0,2)) != 0)[:,0])
+    slices_list_z = list(np.argwhere(np.sum(bg, (0,1)) != 0)[:,0])
+
+    slices_list = [slices_list_x, slices_list_y, slices_list_z]
+
+    bg_cropped = bg[ slices_list_x, :, : ][ :, slices_list_y, : ][ :, :, slices_list_z ]
+    stats_cropped = stats[ slices_list_x, :, : ][ :, slices_list_y, : ][ :, :, slices_list_z ]
+
+    bg_cropped = np.pad(bg_cropped, 5, mode='constant')
+    stats_cropped = np.pad(stats_cropped, 5, mode='constant')
+
+    for i, sl in enumerate(slices_list):
+        sl = sl + [ n - 5 for n in sl ]
+        sl = sl + [ n + 5 for n in sl ]
+        slices_list[i] = sorted(list(set(sl)))
+
+    return bg_cropped, stats_cropped, slices_list
+
+def make_volumes(seed=1):
+    '''
+    A background that is non-zero in a box in the middle of the volume
+    and stats data everywhere
+    '''
+    random = np.random.RandomState(seed)
+
+    bg = np.zeros((20, 22, 24))
+    bg[3:12, 5:15, 6:18] = random.random_sample((9, 10, 12)) + 0.1
+    stats = random.random_sample(bg.shape)
+
+    return bg, stats
+
+#==============================================================================
+class TestCropping(unittest.TestCase):
+
+    def test_crop_data(self):
+        bg, stats = make_volumes()
+
+        old_bg, old_stats, old_slices_list = old_crop_data(bg, stats)
+        bg_cropped, stats_cropped, slices_list = cropping.crop_data(bg, stats, pad=5)
+
+        self.assertEqual(slices_list, old_slices_list)
+
+        # The same padded slices, without copying the volume
+        self.assertTrue(np.may_share_memory(bg_cropped, bg))
+        for slice_id in range(old_bg.shape[2]):
+            np.testing.assert_array_equal(cropping.padded_slice(bg_cropped, slice_id, 5),
+                                            old_bg[:, :, slice_id])
+            np.testing.assert_array_equal(cropping.padded_slice(stats_cropped, slice_id, 5),
+                                            old_stats[:, :, slice_id])
+
+    def test_crop_box(self):
+        bg, stats = make_volumes()
+
+        box, slices_list = cropping.crop_box(bg, pad=5)
+
+        self.assertEqual(box, (slice(3, 12), slice(5, 15), slice(6, 18)))
+        self.assertEqual(slices_list, [ list(range(-2, 17)), list(range(0, 20)), list(range(1, 23)) ])
+
+    def test_empty(self):
+        # There's nothing to crop to, so the whole volume is kept
+        box, slices_list = cropping.crop_box(np.zeros((4, 5, 6)), pad=1)
+
+        self.assertEqual(box, (slice(0, 4), slice(0, 5), slice(0, 6)))
+        self.assertEqual(slices_list[0], list(range(-1, 5)))
+        self.assertIsNone(cropping.bounding_box(np.zeros((4, 5, 6))))
+
+    def test_occupancy(self):
+        mask = np.random.RandomState(2).random_sample((8, 9, 10)) > 0.97
+
+        for axis, occupied in enumerate(cropping.occupancy(mask)):
+            others = tuple( i for i in range(3) if i != axis )
+            np.testing.assert_array_equal(occupied, mask.any(axis=others))
+
+    def test_crop_stack(self):
+        bg, stats = make_volumes()
+        overlay_a = np.zeros_like(bg)
+        overlay_a[4:6, 7:8, 9:10] = 1
+        overlay_b = np.zeros_like(bg)
+        overlay_b[10:11, 12:14, 15:16] = 1
+
+        volumes, slices_list = cropping.crop_stack([ bg, overlay_a, overlay_b ],
+                                                    [ overlay_a, overlay_b ], pad=2)
+
+        # The box covers both overlays
+        for data in volumes:
+            self.assertEqual(data.shape, (7, 7, 7))
+        np.testing.assert_array_equal(volumes[0], bg[4:11, 7:14, 9:16])
+        self.assertEqual(slices_list[0], list(range(2, 13)))
+
+    def test_padded_slice(self):
+        data = np.arange(24.).reshape(2, 3, 4)
+
+        np.testing.assert_array_equal(cropping.padded_slice(data, 1), data[:, :, 1])
+        np.testing.assert_array_equal(cropping.padded_slice(data, 3, 2),
+                                        np.pad(data[:, :, 1], 2, mode='constant'))
+        self.assertEqual(cropping.padded_slice(data, 0, 2).shape, (6, 7))
+        self.assertFalse(np.any(cropping.padded_slice(data, 7, 2)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+'''
+The pngs written by makepngs.encoder decode back to the same pixels
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import numpy as np
+
+from makepngs import cli
+from makepngs import encoder
+from makepngs.tests import random_rgba, read_png
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def chunk_types(data):
+    '''
+    The type of every chunk in the bytes of a png file, in order
+    '''
+    types = []
+    position = 8
+    while position < len(data):
+        length, = struct.unpack('>I', data[position : position + 4])
+        types.append(data[position + 4 : position + 8])
+        position += 12 + length
+
+    return types
+
+#==============================================================================
+class TestPngBytes(unittest.TestCase):
+
+    def test_rgba_round_trip(self):
+        rgba = random_rgba()
+        for compress_level in (0, 6, 9):
+            data = encoder.png_bytes(rgba, compress_level=compress_level)
+            np.testing.assert_array_equal(read_png(data), rgba)
+
+    def test_palette_keeps_few_colors_exactly(self):
+        rgba = random_rgba(n_colors=200)
+        palette = encoder.palette_from_luts('gray', 'autumn')
+
+        data = encoder.png_bytes(rgba, palette=palette)
+
+        self.assertEqual(chunk_types(data)[:3], [ b'IHDR', b'PLTE', b'tRNS' ])
+        np.testing.assert_array_equal(read_png(data), rgba)
+
+    def test_palette_matches_many_colors(self):
+        rgba = random_rgba(shape=(40, 50))
+        rgba[:5, :, 3] = 0
+        palette = encoder.palette_from_luts('gray', 'autumn')
+
+        indices, colors = encoder.quantise(rgba, palette)
+        decoded = read_png(encoder.png_bytes(rgba, palette=palette))
+
+        # Every pixel is its palette color, transparent ones stay transparent
+        np.testing.assert_array_equal(decoded, colors[indices])
+        self.assertTrue(np.all(decoded[:5, :, 3] == 0))
+
+    def test_quantise_needs_palette(self):
+        self.assertIsNone(encoder.quantise(random_rgba(shape=(40, 50))))
+
+    def test_lookup_matches_quantise(self):
+        rgba = random_rgba(shape=(40, 50))
+        rgba[..., 3] = 255
+        palette = encoder.palette_from_luts('gray', 'autumn')
+
+        # The table is the nearest color to the middle of each 6 bit level
+        rgba[..., :3] = (rgba[..., :3] >> 2 << 2) + 2
+        table = encoder.color_table(palette)
+        indices = encoder.lookup(rgba, table, palette)
+        nearest = encoder.quantise(rgba, palette)[0]
+
+        distance = lambda i: ((palette[i, :3].astype(int) - rgba[..., :3]) ** 2).sum(axis=-1)
+        np.testing.assert_array_equal(distance(indices), distance(nearest))
+
+class TestMatplotlibPngs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmp_dir, 'figure.png')
+
+        plt = cli.pyplot()
+        fig = plt.figure(figsize=(1, 1))
+        plt.imshow(np.arange(100).reshape(10, 10), cmap='autumn', interpolation='nearest')
+        plt.axis('off')
+        fig.savefig(self.fname, transparent=True)
+        plt.close(fig)
+
+        with open(self.fname, 'rb') as f:
+            self.original = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_strip_metadata(self):
+        encoder.strip_metadata(self.fname)
+
+        with open(self.fname, 'rb') as f:
+            stripped = f.read()
+
+        self.assertTrue(len(stripped) < len(self.original))
+        self.assertTrue(set(chunk_types(stripped)) <= set(encoder._CRITICAL_CHUNKS))
+        np.testing.assert_array_equal(read_png(stripped), read_png(self.original))
+
+    def test_reencode(self):
+        encoder.reencode(self.fname, compress_level=9)
+
+        with open(self.fname, 'rb') as f:
+            np.testing.assert_array_equal(read_png(f.read()), read_png(self.original))
+
+if __name__ == '__main__':
+    unittest.main()
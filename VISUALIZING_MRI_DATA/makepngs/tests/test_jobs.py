@@ -0,0 +1,155 @@
+'''
+Making the pngs with a pool of processes (--jobs) gives exactly the
+same files as making them one at a time
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import argparse
+import filecmp
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+from makepngs import cropping
+from makepngs import loading
+from makepngs import orientation
+from makepngs import statsbg
+from makepngs.tests import read_png
+
+#==============================================================================
+# The directory with the MakePngs_* scripts
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def same_files(dir_a, dir_b):
+    '''
+    True if both directories have the same files with the same bytes
+    '''
+    names = sorted(os.listdir(dir_a))
+    if names != sorted(os.listdir(dir_b)) or not names:
+        return False
+
+    match, mismatch, errors = filecmp.cmpfiles(dir_a, dir_b, names, shallow=False)
+
+    return not mismatch and not errors
+
+def fresh_module(module):
+    '''
+    A new copy of a module, with none of the globals that have been
+    set in it since it was imported (like a process that was started
+    with the spawn method instead of being forked)
+    '''
+    import types
+
+    fname = module.__file__
+    if fname.endswith('.pyc'):
+        fname = fname[:-1]
+
+    fresh = types.ModuleType(module.__name__)
+    fresh.__file__ = fname
+    with open(fname) as f:
+        exec(compile(f.read(), fname, 'exec'), fresh.__dict__)
+
+    return fresh
+
+#==============================================================================
+class TestJobs(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import nibabel as nib
+
+        cls.tmp_dir = tempfile.mkdtemp()
+
+        np.random.seed(0)
+        bg, stats = statsbg.create_test_data()
+
+        affine = np.diag([-2., 2., 2., 1.])
+        cls.bg_file = os.path.join(cls.tmp_dir, 'bg.nii.gz')
+        cls.stats_file = os.path.join(cls.tmp_dir, 'stats.nii.gz')
+        nib.save(nib.Nifti1Image(bg.astype(np.float32), affine), cls.bg_file)
+        nib.save(nib.Nifti1Image(stats.astype(np.float32), affine), cls.stats_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def run_script(self, script, options, jobs):
+        '''
+        Run one of the MakePngs_* scripts and return its output directory
+        '''
+        output_dir = os.path.join(self.tmp_dir, '{}_{}_j{}'.format(script, '_'.join(options), jobs))
+
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([ sys.executable, script ]
+                                    + options + [ '-j', str(jobs),
+                                                    self.bg_file, self.stats_file, output_dir ],
+                                    cwd=SCRIPTS_DIR, stdout=devnull)
+
+        return output_dir
+
+    def check_jobs(self, script, options):
+        serial = self.run_script(script, options, 1)
+        parallel = self.run_script(script, options, 2)
+
+        self.assertTrue(same_files(serial, parallel),
+                            '{} {} gives different pngs with --jobs 2'.format(script, ' '.join(options)))
+
+    def test_statsbg(self):
+        self.check_jobs('MakePngs_StatsBg_StandardSpace.py', [ '-re', 'numpy' ])
+
+    def test_statsbg_encoder_options(self):
+        for renderer in ('numpy', 'persistent', 'matplotlib'):
+            self.check_jobs('MakePngs_StatsBg_StandardSpace.py',
+                                [ '-re', renderer, '-cr', 'stats', '-pl', '-zl', '9' ])
+
+    def test_dti(self):
+        for renderer in ('numpy', 'persistent'):
+            self.check_jobs('MakePngs_DTI.py',
+                                [ '-re', renderer, '-cr', 'overlay', '-pl', '-zl', '9' ])
+
+    def test_fresh_worker(self):
+        # Everything the worker needs comes through the pool's initargs,
+        # which are pickled when the workers aren't forked
+        bg, stats = statsbg.create_test_data()
+        box, slices_list = cropping.crop_box(bg, pad=5)
+        bg_cropped, stats_cropped = bg[box], stats[box]
+
+        xyz_dict = statsbg.hardcoded_variables()[0]
+        xyz_dict['orientation'] = orientation.standard_orientations()
+        outlines = statsbg.make_outlines(bg_cropped, xyz_dict)
+
+        output_dir = os.path.join(self.tmp_dir, 'fresh_worker')
+        os.makedirs(output_dir)
+        arguments = argparse.Namespace(output_dir=output_dir, renderer='numpy', colormap='autumn',
+                                        transparency=False, textcolor_mni='k', textcolor_R='k',
+                                        profile=True, profile_stats=None)
+
+        worker = fresh_module(statsbg)
+        initargs = pickle.loads(pickle.dumps((5, arguments, xyz_dict, outlines, 6, None)))
+        worker.init_worker(loading.share_array(bg_cropped), loading.share_array(stats_cropped),
+                            bg_cropped.shape, bg_cropped.dtype, *initargs)
+
+        for axis_name in xyz_dict['name']:
+            png_name = '{}_slice.png'.format(axis_name)
+            png_name, records = worker.render_unit_records((output_dir, axis_name, 12, 'X = 1', png_name))
+            self.assertEqual([ record['stage'] for record in records ][-2:], [ 'savefig', 'make_png' ])
+
+            # The same picture as drawing the slice in the main process
+            axis_orientation = xyz_dict['orientation'][axis_name]
+            rgba = statsbg.composite_png(axis_orientation.cut(bg_cropped, 12, 5),
+                                            axis_orientation.cut(stats_cropped, 12, 5),
+                                            axis_name, 'X = 1', arguments,
+                                            outline_slice=cropping.padded_slice(outlines[axis_name], 12, 5))
+            with open(os.path.join(output_dir, png_name), 'rb') as f:
+                np.testing.assert_array_equal(read_png(f.read()), rgba)
+
+if __name__ == '__main__':
+    unittest.main()
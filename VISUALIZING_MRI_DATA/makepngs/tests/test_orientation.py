@@ -0,0 +1,184 @@
+'''
+The slices cut by makepngs.orientation are the same as the ones the
+old rotate_data made by rotating the whole volume
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import unittest
+import numpy as np
+
+from makepngs import cropping
+from makepngs import orientation
+from makepngs import statsbg
+from makepngs.tests.test_cropping import make_volumes, old_crop_data
+
+#==============================================================================
+# The axis names and the (x, y, z) directions of a volume stored like
+# the standard space templates
+AXIS_NAMES = ('sagittal', 'coronal', 'axial')
+LAS = (-1, 1, 1)
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def old_rotate_data(data, axis_name):
+    '''
+    The volume rotated the way the MakePngs_* scripts' rotate_data did
+    it before makepngs.orientation
+    '''
+    if axis_name == 'axial':
+        return np.fliplr(np.rot90(data))
+
+    if axis_name == 'coronal':
+        return np.flipud(np.swapaxes(np.rot90(data), 0, 2))
+
+    return np.flipud(np.swapaxes(data, 0, 2))
+
+def affine(directions):
+    '''
+    A 2mm affine with the axes stored in x, y, z order, running in
+    these directions (+1 towards right, anterior and superior)
+    '''
+    return np.diag([ 2. * d for d in directions ] + [ 1. ])
+
+#==============================================================================
+class TestOrientation(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.RandomState(0).random_sample((7, 9, 11))
+
+    def check_slices(self, orientations, data, rotated, reverse=False):
+        '''
+        Every slice (with and without padding) cut from data is the
+        same as the slice of the rotated volume, counted backwards if
+        reverse
+        '''
+        n_slices = rotated.shape[2]
+        for slice_id in range(n_slices):
+            old_slice = rotated[:, :, n_slices - 1 - slice_id if reverse else slice_id]
+
+            np.testing.assert_array_equal(orientations.cut(data, slice_id), old_slice)
+            np.testing.assert_array_equal(orientations.cut(data, slice_id + 2, pad=2),
+                                            np.pad(old_slice, 2, mode='constant'))
+
+        # The pad slices are empty
+        self.assertFalse(np.any(orientations.cut(data, 0, pad=2)))
+        self.assertFalse(np.any(orientations.cut(data, n_slices + 2, pad=2)))
+
+    def test_standard(self):
+        orientations = orientation.standard_orientations()
+
+        for axis_name in AXIS_NAMES:
+            rotated = old_rotate_data(self.data, axis_name)
+            axis_orientation = orientations[axis_name]
+
+            self.assertEqual(axis_orientation.shape(self.data.shape), rotated.shape)
+            np.testing.assert_array_equal(axis_orientation.view(self.data), rotated)
+            self.check_slices(axis_orientation, self.data, rotated)
+
+    def test_las_affine(self):
+        orientations = orientation.from_affine(affine(LAS))
+        standard = orientation.standard_orientations()
+
+        for axis_name in AXIS_NAMES:
+            self.assertEqual(orientations[axis_name].permutation, standard[axis_name].permutation)
+            self.assertEqual(orientations[axis_name].flips, standard[axis_name].flips)
+
+    def test_other_affines(self):
+        # A volume that runs the other way along some axes looks the
+        # same as the standard space one once it's turned, but its
+        # slices are still in the order they're stored
+        for flipped in [ (0,), (1,), (2,), (0, 1, 2) ]:
+            directions = [ -d if i in flipped else d for i, d in enumerate(LAS) ]
+            data = self.data[ tuple( slice(None, None, -1) if i in flipped else slice(None)
+                                        for i in range(3) ) ]
+
+            orientations = orientation.from_affine(affine(directions))
+
+            for axis_name in AXIS_NAMES:
+                axis_orientation = orientations[axis_name]
+                self.check_slices(axis_orientation, data,
+                                    old_rotate_data(self.data, axis_name),
+                                    reverse=axis_orientation.permutation[2] in flipped)
+
+    def test_permuted_affine(self):
+        # Volumes that aren't stored in x, y, z order get the standard
+        # orientations
+        permuted = affine(LAS)[:, [ 1, 0, 2, 3 ]]
+        orientations = orientation.from_affine(permuted)
+        standard = orientation.standard_orientations()
+
+        for axis_name in AXIS_NAMES:
+            self.assertEqual(orientations[axis_name].flips, standard[axis_name].flips)
+
+    def test_slice_id(self):
+        for axis_orientation in orientation.standard_orientations().values():
+            n_slices = axis_orientation.shape(self.data.shape)[2]
+            for index in range(n_slices):
+                slice_id = axis_orientation.slice_id(index, n_slices, pad=5)
+                self.assertEqual(axis_orientation.source_index(slice_id, n_slices, pad=5), index)
+
+    def test_oriented_volume(self):
+        orientations = orientation.standard_orientations()
+
+        for axis_name in AXIS_NAMES:
+            volume = orientation.OrientedVolume(self.data, orientations[axis_name])
+            rotated = old_rotate_data(self.data, axis_name)
+
+            self.assertEqual(volume.shape, rotated.shape)
+            for slice_id in range(rotated.shape[2] + 10):
+                np.testing.assert_array_equal(cropping.padded_slice(volume, slice_id, 5),
+                                                cropping.padded_slice(rotated, slice_id, 5))
+
+    def test_statsbg_slices(self):
+        # The whole way from the volume to the slices that are drawn
+        bg, stats = make_volumes()
+
+        old_bg, old_stats, old_slices_list = old_crop_data(bg, stats)
+
+        box, slices_list = cropping.crop_box(bg, pad=5)
+        self.assertEqual(slices_list, old_slices_list)
+
+        for axis_id, axis_name in enumerate(AXIS_NAMES):
+            shape = bg.shape[axis_id]
+            bg_rot, stats_rot, rot_slices_list = statsbg.rotate_data(bg[box], stats[box],
+                                                                        list(slices_list),
+                                                                        axis_name, shape)
+            old_bg_rot = old_rotate_data(old_bg, axis_name)
+            old_stats_rot = old_rotate_data(old_stats, axis_name)
+
+            self.assertEqual(len(rot_slices_list[axis_id]), old_bg_rot.shape[2])
+
+            # Each slice is labelled with the voxel it is cut from
+            axis_orientation = orientation.standard_orientations()[axis_name]
+            n_slices = len(rot_slices_list[axis_id]) - 10
+            for slice_id in range(5, n_slices + 5):
+                self.assertEqual(rot_slices_list[axis_id][slice_id],
+                                    box[axis_id].start + axis_orientation.source_index(slice_id, n_slices, 5))
+            for slice_id in range(old_bg_rot.shape[2]):
+                np.testing.assert_array_equal(cropping.padded_slice(bg_rot, slice_id, 5),
+                                                old_bg_rot[:, :, slice_id])
+                np.testing.assert_array_equal(cropping.padded_slice(stats_rot, slice_id, 5),
+                                                old_stats_rot[:, :, slice_id])
+
+    def test_occupied_slice_ids(self):
+        # The slices that are drawn with --crop_option stats are the
+        # ones that have stats data, whichever way the volume is stored
+        stats = np.zeros_like(self.data)
+        stats[1, 2:4, 8] = 1
+        stats[5, 7, 3] = 1
+
+        for directions in [ LAS, (1, -1, -1) ]:
+            xyz_dict = { 'orientation': orientation.from_affine(affine(directions)) }
+            occupied = statsbg.stats_only(stats)
+
+            for axis_name in AXIS_NAMES:
+                axis_orientation = xyz_dict['orientation'][axis_name]
+                n_slices = axis_orientation.shape(stats.shape)[2]
+
+                self.assertEqual(statsbg.occupied_slice_ids(occupied, axis_name, xyz_dict),
+                                    [ slice_id for slice_id in range(n_slices + 10)
+                                        if np.any(axis_orientation.cut(stats, slice_id, pad=5)) ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+'''
+Deep zoom tile pyramids for large slices
+
+A web viewer only has to download the tiles it is showing, at the
+zoom level it is showing them, rather than the whole png. The layout
+is the same as a Deep Zoom Image (DZI):
+
+    <name>.dzi                      xml description of the image
+    <name>_files/<level>/<column>_<row>.png
+
+Level 0 is the image shrunk to a single pixel and every level is twice
+the size of the one before, up to the full size image at the last
+level. Each level is made by averaging 2 x 2 blocks of the level above
+it so every tile is only encoded once. Tiles that are entirely
+background are not written (viewers show nothing where a tile is
+missing) and the tiles that were written are listed in an index.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import json
+import os
+import numpy as np
+
+from makepngs import compositor
+
+#==============================================================================
+# DEFINE THE FUNCTIONS YOU NEED
+def n_levels(width, height):
+    '''
+    The number of levels in the pyramid of an image
+    '''
+    return int(np.ceil(np.log2(max(width, height, 1)))) + 1
+
+def shrink(rgba):
+    '''
+    Halve the size of an (h, w, 4) uint8 image by averaging each 2 x 2
+    block of pixels. Odd sizes are rounded up by repeating the last
+    row or column.
+    '''
+    h, w = rgba.shape[:2]
+    if h % 2 or w % 2:
+        rgba = np.pad(rgba, ((0, h % 2), (0, w % 2), (0, 0)), mode='edge')
+
+    h, w = rgba.shape[:2]
+    blocks = rgba.reshape(h // 2, 2, w // 2, 2, 4).astype(np.uint16)
+
+    return ((blocks.sum(axis=(1, 3)) + 2) // 4).astype(np.uint8)
+
+def is_background(tile, background):
+    '''
+    True if every pixel in the tile is the background color (or is
+    completely transparent if the background is transparent)
+    '''
+    if background[3] == 0:
+        return not np.any(tile[..., 3])
+
+    return not np.any(tile != np.array(background, dtype=np.uint8))
+
+def dzi_xml(width, height, tile_size, overlap=0, fmt='png'):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            + '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008"\n'
+            + '       Format="{}" Overlap="{}" TileSize="{}">\n'.format(fmt, overlap, tile_size)
+            + '  <Size Width="{}" Height="{}"/>\n'.format(width, height)
+            + '</Image>\n')
+
+def write_pyramid(rgba, output_dir, name, tile_size=256,
+                        background=(0, 0, 0, 255)):
+    '''
+    Write an (h, w, 4) uint8 RGBA image as a deep zoom pyramid of
+    tile_size x tile_size png tiles called <name>_files/... plus
+    <name>.dzi in output_dir. Tiles that only contain the background
+    color are skipped.
+    Returns a dictionary that describes the levels and the tiles that
+    were written (see write_index).
+    '''
+    h, w = rgba.shape[:2]
+    levels = n_levels(w, h)
+
+    files_dir = os.path.join(output_dir, name + '_files')
+
+    description = { 'dzi': name + '.dzi',
+                    'width': w,
+                    'height': h,
+                    'tile_size': tile_size,
+                    'levels': [] }
+
+    # Start with the full size image and work down
+    image = rgba
+    for level in reversed(range(levels)):
+
+        if level < levels - 1:
+            image = shrink(image)
+
+        level_h, level_w = image.shape[:2]
+        level_dir = os.path.join(files_dir, str(level))
+
+        written = []
+        for row in range(0, -(-level_h // tile_size)):
+            for column in range(0, -(-level_w // tile_size)):
+
+                tile = image[ row * tile_size : (row + 1) * tile_size,
+                              column * tile_size : (column + 1) * tile_size ]
+
+                if is_background(tile, background):
+                    continue
+
+                if not os.path.isdir(level_dir):
+                    os.makedirs(level_dir)
+
+                compositor.write_png(os.path.join(level_dir,
+                                                    '{}_{}.png'.format(column, row)),
+                                        tile)
+                written.append('{}_{}'.format(column, row))
+
+        description['levels'].append({ 'level': level,
+                                        'width': level_w,
+                                        'height': level_h,
+                                        'columns': -(-level_w // tile_size),
+                                        'rows': -(-level_h // tile_size),
+                                        'tiles': written })
+
+    description['levels'].reverse()
+
+    with open(os.path.join(output_dir, name + '.dzi'), 'w') as f:
+        f.write(dzi_xml(w, h, tile_size))
+
+    return description
+
+def write_index(output_dir, descriptions, index_name='tiles_index.json'):
+    '''
+    Write one json file that lists every pyramid in output_dir with
+    its levels and the tiles that exist at each level
+    '''
+    with open(os.path.join(output_dir, index_name), 'w') as f:
+        json.dump({ 'format': 'png',
+                    'overlap': 0,
+                    'images': descriptions },
+                    f, indent=1, sort_keys=True)
@@ -0,0 +1,167 @@
+'''
+Write png files in the background while the next slices are drawn
+
+Compressing a png (zlib) and writing it to disk (which can be slow on
+network storage) don't need the python interpreter for most of their
+time, so they can run in threads while the main loop composites the
+next slice. Finished RGBA arrays are put on a bounded queue: if the
+writer threads fall behind, write() waits for a space on the queue so
+no more than queue_size images are ever waiting in memory.
+
+With n_threads = 0 every png is written straight away, in the same
+thread, exactly as encoder.write_png would.
+
+With a container_format every png is added to one container file in
+its output directory instead (see makepngs.container).
+
+Each slice can also be added to an animated sweep through its axis
+(see makepngs.animation). This is done in the calling thread, before
+the png is queued, so the frames are always in the order they were
+drawn.
+'''
+
+#==============================================================================
+# IMPORT WHAT YOU NEED
+import os
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from makepngs import container
+from makepngs import encoder
+
+#==============================================================================
+class PngWriter(object):
+    '''
+    A pool of threads that encode and save RGBA arrays as png files
+
+    n_threads       number of writer threads (0 to write in the calling
+                    thread)
+    queue_size      maximum number of images waiting to be written
+                    (default is 2 for each thread)
+    compress_level  zlib compression level for the png files
+    palette         save 8 bit palette pngs with this palette (see
+                    encoder.palette_from_luts), None for RGBA pngs
+    container_format
+                    'zip' or 'npz' to save the pngs in a container file
+                    in each output directory, None for png files
+    animations      a makepngs.animation.SweepSet that every slice is
+                    added to as well (None for no animations)
+    '''
+    def __init__(self, n_threads=1, queue_size=None, compress_level=6, palette=None,
+                    container_format=None, animations=None):
+        self.n_threads = n_threads
+        self.queue_size = queue_size or 2 * max(n_threads, 1)
+        self.compress_level = compress_level
+        self.palette = palette
+        self.container_format = container_format
+        self.animations = animations
+
+        self.archives = {}
+        self._archives_lock = threading.Lock()
+
+        self.errors = []
+        self._queue = None
+        self._threads = []
+        self._pid = None
+
+    def _start(self):
+        '''
+        Start the threads. This is done when the first png is written
+        (and again in a forked process, which doesn't get the threads)
+        '''
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._threads = []
+        self._pid = os.getpid()
+
+        for i in range(self.n_threads):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._save(*item)
+            except Exception as err:
+                self.errors.append((item[0], err))
+            finally:
+                self._queue.task_done()
+
+    def _save(self, fname, rgba):
+        if self.container_format is None:
+            encoder.write_png(fname, rgba,
+                                compress_level=self.compress_level,
+                                palette=self.palette)
+            return
+
+        self.archive(os.path.dirname(fname)).add(os.path.basename(fname), rgba,
+                                                    compress_level=self.compress_level,
+                                                    palette=self.palette)
+
+    def archive(self, output_dir):
+        '''
+        The container for the pngs in output_dir (it is created the
+        first time it's needed)
+        '''
+        with self._archives_lock:
+            if not output_dir in self.archives:
+                fname = container.container_name(output_dir, self.container_format)
+                self.archives[output_dir] = container.SliceArchive(fname, self.container_format)
+            return self.archives[output_dir]
+
+    def _raise_errors(self):
+        if self.errors:
+            fname, err = self.errors[0]
+            raise IOError('png file {} could not be written: {}'.format(fname, err))
+
+    def write(self, fname, rgba):
+        '''
+        Save an (h, w, 4) uint8 RGBA array as a png file. The array
+        must not be changed afterwards (it might not be written yet).
+        Waits if there are already queue_size images to write.
+        '''
+        if self.animations is not None:
+            self.animations.add(fname, rgba)
+
+        if self.n_threads < 1:
+            self._save(fname, rgba)
+            return
+
+        self._raise_errors()
+
+        if self._pid != os.getpid():
+            self._start()
+
+        self._queue.put((fname, rgba))
+
+    def close(self):
+        '''
+        Wait for all the pngs to be written, stop the threads and
+        close the containers and animations. Raises an IOError if any of the pngs
+        couldn't be written.
+        '''
+        if self._threads and self._pid == os.getpid():
+            for thread in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+
+        self._threads = []
+        self._pid = None
+
+        for archive in self.archives.values():
+            archive.close()
+        self.archives = {}
+
+        if self.animations is not None:
+            self.animations.close()
+
+        self._raise_errors()